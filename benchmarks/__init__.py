@@ -0,0 +1,12 @@
+"""
+Замеры производительности репозиториев и операций презентера.
+
+Набор запускается как отдельная программа и не требует сторонних пакетов:
+
+    python -m benchmarks --sizes 10000 100000 --output results.json
+
+Для каждого размера базы (числа расходов) и каждого вида репозитория
+(sqlite, memory, cached) строится стенд с синтетическим деревом категорий,
+расходами и бюджетами, после чего каждый замер выполняется несколько раз.
+Результаты выводятся в формате JSON для сравнения между версиями.
+"""
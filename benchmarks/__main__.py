@@ -0,0 +1,166 @@
+"""
+Запуск замеров производительности:
+
+    python -m benchmarks [--sizes N ...] [--backends B ...] [--cases NAME ...]
+                         [--repeat R] [--seed S] [--profile] [--output FILE]
+
+Результаты выводятся в формате JSON (в файл FILE или на стандартный
+вывод), ход замеров - на стандартный вывод ошибок. С --profile работа
+репозиториев измеряется, и в записи результатов добавляется число вызовов
+методов репозиториев и SQL-запросов на одно действие; время замеров
+при этом включает накладные расходы измерения.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+
+from datetime import datetime
+from time     import perf_counter
+from typing   import Any, Sequence
+
+from bookkeeper.repository.instrumentation import RepositoryStats
+
+from benchmarks.cases import CASES, Case, Operation
+from benchmarks.stand import BACKENDS, Stand
+
+
+def measure(case: Case, stand: Stand, repeat: int) -> dict[str, Any]:
+    """
+    Выполнить замер case на стенде repeat раз.
+
+    Returns
+    -------
+    Запись результата: время одного действия (минимальное, медианное
+    и среднее по прогонам) в секундах, а если стенд измеряется - число
+    вызовов методов репозиториев и SQL-запросов на одно действие
+    """
+    times = []
+    for _ in range(repeat):
+        operation = case.prepare(stand)
+        if stand.stats is not None:
+            operation = profiled(operation, stand.stats, case.name)
+
+        # As in timeit, the garbage collector does not interfere with timing:
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            operation()
+            times.append((perf_counter() - start) / case.number)
+        finally:
+            gc.enable()
+
+    result = {"case":    case.name,
+              "backend": stand.backend,
+              "size":    stand.size,
+              "number":  case.number,
+              "repeat":  repeat,
+              "min":     min(times),
+              "median":  statistics.median(times),
+              "mean":    statistics.fmean(times)}
+
+    if stand.stats is not None:
+        flow = stand.stats.flows[case.name]
+        result["calls"]   = flow.methods / (repeat * case.number)
+        result["queries"] = flow.queries / (repeat * case.number)
+    return result
+
+
+def profiled(operation: Operation, stats: RepositoryStats, name: str) -> Operation:
+    """ Операция, работа репозиториев которой относится к потоку name """
+    def run_flow() -> Any:
+        with stats.flow(name):
+            return operation()
+    return run_flow
+
+
+def run(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    sizes    : Sequence[int],
+    backends : Sequence[str],
+    cases    : Sequence[Case],
+    repeat   : int,
+    seed     : int = 0,
+    profile  : bool = False
+) -> dict[str, Any]:
+    """
+    Выполнить замеры cases для всех размеров и видов репозиториев,
+    с profile - измеряя работу репозиториев.
+
+    Returns
+    -------
+    Результаты: описание окружения (meta) и записи замеров (results)
+    """
+    results = []
+    for size in sizes:
+        for backend in backends:
+            print(f"{backend}, {size} expenses:", file=sys.stderr)
+            stats = RepositoryStats() if profile else None
+            with Stand(backend, size, seed, stats) as stand:
+                # Filling is measured once, per expense:
+                results.append({"case": "fill", "backend": backend, "size": size,
+                                "number": size, "repeat": 1,
+                                "min":    stand.fill_time / size,
+                                "median": stand.fill_time / size,
+                                "mean":   stand.fill_time / size})
+
+                for case in cases:
+                    if not case.applies_to(stand):
+                        continue
+                    result = measure(case, stand, repeat)
+                    results.append(result)
+                    line = f"    {case.name:<30} {result['median'] * 1e6:12.1f} us"
+                    if profile:
+                        line += (f" {result['calls']:10.1f} calls"
+                                 f" {result['queries']:10.1f} queries")
+                    print(line, file=sys.stderr)
+
+    return {"meta":    {"python":    platform.python_version(),
+                        "sqlite":    sqlite3.sqlite_version,
+                        "platform":  platform.platform(),
+                        "timestamp": datetime.now().isoformat(timespec='seconds'),
+                        "seed":      seed,
+                        "profile":   profile},
+            "results": results}
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """ Разобрать аргументы командной строки и выполнить замеры """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                        help="numbers of expenses (default: 10000 100000)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS,
+                        help="kinds of repositories (default: all)")
+    parser.add_argument("--cases", nargs="+", metavar="NAME",
+                        help="run only the cases with names starting with NAME")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of every case (default: 5)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the generated data (default: 0)")
+    parser.add_argument("--profile", action="store_true",
+                        help="count repository calls and SQL queries per action")
+    parser.add_argument("--output", default="-",
+                        help="JSON results file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CASES
+             if args.cases is None or case.name.startswith(tuple(args.cases))]
+    results = run(args.sizes, args.backends, cases, args.repeat, args.seed,
+                  args.profile)
+
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Замеры: операции репозиториев, моделей и презентера.
+
+Каждый замер задается функцией, которая готовит один прогон на стенде
+(вне замера времени) и возвращает саму замеряемую операцию. Операция
+выполняет number действий, время прогона делится на их число. Замеры,
+имеющие смысл только для некоторых видов репозиториев, перечисляют их
+в backends.
+"""
+
+import threading
+
+from dataclasses import dataclass
+from datetime    import datetime, timedelta
+from itertools   import count
+from typing      import Any, Callable
+
+from bookkeeper.models.budget    import Budget
+from bookkeeper.repository.query import between, gt
+
+from benchmarks.data  import make_expenses
+from benchmarks.stand import Stand
+
+# Operation being measured:
+Operation = Callable[[], Any]
+
+
+@dataclass(frozen=True)
+class Case:
+    """
+    Замер name: prepare готовит прогон на стенде и возвращает операцию,
+    выполняющую number действий. Замер выполняется на стендах с видами
+    репозиториев backends, None - на всех.
+    """
+    name     : str
+    prepare  : Callable[[Stand], Operation]
+    number   : int = 1
+    backends : tuple[str, ...] | None = None
+
+    def applies_to(self, stand: Stand) -> bool:
+        """ Выполняется ли замер на стенде stand """
+        return self.backends is None or stand.backend in self.backends
+
+
+# Unique names of the categories created by the measurements:
+_names = count(1)
+
+###########################
+## Repository operations ##
+###########################
+
+
+def repo_add(stand: Stand) -> Operation:
+    exps = make_expenses(100, [stand.categories[0].pk], stand.rnd)
+
+    def operation() -> None:
+        for exp in exps:
+            stand.expense_repo.add(exp)
+    return operation
+
+
+def repo_add_many(stand: Stand) -> Operation:
+    exps = make_expenses(1000, [stand.categories[0].pk], stand.rnd)
+    return lambda: stand.expense_repo.add_many(exps)
+
+
+def repo_update(stand: Stand) -> Operation:
+    exps = [exp for exp in (stand.expense_repo.get(pk)
+                            for pk in stand.rnd.choices(stand.expense_pks, k=100))
+            if exp is not None]
+
+    def operation() -> None:
+        for exp in exps:
+            exp.amount += 1
+            stand.expense_repo.update(exp)
+    return operation
+
+
+def repo_get(stand: Stand) -> Operation:
+    pks = stand.rnd.choices(stand.expense_pks, k=1000)
+
+    def operation() -> None:
+        for pk in pks:
+            stand.expense_repo.get(pk)
+    return operation
+
+
+def repo_get_writing(stand: Stand) -> Operation:
+    # Reads of the main thread while another thread adds expenses one by one:
+    pks  = stand.rnd.choices(stand.expense_pks, k=1000)
+    exps = make_expenses(10_000, [stand.categories[0].pk], stand.rnd)
+
+    def write(stop: threading.Event) -> None:
+        for exp in exps:
+            if stop.is_set():
+                break
+            stand.expense_repo.add(exp)
+
+    def operation() -> None:
+        stop   = threading.Event()
+        writer = threading.Thread(target=write, args=(stop,))
+        writer.start()
+        try:
+            for pk in pks:
+                stand.expense_repo.get(pk)
+        finally:
+            stop.set()
+            writer.join()
+    return operation
+
+
+def repo_get_all_category(stand: Stand) -> Operation:
+    where = {'category': stand.rnd.choice(stand.categories).pk}
+    return lambda: stand.expense_repo.get_all(where)
+
+
+def repo_get_all_week(stand: Stand) -> Operation:
+    start = datetime.now() - timedelta(days=stand.rnd.randrange(7, 365))
+    where = {'expense_date': between(start, start + timedelta(days=7))}
+    return lambda: stand.expense_repo.get_all(where)
+
+
+def repo_get_all_amount(stand: Stand) -> Operation:
+    # The amount is not indexed, so all the expenses are scanned:
+    return lambda: stand.expense_repo.get_all({'amount': gt(4990)})
+
+
+def repo_get_all_by_pattern(stand: Stand) -> Operation:
+    return lambda: stand.expense_repo.get_all_by_pattern({'comment': 'кофе'})
+
+
+def repo_get_page(stand: Stand) -> Operation:
+    return lambda: stand.expense_repo.get_page('expense_date', 100, descending=True)
+
+
+######################
+## Model operations ##
+######################
+
+
+def budget_update_spent(stand: Stand) -> Operation:
+    budget = Budget(0, "month")
+    return lambda: budget.update_spent(stand.expense_repo)
+
+
+def category_get_subcategories(stand: Stand) -> Operation:
+    root = stand.categories[0]
+    return lambda: list(root.get_subcategories(stand.category_repo))
+
+
+##########################
+## Presenter operations ##
+##########################
+
+
+def presenter_add_expense(stand: Stand) -> Operation:
+    names = [stand.rnd.choice(stand.categories).name for _ in range(20)]
+
+    def operation() -> None:
+        for name in names:
+            stand.bookkeeper.add_expense("100", name)
+    return operation
+
+
+def presenter_delete_category(stand: Stand) -> Operation:
+    # A new category gets as many expenses as an average generated one:
+    name = f"удаляемая категория {next(_names)}"
+    stand.bookkeeper.add_category(name)
+    cat = stand.bookkeeper.category_index.get(name)
+    assert cat is not None
+    stand.expense_repo.add_many(make_expenses(
+        max(1, stand.size // len(stand.categories)), [cat.pk], stand.rnd))
+
+    return lambda: stand.bookkeeper.delete_category(name)
+
+
+def presenter_spending_tree(stand: Stand) -> Operation:
+    return stand.bookkeeper.spending_tree
+
+
+def presenter_fetch_expenses(stand: Stand) -> Operation:
+    return lambda: stand.bookkeeper.fetch_expenses(None, 100)
+
+
+CASES = [
+    Case("repo.add",                      repo_add, 100),
+    Case("repo.add_many",                 repo_add_many, 1000),
+    Case("repo.update",                   repo_update, 100),
+    Case("repo.get",                      repo_get, 1000),
+    # Memory repositories are not meant for concurrent access:
+    Case("repo.get[writing]",             repo_get_writing, 1000,
+         ('sqlite', 'sqlite-tuned')),
+    Case("repo.get_all[category]",        repo_get_all_category),
+    Case("repo.get_all[week]",            repo_get_all_week),
+    Case("repo.get_all[amount]",          repo_get_all_amount),
+    Case("repo.get_all_by_pattern",       repo_get_all_by_pattern),
+    Case("repo.get_page",                 repo_get_page),
+    Case("budget.update_spent",           budget_update_spent),
+    Case("category.get_subcategories",    category_get_subcategories),
+    Case("bookkeeper.add_expense",        presenter_add_expense, 20),
+    Case("bookkeeper.delete_category",    presenter_delete_category),
+    Case("bookkeeper.spending_tree",      presenter_spending_tree),
+    Case("bookkeeper.fetch_expenses",     presenter_fetch_expenses),
+]
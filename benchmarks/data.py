@@ -0,0 +1,63 @@
+"""
+Генерация синтетических данных для замеров.
+"""
+
+from datetime import datetime, timedelta
+from random   import Random
+
+from bookkeeper.models.expense import Expense
+
+# Words the comments of the expenses are made of:
+COMMENT_WORDS = ("обед", "кофе", "такси", "подарок", "аптека", "рынок", "кино", "")
+
+
+def make_category_tree(
+    roots  : int,
+    fanout : int,
+    depth  : int
+) -> list[tuple[str, str | None]]:
+    """
+    Построить дерево категорий из roots корней, у каждой категории
+    которого до глубины depth (у корней - 0) по fanout подкатегорий.
+
+    Returns
+    -------
+    Список пар (название категории, название родителя или None),
+    в котором каждый родитель предшествует своим подкатегориям,
+    как для Category.create_from_tree
+    """
+    tree  : list[tuple[str, str | None]] = []
+    level : list[str | None]             = [None]
+    for level_depth in range(depth + 1):
+        width = roots if level_depth == 0 else fanout
+        names = []
+        for parent in level:
+            for _ in range(width):
+                name = f"категория {len(tree) + 1}"
+                tree.append((name, parent))
+                names.append(name)
+        level = list(names)
+    return tree
+
+
+def make_expenses(
+    count      : int,
+    categories : list[int],
+    rnd        : Random,
+    days       : int = 365,
+    now        : datetime | None = None
+) -> list[Expense]:
+    """
+    Сгенерировать count расходов по категориям с pk из categories
+    с датами, равномерно распределенными по последним days дням.
+    """
+    if now is None:
+        now = datetime.now()
+    start   = now - timedelta(days=days)
+    seconds = days * 24 * 60 * 60
+
+    return [Expense(amount=rnd.randint(1, 5000),
+                    category=rnd.choice(categories),
+                    expense_date=start + timedelta(seconds=rnd.randrange(seconds)),
+                    comment=rnd.choice(COMMENT_WORDS))
+            for _ in range(count)]
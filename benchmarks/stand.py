@@ -0,0 +1,236 @@
+"""
+Стенд для замеров: репозитории с синтетическими данными и презентер.
+"""
+
+import shutil
+import tempfile
+
+from datetime import datetime
+from random   import Random
+from time     import perf_counter
+from types    import TracebackType
+from typing   import Any, Callable
+
+from bookkeeper.bookkeeper import Bookkeeper
+
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.cached_repository   import CachedRepository
+from bookkeeper.repository.instrumentation     import RepositoryStats
+from bookkeeper.repository.instrumentation     import instrument_factory
+from bookkeeper.repository.memory_repository   import MemoryRepository
+from bookkeeper.repository.sqlite_connection   import PerformanceProfile
+from bookkeeper.repository.sqlite_repository   import SQLiteRepository
+
+from bookkeeper.models.category import Category, CategoryIndex
+from bookkeeper.models.expense  import Expense
+from bookkeeper.models.budget   import Budget
+
+from benchmarks.data import make_category_tree, make_expenses
+
+# Kinds of the repositories to be measured:
+BACKENDS = ('sqlite', 'sqlite-tuned', 'memory', 'cached')
+
+
+class NullView:  # pylint: disable=too-many-public-methods
+    """
+    Представление без интерфейса (реализует AbstractView): все уведомления
+    презентера игнорируются, так что замеряется только работа презентера
+    и репозиториев.
+    """
+    # pylint: disable=unused-argument
+
+    def show_main_window(self) -> None:
+        return None
+
+    # Background tasks are run right away:
+    def run_in_background(
+        self,
+        task     : Callable[[Callable[[int, int], None]], Any],
+        on_done  : Callable[[Any], None],
+        title    : str | None = None,
+        on_error : Callable[[Exception], None] | None = None
+    ) -> None:
+        on_done(task(lambda done, total: None))
+
+    def wait_background(self) -> None:
+        return None
+
+    def set_categories(
+        self,
+        cats  : list[Category],
+        index : CategoryIndex | None = None
+    ) -> None:
+        return None
+
+    def set_expenses(self, cats : list[Expense]) -> None:
+        return None
+
+    def set_expense_source(
+        self,
+        fetch: Callable[[Expense | None, int], list[Expense]]
+    ) -> None:
+        return None
+
+    def set_budgets(self, cats : list[Budget]) -> None:
+        return None
+
+    # Incremental updates of the shown expenses:
+    def expense_added(self, exp : Expense) -> None:
+        return None
+
+    def expense_updated(self, exp : Expense) -> None:
+        return None
+
+    def expenses_removed(self, pks : set[int]) -> None:
+        return None
+
+    def set_category_add_handler(
+        self,
+        cat_add_handler: Callable[[str, str | None], None]
+    ) -> None:
+        return None
+
+    def set_category_delete_handler(
+        self,
+        cat_delete_handler: Callable[[str], None]
+    ) -> None:
+        return None
+
+    def set_category_checker(
+        self,
+        cat_checker: Callable[[str], None]
+    ) -> None:
+        return None
+
+    def set_budget_modify_handler(
+        self,
+        handler: Callable[['int | None', str, str], None]
+    ) -> None:
+        return None
+
+    def set_expense_add_handler(
+        self,
+        exp_add_handler: Callable[[str, str, str], None]
+    ) -> None:
+        return None
+
+    def set_expense_delete_handler(
+        self,
+        exp_delete_handler: Callable[[set[int]], None]
+    ) -> None:
+        return None
+
+    def set_expense_modify_handler(
+        self,
+        exp_modify_handler: Callable[[int, str, str], None]
+    ) -> None:
+        return None
+
+    def not_on_budget_message(self) -> None:
+        return None
+
+
+class Stand:
+    """
+    Стенд: репозитории вида backend (sqlite-tuned - SQLite с профилем
+    производительности PerformanceProfile), заполненные деревом категорий,
+    size расходами и бюджетами на день, неделю и месяц, и работающий
+    с ними презентер Bookkeeper. Данные генерируются с зерном seed,
+    база данных SQLite создается во временном каталоге и удаляется
+    методом close() или при выходе из блока with.
+
+    Если передана статистика stats, работа репозиториев стенда измеряется
+    (см. bookkeeper.repository.instrumentation); заполнение стенда в нее
+    не попадает.
+    """
+
+    # Shape of the category tree: roots, subcategories of a category, depth
+    TREE = (10, 4, 2)
+
+    def __init__(
+        self,
+        backend : str,
+        size    : int,
+        seed    : int = 0,
+        stats   : RepositoryStats | None = None
+    ) -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend \"{backend}\", "
+                             f"should be one of {BACKENDS}")
+
+        # Type annotations:
+        self.backend       : str                                  # Kind of repositories
+        self.size          : int                                  # Number of expenses
+        self.rnd           : Random                               # Source of the data
+        self.directory     : str | None                           # Database directory
+        self.repos         : dict[type, AbstractRepository[Any]]  # Repository by model
+        self.category_repo : AbstractRepository[Category]
+        self.expense_repo  : AbstractRepository[Expense]
+        self.budget_repo   : AbstractRepository[Budget]
+        self.categories    : list[Category]                       # Generated categories
+        self.expense_pks   : list[int]                            # Generated expenses
+        self.fill_time     : float                                # Time to fill, s
+        self.stats         : RepositoryStats | None               # Instrumentation
+        self.bookkeeper    : Bookkeeper                           # Presenter
+
+        # Initialization:
+        self.backend   = backend
+        self.size      = size
+        self.rnd       = Random(seed)
+        self.directory = None if backend == 'memory' else tempfile.mkdtemp()
+        self.stats     = stats
+
+        repo_gen   = self.make_repo if stats is None else instrument_factory(
+            self.make_repo, stats)
+        self.repos = {model: repo_gen(model) for model in (Category, Expense, Budget)}
+
+        self.category_repo = self.repos[Category]
+        self.expense_repo  = self.repos[Expense]
+        self.budget_repo   = self.repos[Budget]
+
+        # Fill the repositories:
+        start = perf_counter()
+        with self.expense_repo.transaction():
+            self.categories = Category.create_from_tree(
+                make_category_tree(*self.TREE), self.category_repo)
+            self.expense_pks = self.expense_repo.add_many(
+                make_expenses(size, [cat.pk for cat in self.categories],
+                              self.rnd, now=datetime.now()))
+            self.budget_repo.add_many([Budget(size, period)
+                                       for period in ("day", "week", "month")])
+        self.fill_time = perf_counter() - start
+        if stats is not None:
+            stats.reset()
+
+        self.bookkeeper = Bookkeeper(NullView(), self.repos.__getitem__)
+
+    def make_repo(self, model: type) -> AbstractRepository[Any]:
+        """ Создать репозиторий стенда для модели model """
+        if self.directory is None:
+            return MemoryRepository(cls=model)
+
+        repo: AbstractRepository[Any]
+        profile = PerformanceProfile() if self.backend == 'sqlite-tuned' else None
+        repo = SQLiteRepository(db_file=f"{self.directory}/bench.db", cls=model,
+                                profile=profile)
+        if self.backend == 'cached':
+            repo = CachedRepository(repo)
+        return repo
+
+    def close(self) -> None:
+        """ Освободить ресурсы стенда и удалить базу данных """
+        self.bookkeeper.close()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def __enter__(self) -> 'Stand':
+        return self
+
+    def __exit__(
+        self,
+        exc_type : type[BaseException] | None,
+        exc_val  : BaseException | None,
+        exc_tb   : TracebackType | None
+    ) -> None:
+        self.close()
@@ -1,16 +1,28 @@
 """
 Простая программа для управления личными финансами.
+
+Если задана переменная окружения BOOKKEEPER_SLOW_MS, работа репозиториев
+измеряется: вызовы и запросы дольше BOOKKEEPER_SLOW_MS миллисекунд
+записываются в журнал, а сводка статистики выводится при выходе.
 """
 
+import logging
+import os
 import sys
 
+from typing import Any
+
 from PySide6.QtWidgets import QApplication  # pylint: disable=no-name-in-module
 
 from bookkeeper.bookkeeper import Bookkeeper
 
 from bookkeeper.view.view import View
 
-from bookkeeper.repository.abstract_repository import repository_factory
+from bookkeeper.repository.abstract_repository import Model, repository_factory
+from bookkeeper.repository.cached_repository   import CachedRepository
+from bookkeeper.repository.instrumentation     import RepositoryStats
+from bookkeeper.repository.instrumentation     import instrument_factory
+from bookkeeper.repository.sqlite_connection   import PerformanceProfile
 from bookkeeper.repository.sqlite_repository   import SQLiteRepository
 
 ###################
@@ -21,13 +33,31 @@ from bookkeeper.repository.sqlite_repository   import SQLiteRepository
 app = QApplication(sys.argv)
 view = View()
 
-# Repo factory:
-repo_gen = repository_factory(SQLiteRepository, db_file="database/bookkeeper.db")
+# Repo factory, every repository is cached and works in WAL mode:
+sqlite_repo_gen = repository_factory(SQLiteRepository, db_file="database/bookkeeper.db",
+                                     profile=PerformanceProfile())
+
+
+def repo_gen(model: Model) -> CachedRepository[Any]:
+    """ Создать кэширующий репозиторий для модели """
+    return CachedRepository(sqlite_repo_gen(model))
+
+
+# Opt-in instrumentation of the repositories:
+slow_ms = os.environ.get("BOOKKEEPER_SLOW_MS")
+stats   = None if slow_ms is None else RepositoryStats(float(slow_ms) / 1000)
+if stats is not None:
+    logging.basicConfig(level=logging.WARNING)
 
-bookkeeper_app = Bookkeeper(view, repo_gen)
+bookkeeper_app = Bookkeeper(view, repo_gen if stats is None
+                            else instrument_factory(repo_gen, stats))
 
 # Execute it!
 bookkeeper_app.start_app()
 
 # Exit program on application exit:
-sys.exit(app.exec())
+exit_code = app.exec()
+bookkeeper_app.close()
+if stats is not None:
+    print(stats.summary(), file=sys.stderr)
+sys.exit(exit_code)
@@ -1,18 +1,36 @@
 """
 Основной класс простого приложения для управляющего личными финансами.
+
+Презентер не обращается к репозиториям из обработчиков интерфейса:
+работа с ними передается фоновым задачам представления (run_in_background),
+которые выполняются по очереди вне потока интерфейса, а их результаты
+применяются к состоянию презентера и к интерфейсу в потоке интерфейса.
+Поэтому окно показывается сразу, а данные появляются по мере загрузки.
+
+Задачи не изменяют состояние презентера, а возвращают новые данные.
+Проверки ввода выполняются в потоке интерфейса, а условия, от которых
+зависит запись (существование категории, уникальность названия),
+проверяются повторно в самой задаче: к моменту ее выполнения их могли
+изменить задачи, запущенные раньше.
 """
 
+from copy     import copy
 from datetime import datetime
 
-from typing import Callable, Any
+from typing import Callable, Any, ContextManager
 
-from bookkeeper.view.abstract_view import AbstractView
+from bookkeeper.view.abstract_view import AbstractView, Progress
 
-from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.abstract_repository import AbstractRepository, transaction
+from bookkeeper.repository.query               import Condition, ge, lt, in_
 
-from bookkeeper.models.category import Category
+from bookkeeper.models.category import Category, CategoryIndex
 from bookkeeper.models.expense  import Expense
 from bookkeeper.models.budget   import Budget
+from bookkeeper.models.report   import CategoryTotal, spending_tree
+
+# Budgets and the moment of their full recalculation, if they were recalculated:
+BudgetState = tuple[list[Budget], datetime | None]
 
 
 class Bookkeeper:
@@ -26,6 +44,19 @@ class Bookkeeper:
     budget_repo   : AbstractRepository[Budget]
     expense_repo  : AbstractRepository[Expense]
 
+    # Loaded categories and budgets:
+    categories : list[Category]
+    budgets    : list[Budget]
+
+    # Categories by name and by pk:
+    category_index : CategoryIndex
+
+    # Moment of the last full recalculation of budgets:
+    budgets_updated : datetime
+
+    # Number of expenses deleted at once when their progress is shown:
+    DELETE_CHUNK = 1000
+
     def __init__(self,
                  view               : AbstractView,
                  repository_factory : Callable[[Any], AbstractRepository[Any]]):
@@ -39,11 +70,11 @@ class Bookkeeper:
 
         self.category_repo = repository_factory(Category)
 
-        self.categories = self.category_repo.get_all()
+        # Categories are loaded in background by load():
+        self.categories     = []
+        self.category_index = CategoryIndex(self.categories)
 
         # Configure view:
-        self.view.set_categories(self.categories)
-
         self.view.set_category_add_handler   (self.add_category)
         self.view.set_category_delete_handler(self.delete_category)
         self.view.set_category_checker       (self.cat_checker)
@@ -54,8 +85,9 @@ class Bookkeeper:
 
         self.budget_repo = repository_factory(Budget)
 
-        # Fill the budget values:
-        self.budgets = self.budget_repo.get_all()
+        # Budget values are calculated in background by load():
+        self.budgets         = []
+        self.budgets_updated = datetime.now()
 
         # Configure view handlers:
         self.view.set_budget_modify_handler(self.modify_budget)
@@ -66,26 +98,64 @@ class Bookkeeper:
 
         self.expense_repo = repository_factory(Expense)
 
-        self.update_expenses()
         self.view.set_expense_add_handler   (self.add_expense)
         self.view.set_expense_delete_handler(self.delete_expenses)
         self.view.set_expense_modify_handler(self.modify_expense)
 
+        # The window is shown without waiting for the data:
+        self.load()
+
+    def load(self) -> None:
+        """
+        Загрузка категорий, бюджетов и расходов в интерфейс в фоне.
+        """
+        self.view.run_in_background(lambda progress: self.category_repo.get_all(),
+                                    self.set_categories)
+        self.update_budgets()
+        self.update_expenses()
+
     def start_app(self) -> None:
         """
         Отображение главного окна приложения.
         """
         self.view.show_main_window()
 
+    def close(self) -> None:
+        """
+        Освобождение ресурсов, занятых репозиториями
+        (после завершения фоновых задач).
+        """
+        self.view.wait_background()
+        repos: list[AbstractRepository[Any]] = [self.category_repo,
+                                                self.budget_repo,
+                                                self.expense_repo]
+        for repo in repos:
+            repo.close()
+
+    def transaction(self) -> ContextManager[None]:
+        """
+        Единица работы над всеми репозиториями приложения: изменения
+        внутри блока with фиксируются один раз и откатываются при ошибке.
+        """
+        return transaction(self.category_repo, self.expense_repo, self.budget_repo)
+
     #########################
     ## Category operations ##
     #########################
 
+    def set_categories(self, cats: list[Category]) -> None:
+        """
+        Замена загруженных категорий: в программном представлении и в интерфейсе.
+        """
+        self.categories = cats
+        self.category_index.rebuild(self.categories)
+        self.view.set_categories(self.categories, self.category_index)
+
     def cat_checker(self, cat_name: str) -> None:
         """
         Проверка целостности категории.
         """
-        if cat_name not in [c.name for c in self.categories]:
+        if cat_name not in self.category_index:
             raise ValueError(f"Категории \"{cat_name}\" не существует")
 
     def add_category(self, name: str, parent: str | None = None) -> None:
@@ -95,27 +165,52 @@ class Bookkeeper:
         """
 
         # Category existent:
-        if name in [c.name for c in self.categories]:
+        if name in self.category_index:
             raise ValueError(f"Категория \"{name}\" уже существует")
 
         # No parent category:
         if parent is not None:
-            if parent not in [c.name for c in self.categories]:
+            parent_cat = self.category_index.get(parent)
+            if parent_cat is None:
                 raise ValueError(f"Категории \"{parent}\" не существует")
-            parent_pk = self.category_repo.get_all(where={'name': parent})[0].pk
+            parent_pk: int | None = parent_cat.pk
         else:
             parent_pk = None
 
         # Create category:
         cat = Category(name, parent_pk)
 
-        # Update:
+        # Update the repository in background, then:
         # - Internal state
-        # - Repository
         # - View
-        self.categories.append(cat)
-        self.category_repo.add(cat)
-        self.view.set_categories(self.categories)
+        def added(_: Any) -> None:
+            self.categories.append(cat)
+            self.category_index.add(cat)
+            self.view.set_categories(self.categories, self.category_index)
+
+        def add(_: Progress) -> None:
+            # Earlier tasks may have changed the categories since the check:
+            with self.transaction():
+                self.check_category_name(name)
+                if parent_pk is not None:
+                    self.check_category_pk(parent_pk, parent)
+                self.category_repo.add(cat)
+
+        self.view.run_in_background(add, added)
+
+    def check_category_name(self, name: str) -> None:
+        """
+        Проверка в репозитории, что категории с названием name нет.
+        """
+        if self.category_repo.get_all(where={'name': name}, limit=1):
+            raise ValueError(f"Категория \"{name}\" уже существует")
+
+    def check_category_pk(self, pk: int, name: str | None) -> None:
+        """
+        Проверка в репозитории, что категория name с первичным ключом pk существует.
+        """
+        if self.category_repo.get(pk) is None:
+            raise ValueError(f"Категории \"{name}\" не существует")
 
     def delete_category(self, cat_name: str) -> None:
         """
@@ -124,32 +219,52 @@ class Bookkeeper:
         """
 
         # No categories to delete:
-        cats = self.category_repo.get_all(where={"name": cat_name})
+        cat = self.category_index.get(cat_name)
 
-        if len(cats) == 0:
+        if cat is None:
             raise ValueError(f"Категории \"{cat_name}\" не существует")
 
-        # Repo operation:
-        cat = cats[0]
-        self.category_repo.delete(cat.pk)
+        def delete(
+            progress: Progress
+        ) -> tuple[list[Category], list[Expense], BudgetState]:
+            # Repo operations are applied atomically:
+            with self.transaction():
+                self.check_category_pk(cat.pk, cat_name)
+                self.category_repo.delete(cat.pk)
 
-        # Update parent category for all children ("your papa is gone :("):
-        for child in self.category_repo.get_all(where={'parent': cat.pk}):
-            child.parent = cat.parent
-            self.category_repo.update(child)
+                # Update parent category for all children ("your papa is gone :(").
+                # Fetched objects may be the stored ones, so copies are changed:
+                children = [copy(child) for child
+                            in self.category_repo.get_all(where={'parent': cat.pk})]
+                for child in children:
+                    child.parent = cat.parent
+                self.category_repo.update_many(children)
 
-        # Update internal state:
-        self.categories = self.category_repo.get_all()
+                # Update expense repo, there may be a lot of expenses:
+                exps = self.expense_repo.get_all(where={'category': cat.pk})
+                pks  = [exp.pk for exp in exps]
+                for start in range(0, len(pks), self.DELETE_CHUNK):
+                    self.expense_repo.delete_many(pks[start:start + self.DELETE_CHUNK])
+                    progress(min(start + self.DELETE_CHUNK, len(pks)), len(pks))
 
-        # Update view:
-        self.view.set_categories(self.categories)
+                # Deleted expenses are no longer spent:
+                budgets = self.update_budgets_by([(exp.expense_date, -exp.amount)
+                                                  for exp in exps])
 
-        # Update expense repo:
-        for exp in self.expense_repo.get_all(where={'category': cat.pk}):
-            self.expense_repo.delete(exp.pk)
+            return self.category_repo.get_all(), exps, budgets
 
-        # Uodate expenses:
-        self.update_expenses()
+        def deleted(result: tuple[list[Category], list[Expense], BudgetState]) -> None:
+            cats, exps, budgets = result
+
+            # Update internal state and view:
+            self.set_categories(cats)
+            self.set_budgets(budgets)
+
+            # Uodate expenses:
+            self.remove_expenses({exp.pk for exp in exps})
+
+        self.view.run_in_background(delete, deleted,
+                                    f"Удаление категории \"{cat_name}\"")
 
     ########################
     ## Expense operations ##
@@ -158,13 +273,38 @@ class Bookkeeper:
     def update_expenses(self) -> None:
         """
         Обновление пунктов расходов: в базе данных и в интерфейсе.
+        Бюджеты при этом не пересчитываются, изменения сумм трат
+        учитываются в них методом update_budgets_by.
         """
 
-        self.expenses = self.expense_repo.get_all()
-        self.view.set_expenses(self.expenses)
+        # The view loads the expenses page by page while they are scrolled:
+        self.view.set_expense_source(self.fetch_expenses)
 
-        # Update budgets as they have expanses inside:
-        self.update_budgets()
+    def fetch_expenses(self, after: Expense | None, count: int) -> list[Expense]:
+        """
+        Получение очередной страницы последних расходов для интерфейса.
+
+        Parameters
+        ----------
+        after - последний из уже полученных расходов или None для первой страницы
+        count - число расходов на странице
+
+        Returns
+        -------
+        Не более count расходов, предшествующих after по дате (expense_date, pk),
+        от более поздних к более ранним
+        """
+
+        # Pages are continued from the last date and pk seen, not by an offset,
+        # so every page costs the same regardless of the number of expenses:
+        cursor = None if after is None else (after.expense_date, after.pk)
+        return self.expense_repo.get_page('expense_date', count, cursor, descending=True)
+
+    def remove_expenses(self, exp_pks: set[int]) -> None:
+        """
+        Удаление пунктов расходов из интерфейса (после удаления из базы данных).
+        """
+        self.view.expenses_removed(exp_pks)
 
     def add_expense(self, amount: str, cat_name: str, comment: str = "") -> None:
         """
@@ -182,56 +322,87 @@ class Bookkeeper:
             raise ValueError("Введите положительную величину покупки.")
 
         # Get expense category (to link to it's id):
-        cats = self.category_repo.get_all(where={"name": cat_name.lower()})
+        cat = self.category_index.get(cat_name.lower())
 
-        if len(cats) == 0:
+        if cat is None:
             raise ValueError(f"Категории \"{cat_name}\" не существует")
 
         # Create the expense:
-        cat = cats[0]
         new_exp = Expense(amount_int, cat.pk, comment=comment)
 
-        self.expense_repo.add(new_exp)
-        self.update_expenses()
+        def add(_: Progress) -> BudgetState:
+            with self.transaction():
+                # The category may have been deleted by an earlier task:
+                self.check_category_pk(new_exp.category, cat_name)
+                self.expense_repo.add(new_exp)
+                return self.update_budgets_by([(new_exp.expense_date, new_exp.amount)])
+
+        def added(budgets: BudgetState) -> None:
+            self.view.expense_added(new_exp)
+            self.set_budgets(budgets)
+
+            # Check budget limits:
+            for budget in self.budgets:
+                if budget.spent > budget.limitation:
+                    self.view.not_on_budget_message()
+                    return
 
-        # Check budget limits:
-        for budget in self.budgets:
-            if budget.spent > budget.limitation:
-                self.view.not_on_budget_message()
-                return
+        self.view.run_in_background(add, added)
 
     def delete_expenses(self, exp_pks: set[int]) -> None:
         """
         Удаление пунктов расходов: из базы данных и из интерфейса.
         """
 
-        for pk in exp_pks:
-            self.expense_repo.delete(pk)
-        self.update_expenses()
+        def delete(_: Progress) -> BudgetState:
+            with self.transaction():
+                exps = self.expense_repo.get_all(where={'pk': in_(exp_pks)})
+                self.expense_repo.delete_many(list(exp_pks))
+                return self.update_budgets_by([(exp.expense_date, -exp.amount)
+                                               for exp in exps])
+
+        def deleted(budgets: BudgetState) -> None:
+            self.set_budgets(budgets)
+            self.remove_expenses(exp_pks)
+
+        self.view.run_in_background(delete, deleted)
 
     def modify_expense(self, pk: int, attr: str, new_val: str) -> None:
         """
-        Обновление пунктов расходов: в базе данных и в интерфейсе.
+        Обновление пунктов расходов: в базе данных (в фоне) и в интерфейсе.
+        """
+
+        # User input is checked right away, the expense is updated in background:
+        value = self.parse_expense_value(attr, new_val)
+
+        def modified(result: tuple[Expense, BudgetState]) -> None:
+            exp, budgets = result
+            self.view.expense_updated(exp)
+            self.set_budgets(budgets)
+
+        self.view.run_in_background(
+            lambda progress: self.change_expense(pk, attr, value), modified)
+
+    def parse_expense_value(self, attr: str, new_val: str) -> Any:
         """
+        Разбор нового значения new_val поля attr расхода, введенного пользователем.
 
-        # Get expense to be modified:
-        exp = self.expense_repo.get(pk)
-        if exp is None:
-            raise ValueError(f"Расхода с pk=\"{pk}\" не существует")
+        Returns
+        -------
+        Значение поля: pk категории, сумма или дата расхода
+        """
 
         # Modify category:
         if attr == "category":
             # Parse string:
             cat_name = new_val.lower()
 
-            if cat_name not in [c.name for c in self.categories]:
+            cat = self.category_index.get(cat_name)
+            if cat is None:
                 raise ValueError(f"Категории \"{cat_name}\" не существует")
 
-            # Get category pk:
-            cat_pk = self.category_repo.get_all(where={'name': cat_name})[0].pk
-
-            # Update expense pk:
-            exp.category = cat_pk
+            # Expense refers to the category by pk:
+            return cat.pk
 
         # Modify amount:
         if attr == "amount":
@@ -246,54 +417,148 @@ class Bookkeeper:
             if amount <= 0:
                 raise ValueError("Удачная покупка! Записывать не буду.")
 
-            exp.amount = amount
+            return amount
 
         # Modify expense_date:
         if attr == "expense_date":
             # Parse datetime:
             try:
-                time_str  = datetime.fromisoformat(new_val)
-                time_date = time_str.isoformat(sep='\t', timespec='minutes')
+                return datetime.fromisoformat(new_val)
             except ValueError as exc:
                 raise ValueError("Неправильный формат даты.") from exc
 
-            setattr(exp, attr, time_date)
+        return new_val
 
-        # Update the expense:
-        self.expense_repo.update(exp)
+    def change_expense(
+        self,
+        pk    : int,
+        attr  : str,
+        value : Any
+    ) -> tuple[Expense, BudgetState]:
+        """
+        Обновление поля attr пункта расходов в базе данных и в бюджетах.
+        Значение value уже разобрано (см. parse_expense_value).
 
-        # Update view and expenses in the budget:
-        self.update_expenses()
+        Returns
+        -------
+        Обновленный расход и бюджеты
+        """
+
+        with self.transaction():
+            # Get expense to be modified (a copy, the stored one is changed by update):
+            stored = self.expense_repo.get(pk)
+            if stored is None:
+                raise ValueError(f"Расхода с pk=\"{pk}\" не существует")
+            exp = copy(stored)
+
+            # The category may have been deleted by an earlier task:
+            if attr == "category":
+                self.check_category_pk(value, None)
+
+            # Remember the spending to be replaced in budgets:
+            old_spending = (exp.expense_date, -exp.amount)
+            setattr(exp, attr, value)
+
+            # Update the expense and expenses in the budget:
+            self.expense_repo.update(exp)
+            budgets = self.update_budgets_by([old_spending,
+                                              (exp.expense_date, exp.amount)])
+
+        return exp, budgets
 
     #######################
     ## Budget operations ##
     #######################
 
+    def set_budgets(self, budgets: BudgetState) -> None:
+        """
+        Замена бюджетов, полученных фоновой задачей: в программном
+        представлении и в интерфейсе.
+        """
+        self.budgets, updated = budgets
+        if updated is not None:
+            self.budgets_updated = updated
+        self.view.set_budgets(self.budgets)
+
     def update_budgets(self) -> None:
         """
-        Обновление вычисляемых параметров бюджетов:
-        в базе данных, в интерфейсе и в программном обновлении.
+        Полный пересчет вычисляемых параметров бюджетов в фоне,
+        затем обновление интерфейса.
+        """
+        self.view.run_in_background(lambda progress: self.recalculate_budgets(),
+                                    self.set_budgets)
+
+    def recalculate_budgets(self) -> BudgetState:
+        """
+        Полный пересчет вычисляемых параметров бюджетов в базе данных.
+        Состояние презентера не изменяется: оно обновляется методом
+        set_budgets в потоке интерфейса.
+
+        Returns
+        -------
+        Пересчитанные бюджеты и момент пересчета
         """
 
         # Update budget integrity:
-        for budget in self.budget_repo.get_all():
+        now     = datetime.now()
+        budgets = [copy(budget) for budget in self.budget_repo.get_all()]
+        for budget in budgets:
             budget.update_spent(self.expense_repo)
-            self.budget_repo.update(budget)
 
-        # Update internal representation and view:
-        self.budgets = self.budget_repo.get_all()
-        self.view.set_budgets(self.budgets)
+        self.budget_repo.update_many(budgets)
+
+        return budgets, now
+
+    def update_budgets_by(self, spendings: list[tuple[datetime, int]]) -> BudgetState:
+        """
+        Инкрементальное обновление бюджетов в базе данных: учесть изменения
+        сумм трат, заданные парами (дата траты, изменение суммы). Если с момента
+        последнего пересчета начался новый период какого-либо бюджета,
+        бюджеты пересчитываются полностью. Состояние презентера и интерфейс
+        обновляет вызывающий.
+
+        Returns
+        -------
+        Обновленные бюджеты и момент пересчета, если он был
+        """
+
+        # Budgets are read from the repository: the presenter's ones may not
+        # include the changes of the earlier tasks yet. The moment of the
+        # last recalculation may be out of date as well, which only causes
+        # an extra recalculation:
+        now     = datetime.now()
+        budgets = [copy(budget) for budget in self.budget_repo.get_all()]
+
+        # Period rollover:
+        for budget in budgets:
+            if now >= budget.period_bounds(self.budgets_updated)[1]:
+                return self.recalculate_budgets()
+
+        # Apply the changes of the spendings:
+        changed = []
+        for budget in budgets:
+            deltas = [budget.apply_delta(date, amount, now) for date, amount in spendings]
+            if any(deltas):
+                changed.append(budget)
+
+        if len(changed) != 0:
+            self.budget_repo.update_many(changed)
+
+        return budgets, None
 
     def modify_budget(self, pk: int | None, new_limit: str, period: str) -> None:
         """
-        Обновление лемита и периода бюджета: в репозитории.
+        Обновление лемита и периода бюджета: в репозитории (в фоне).
         """
 
         # Remove budget if no spendings limit is set:
         if new_limit == "":
-            if pk is not None:
-                self.budget_repo.delete(pk)
-            self.update_budgets()
+            def delete(_: Progress) -> BudgetState:
+                if pk is not None:
+                    self.budget_repo.delete(pk)
+                return self.recalculate_budgets()
+
+            self.view.run_in_background(delete, self.set_budgets)
             return
 
         # Parse limit as integer:
@@ -309,19 +574,45 @@ class Bookkeeper:
             self.update_budgets()
             raise ValueError("За этот период придется заработать.")
 
-        # Handle nonexistent primary key:
-        if pk is None:
-            # Insert newly-created budget:
-            budget_new = Budget(limitation=new_limit_int, period=period)
-            self.budget_repo.add(budget_new)
-        else:
-            # Or update existing one:
-            budget_old = self.budget_repo.get(pk)
-            if budget_old is None:
-                raise ValueError(f"Бюджета с pk=\"{pk}\" не существует")
+        def modify(_: Progress) -> BudgetState:
+            # Handle nonexistent primary key:
+            if pk is None:
+                # Insert newly-created budget:
+                budget_new = Budget(limitation=new_limit_int, period=period)
+                self.budget_repo.add(budget_new)
+            else:
+                # Or update existing one:
+                budget_old = self.budget_repo.get(pk)
+                if budget_old is None:
+                    raise ValueError(f"Бюджета с pk=\"{pk}\" не существует")
 
-            budget_old.limitation = new_limit_int
-            self.budget_repo.update(budget_old)
+                budget_old = copy(budget_old)
+                budget_old.limitation = new_limit_int
+                self.budget_repo.update(budget_old)
 
-        # Final update:
-        self.update_budgets()
+            # Final update:
+            return self.recalculate_budgets()
+
+        self.view.run_in_background(modify, self.set_budgets)
+
+    #######################
+    ## Report operations ##
+    #######################
+
+    def spending_tree(
+        self,
+        start : datetime | None = None,
+        end   : datetime | None = None
+    ) -> list[CategoryTotal]:
+        """
+        Отчет о расходах по дереву категорий за период [start, end):
+        суммы по каждой категории вместе с подкатегориями.
+        """
+        date_cond: Condition | None = None
+        if start is not None:
+            date_cond = ge(start)
+        if end is not None:
+            date_cond = lt(end) if date_cond is None else date_cond & lt(end)
+
+        where = None if date_cond is None else {'expense_date': date_cond}
+        return spending_tree(self.category_repo, self.expense_repo, where)
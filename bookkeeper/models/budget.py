@@ -2,10 +2,10 @@
 Модель бюджета.
 """
 from dataclasses import dataclass
-from enum        import Enum
 from datetime    import datetime, timedelta
 
 from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.query               import ge, lt
 from bookkeeper.models.expense                 import Expense
 
 
@@ -39,31 +39,50 @@ class Budget:
         self.spent      = spent
         self.pk         = pk
 
-    def update_spent(self, expense_repo: AbstractRepository[Expense]) -> None:
-        # Generate timestamp for operation:
-        date = datetime.now().isoformat()[:10]  # YYYY-MM-DD format
+    def period_bounds(self, date: datetime | None = None) -> tuple[datetime, datetime]:
+        """
+        Получить границы периода бюджета, содержащего дату date
+        (по умолчанию - текущую), в виде полуинтервала [начало, конец).
+        """
+        if date is None:
+            date = datetime.now()
+        day = date.replace(hour=0, minute=0, second=0, microsecond=0)
 
         if self.period == "day":
-            mask   = f"{date}"
-            period_exps = expense_repo.get_all_by_pattern({"expense_date": mask})
+            return day, day + timedelta(days=1)
 
-        elif self.period == "week":
-            weekday_now    = datetime.now().weekday()
-            day_now        = datetime.fromisoformat(date)
-            first_week_day = day_now - timedelta(days=weekday_now)
+        if self.period == "week":
+            first_week_day = day - timedelta(days=day.weekday())
+            return first_week_day, first_week_day + timedelta(days=7)
 
-            period_exps = []
-            for i in range(7):
-                weekday   = first_week_day + timedelta(days=i)
-                mask = f"{weekday.isoformat()[:10]}"
+        first_month_day = day.replace(day=1)
+        if first_month_day.month == 12:
+            return first_month_day, first_month_day.replace(year=day.year + 1, month=1)
+        return first_month_day, first_month_day.replace(month=day.month + 1)
 
-                period_exps += expense_repo.get_all_by_pattern({"expense_date": mask})
+    def apply_delta(
+        self,
+        expense_date : datetime,
+        amount       : int,
+        date         : datetime | None = None
+    ) -> bool:
+        """
+        Учесть изменение суммы трат amount на дату expense_date без пересчета
+        всего периода. Изменение учитывается, только если expense_date попадает
+        в период бюджета, содержащий дату date (по умолчанию - текущую).
+        Вернуть True, если потраченная сумма изменилась.
+        """
+        start, end = self.period_bounds(date)
+        if amount == 0 or not start <= expense_date < end:
+            return False
 
-        elif self.period == "month":
-            mask = f"{date[:7]}-"
+        self.spent += amount
+        return True
 
-            period_exps = expense_repo.get_all_by_pattern({"expense_date": mask})
+    def update_spent(self, expense_repo: AbstractRepository[Expense]) -> None:
+        # Sum up the expenses of the current period with a single range query:
+        start, end = self.period_bounds()
+        period     = {"expense_date": ge(start) & lt(end)}
 
         # Update money spent:
-        # pylint: disable=consider-using-generator
-        self.spent = sum([int(exp.amount) for exp in period_exps])
+        self.spent = int(expense_repo.aggregate(where=period, sum="amount")["sum"])
@@ -3,7 +3,7 @@
 """
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Iterator
+from typing import Iterable, Iterator
 
 from ..repository.abstract_repository import AbstractRepository
 
@@ -15,6 +15,11 @@ class Category:
     родителя (категория, подкатегорией которой является данная) в атрибуте parent.
     У категорий верхнего уровня parent = None
     """
+    # Fields to be indexed by repositories:
+    INDEXES = ('name', 'parent')
+    # Field referencing the parent category in the hierarchy:
+    HIERARCHY = 'parent'
+
     name: str
     parent: int | None = None
     pk: int = 0
@@ -94,6 +99,7 @@ class Category:
         Создать дерево категорий из списка пар "потомок-родитель".
         Список должен быть топологически отсортирован, т.е. потомки
         не должны встречаться раньше своего родителя.
+        Категории добавляются в репозиторий пакетами с помощью add_many.
         Проверка корректности исходных данных не производится.
         При использовании СУБД с проверкой внешних ключей, будет получена
         ошибка (для sqlite3 - IntegrityError). При отсутствии проверки
@@ -111,8 +117,240 @@ class Category:
         Список созданных объектов Category
         """
         created: dict[str, Category] = {}
+        pending: dict[str, Category] = {}
+
+        # Categories are added in batches: a batch is flushed to the repository
+        # only when a child of one of it's categories is met.
         for child, parent in tree:
+            if parent in pending or child in pending:
+                repo.add_many(list(pending.values()))
+                created.update(pending)
+                pending.clear()
+
             cat = cls(child, created[parent].pk if parent is not None else None)
-            repo.add(cat)
-            created[child] = cat
+            pending[child] = cat
+
+        repo.add_many(list(pending.values()))
+        created.update(pending)
         return list(created.values())
+
+
+class CategoryTree:
+    """
+    Дерево категорий в памяти для быстрых запросов к иерархии.
+    Строится один раз по списку категорий (или по репозиторию методом
+    from_repo) и обновляется методами add, delete и reparent вслед
+    за изменениями в репозитории. Категории задаются своими pk.
+
+    Глубина и категория верхнего уровня (root) хранятся для каждой
+    категории и возвращаются за O(1). Проверка принадлежности поддереву
+    (in_subtree) выполняется за O(1) по интервалам обхода дерева в глубину,
+    список потомков - за O(k), предков - за O(глубины). Интервалы обхода
+    перестраиваются за O(n) при первом запросе после изменения дерева.
+    """
+
+    def __init__(self, categories: Iterable[Category] = ()) -> None:
+        # Type annotations:
+        self._parent   : dict[int, int | None]               # Parent of every category
+        self._children : dict[int | None, dict[int, None]]   # Ordered sets of children
+        self._depth    : dict[int, int]                      # Depth, top level is 0
+        self._root     : dict[int, int]                      # Top level ancestor
+        self._order    : list[int]                           # Depth-first order
+        self._enter    : dict[int, int]                      # Subtree start in _order
+        self._exit     : dict[int, int]                      # Subtree end in _order
+        self._dirty    : bool                                # _order is outdated
+
+        # Initialization:
+        self._parent   = {}
+        self._children = {None: {}}
+        self._depth    = {}
+        self._root     = {}
+        self._order    = []
+        self._enter    = {}
+        self._exit     = {}
+        self._dirty    = True
+
+        # Categories may go in any order, so link them all first:
+        for cat in categories:
+            self._parent[cat.pk] = cat.parent
+            self._children.setdefault(cat.pk, {})
+            self._children.setdefault(cat.parent, {})[cat.pk] = None
+
+        for parent in self._children:
+            if parent is not None and parent not in self._parent:
+                raise KeyError(parent)
+
+        for pk in self._walk(None):
+            self._place(pk)
+        if len(self._depth) != len(self._parent):
+            raise ValueError('Category hierarchy contains a cycle')
+
+    @classmethod
+    def from_repo(cls, repo: AbstractRepository[Category]) -> 'CategoryTree':
+        """ Построить дерево по всем категориям из репозитория """
+        return cls(repo.iter_all())
+
+    def _walk(self, pk: int | None) -> Iterator[int]:
+        """ Обойти потомков категории pk в глубину (None - все категории) """
+        stack = list(reversed(self._children[pk]))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(self._children[node]))
+
+    def _place(self, pk: int) -> None:
+        """ Вычислить глубину и корень категории по ее родителю """
+        parent = self._parent[pk]
+        if parent is None:
+            self._depth[pk] = 0
+            self._root[pk] = pk
+        else:
+            self._depth[pk] = self._depth[parent] + 1
+            self._root[pk] = self._root[parent]
+
+    def _replace(self, pk: int) -> None:
+        """ Пересчитать глубину и корень для поддерева категории pk """
+        self._place(pk)
+        for node in self._walk(pk):
+            self._place(node)
+        self._dirty = True
+
+    def _reindex(self) -> None:
+        """ Перестроить интервалы обхода в глубину, если дерево изменилось """
+        if not self._dirty:
+            return
+
+        self._order = list(self._walk(None))
+        self._enter = {pk: i for i, pk in enumerate(self._order)}
+        self._exit = {}
+        for pk in reversed(self._order):
+            self._exit[pk] = self._enter[pk] + 1 + sum(
+                self._exit[child] - self._enter[child] for child in self._children[pk])
+        self._dirty = False
+
+    def __contains__(self, pk: object) -> bool:
+        return pk in self._parent
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def parent(self, pk: int) -> int | None:
+        """ Получить pk родителя категории """
+        return self._parent[pk]
+
+    def children(self, pk: int | None) -> list[int]:
+        """ Получить непосредственные подкатегории (None - верхний уровень) """
+        return list(self._children[pk])
+
+    def depth(self, pk: int) -> int:
+        """ Получить глубину категории, у категорий верхнего уровня она равна 0 """
+        return self._depth[pk]
+
+    def root(self, pk: int) -> int:
+        """ Получить категорию верхнего уровня, к которой относится категория """
+        return self._root[pk]
+
+    def ancestors(self, pk: int) -> list[int]:
+        """ Получить предков категории от родителя до категории верхнего уровня """
+        result = []
+        parent = self._parent[pk]
+        while parent is not None:
+            result.append(parent)
+            parent = self._parent[parent]
+        return result
+
+    def descendants(self, pk: int) -> list[int]:
+        """ Получить все подкатегории разного уровня в порядке обхода в глубину """
+        self._reindex()
+        return self._order[self._enter[pk] + 1:self._exit[pk]]
+
+    def in_subtree(self, pk: int, top: int) -> bool:
+        """ Проверить, является ли категория pk категорией top или ее потомком """
+        self._reindex()
+        return self._enter[top] <= self._enter[pk] < self._exit[top]
+
+    def add(self, cat: Category) -> None:
+        """ Добавить в дерево новую категорию """
+        if cat.pk in self._parent:
+            raise ValueError(f'Category {cat.pk} is already in the tree')
+        if cat.parent is not None and cat.parent not in self._parent:
+            raise KeyError(cat.parent)
+
+        self._parent[cat.pk] = cat.parent
+        self._children[cat.pk] = {}
+        self._children[cat.parent][cat.pk] = None
+        self._place(cat.pk)
+        self._dirty = True
+
+    def delete(self, pk: int) -> None:
+        """
+        Удалить категорию из дерева, ее подкатегории переходят к ее родителю
+        (так же, как при удалении категории в приложении).
+        """
+        parent = self._parent.pop(pk)
+        del self._children[parent][pk]
+        del self._depth[pk], self._root[pk]
+
+        for child in self._children.pop(pk):
+            self._parent[child] = parent
+            self._children[parent][child] = None
+            self._replace(child)
+        self._dirty = True
+
+    def reparent(self, pk: int, parent: int | None) -> None:
+        """ Перенести категорию со всеми подкатегориями к новому родителю """
+        if parent is not None and (parent == pk or pk in self.ancestors(parent)):
+            raise ValueError(f'Category {parent} is in the subtree of category {pk}')
+
+        del self._children[self._parent[pk]][pk]
+        self._parent[pk] = parent
+        self._children[parent][pk] = None
+        self._replace(pk)
+
+
+class CategoryIndex:
+    """
+    Двусторонний индекс категорий по названию и по pk.
+    Используется приложением и интерфейсом для поиска категории по названию
+    и названия по pk за O(1) без обращений к репозиторию. Поддерживается
+    методами add и remove или перестраивается целиком методом rebuild.
+    """
+
+    def __init__(self, categories: Iterable[Category] = ()) -> None:
+        self._by_name : dict[str, Category] = {}
+        self._by_pk   : dict[int, Category] = {}
+        self.rebuild(categories)
+
+    def rebuild(self, categories: Iterable[Category]) -> None:
+        """ Перестроить индекс по списку категорий """
+        self._by_name = {cat.name: cat for cat in categories}
+        self._by_pk   = {cat.pk: cat for cat in self._by_name.values()}
+
+    def add(self, cat: Category) -> None:
+        """ Добавить категорию (уже сохраненную в репозитории) в индекс """
+        self._by_name[cat.name] = cat
+        self._by_pk[cat.pk] = cat
+
+    def remove(self, cat: Category) -> None:
+        """ Удалить категорию из индекса """
+        self._by_name.pop(cat.name, None)
+        self._by_pk.pop(cat.pk, None)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._by_name
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def get(self, name: str) -> Category | None:
+        """ Получить категорию по названию """
+        return self._by_name.get(name)
+
+    def get_by_pk(self, pk: int) -> Category | None:
+        """ Получить категорию по pk """
+        return self._by_pk.get(pk)
+
+    def name(self, pk: int) -> str:
+        """ Получить название категории по pk, пустое для неизвестного pk """
+        cat = self._by_pk.get(pk)
+        return "" if cat is None else cat.name
@@ -17,6 +17,9 @@ class Expense:
     comment - комментарий
     pk - id записи в базе данных
     """
+    # Fields to be indexed by repositories:
+    INDEXES = ('expense_date', 'category')
+
     amount: int
     category: int
     expense_date: datetime = field(default_factory=datetime.now)
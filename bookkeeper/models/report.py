@@ -0,0 +1,51 @@
+"""
+Модуль описывает отчеты по расходам.
+"""
+from dataclasses import dataclass
+from typing      import Any
+
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.models.category                import Category, CategoryTree
+from bookkeeper.models.expense                 import Expense
+
+
+@dataclass
+class CategoryTotal:
+    """
+    Строка отчета о расходах по дереву категорий: категория, ее глубина
+    в иерархии (у категорий верхнего уровня - 0) и сумма расходов
+    по категории вместе со всеми ее подкатегориями.
+    """
+    category : Category
+    depth    : int
+    total    : int
+
+
+def spending_tree(
+    category_repo : AbstractRepository[Category],
+    expense_repo  : AbstractRepository[Expense],
+    where         : dict[str, Any] | None = None
+) -> list[CategoryTotal]:
+    """
+    Построить отчет о расходах по дереву категорий без загрузки самих
+    расходов: суммы по категориям с учетом подкатегорий вычисляются
+    репозиторием (rollup). Строки идут в порядке обхода дерева в глубину:
+    каждая категория следует за своим родителем.
+
+    Parameters
+    ----------
+    category_repo - репозиторий категорий
+    expense_repo - репозиторий расходов
+    where - условие на учитываемые расходы, например, на expense_date
+
+    Returns
+    -------
+    Список строк отчета CategoryTotal
+    """
+    categories = {cat.pk: cat for cat in category_repo.iter_all()}
+    tree       = CategoryTree(categories.values())
+    totals     = category_repo.rollup(expense_repo, 'category', 'amount', where)
+
+    return [CategoryTotal(categories[pk], tree.depth(pk), totals.get(pk, 0))
+            for root in tree.children(None)
+            for pk in [root, *tree.descendants(root)]]
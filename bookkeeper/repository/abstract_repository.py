@@ -7,8 +7,14 @@
 использовать его для иных целей.
 """
 
-from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Callable, Any
+from abc        import ABC, abstractmethod
+from contextlib import ExitStack, contextmanager, nullcontext
+from itertools  import islice
+from types      import TracebackType
+from typing     import Generic, TypeVar, Protocol, Callable, Any, ContextManager, Iterator
+
+from bookkeeper.repository.query import (
+    OrderBy, compute_aggregates, keyset_follows, keyset_where)
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -19,6 +25,7 @@ class Model(Protocol):  # pylint: disable=too-few-public-methods
 
 
 T = TypeVar('T', bound=Model)
+R = TypeVar('R', bound='AbstractRepository[Any]')
 
 
 class AbstractRepository(ABC, Generic[T]):
@@ -30,6 +37,17 @@ class AbstractRepository(ABC, Generic[T]):
     get_all
     update
     delete
+
+    Массовые операции add_many, update_many и delete_many по умолчанию
+    выполняются поэлементно, конкретные репозитории могут реализовать их
+    эффективнее.
+
+    Метод transaction() возвращает контекстный менеджер, внутри которого
+    изменения репозитория применяются атомарно: фиксируются один раз при
+    выходе из блока и откатываются при исключении.
+
+    Репозиторий может удерживать ресурсы (например, соединения с БД),
+    которые освобождаются методом close() или при выходе из блока with.
     """
 
     @abstractmethod
@@ -44,11 +62,22 @@ class AbstractRepository(ABC, Generic[T]):
         """ Получить объект по id """
 
     @abstractmethod
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
         """
         Получить все записи по некоторому условию
-        where - условие в виде словаря {'название_поля': значение}
+        where - условие в виде словаря {'название_поля': значение},
+        значением может быть условие из модуля query (gt, lt, between, in_ ...)
         если условие не задано (по умолчанию), вернуть все записи
+        order_by - поле или список полей для сортировки, поля с префиксом '-'
+        сортируются по убыванию
+        limit, offset - максимальное число записей и число пропускаемых записей
         """
 
     @abstractmethod
@@ -63,6 +92,104 @@ class AbstractRepository(ABC, Generic[T]):
         Фактически это позволяет реализовать паттерн-матчинг по репозиторию.
         """
 
+    def iter_all(
+        self,
+        where      : dict[str, Any] | None = None,
+        *,
+        order_by   : OrderBy | None = None,
+        batch_size : int = 1000
+    ) -> Iterator[T]:
+        """
+        Перебрать все записи по некоторому условию, не загружая их в память
+        целиком: записи читаются из хранилища пакетами по batch_size штук.
+        Условие и порядок задаются так же, как в get_all.
+        По умолчанию перебирает результат get_all.
+        """
+        del batch_size
+        yield from self.get_all(where, order_by=order_by)
+
+    def get_page(
+        self,
+        key        : str,
+        limit      : int,
+        after      : tuple[Any, int] | None = None,
+        *,
+        descending : bool = False,
+        where      : dict[str, Any] | None = None
+    ) -> list[T]:
+        """
+        Получить страницу из не более чем limit записей, упорядоченных
+        по полю key, а при равных значениях key - по pk (keyset pagination):
+            page = repo.get_page('expense_date', 50, descending=True)
+            last = page[-1]
+            page = repo.get_page('expense_date', 50, (last.expense_date, last.pk),
+                                 descending=True)
+        after - курсор (значение key, pk) последней записи предыдущей страницы,
+        None для первой страницы. В отличие от offset, стоимость получения
+        страницы не зависит от ее номера, а записи, добавленные или удаленные
+        перед курсором, не приводят к пропускам и повторам.
+        descending - упорядочение по убыванию (например, последние записи)
+        where - дополнительное условие на записи, как в get_all.
+        Записи без значения поля key (None) не возвращаются.
+        По умолчанию записи перебираются iter_all, начиная со значения
+        key курсора.
+        """
+        order = [f"-{key}", "-pk"] if descending else [key, "pk"]
+        objs  = self.iter_all(keyset_where(where, key, after, descending),
+                              order_by=order, batch_size=limit)
+        if after is not None:
+            objs = (obj for obj in objs if keyset_follows(obj, key, after, descending))
+        return list(islice(objs, limit))
+
+    def aggregate(
+        self,
+        where        : dict[str, Any] | None = None,
+        group_by     : str | None = None,
+        **aggregates : str
+    ) -> dict[Any, Any]:
+        """
+        Вычислить агрегатные функции (sum, count, min, max, avg) по записям,
+        удовлетворяющим условию where, без загрузки самих записей:
+            repo.aggregate(where=..., sum='amount')
+                -> {'sum': 100}
+            repo.aggregate(group_by='category', sum='amount', count='*')
+                -> {1: {'sum': 70, 'count': 2}, 2: {'sum': 30, 'count': 1}}
+        По умолчанию вычисляется над результатом get_all.
+        """
+        return compute_aggregates(self.get_all(where), group_by, aggregates)
+
+    def rollup(
+        self,
+        records      : 'AbstractRepository[Any]',
+        ref_field    : str,
+        value_field  : str,
+        where        : dict[str, Any] | None = None,
+        parent_field : str = 'parent'
+    ) -> dict[int, Any]:
+        """
+        Вычислить для каждой записи иерархии (поле parent_field ссылается
+        на родителя) сумму поля value_field записей records, которые
+        ссылаются полем ref_field на нее или на любого ее потомка:
+            category_repo.rollup(expense_repo, 'category', 'amount')
+                -> {pk категории: сумма расходов по ней и подкатегориям}
+        where - условие на записи records.
+        По умолчанию суммы по каждой записи иерархии (aggregate) переносятся
+        вверх к предкам в памяти.
+        """
+        parents = {obj.pk: getattr(obj, parent_field) for obj in self.iter_all()}
+        result  = dict.fromkeys(parents, 0)
+
+        totals = records.aggregate(where, group_by=ref_field, sum=value_field)
+        for node, total in totals.items():
+            # The number of steps is limited to stop on cycles in the data:
+            for _ in range(len(parents)):
+                if node not in parents:
+                    break
+                result[node] += total['sum']
+                node = parents[node]
+
+        return result
+
     @abstractmethod
     def update(self, obj: T) -> None:
         """ Обновить данные об объекте. Объект должен содержать поле pk. """
@@ -71,21 +198,76 @@ class AbstractRepository(ABC, Generic[T]):
     def delete(self, pk: int) -> None:
         """ Удалить запись """
 
+    def add_many(self, objs: list[T]) -> list[int]:
+        """
+        Добавить в репозиторий несколько объектов, вернуть их id
+        в порядке следования объектов, также записать id в атрибуты pk.
+        """
+        return [self.add(obj) for obj in objs]
+
+    def update_many(self, objs: list[T]) -> None:
+        """ Обновить данные о нескольких объектах. """
+        for obj in objs:
+            self.update(obj)
+
+    def delete_many(self, pks: list[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            self.delete(pk)
+
+    def transaction(self) -> ContextManager[Any]:
+        """
+        Получить контекстный менеджер транзакции (единицы работы).
+        По умолчанию атомарность не обеспечивается.
+        """
+        return nullcontext()
+
+    def close(self) -> None:
+        """ Освободить ресурсы, занятые репозиторием """
+
+    def __enter__(self: R) -> R:
+        return self
+
+    def __exit__(
+        self,
+        exc_type : type[BaseException] | None,
+        exc_val  : BaseException | None,
+        exc_tb   : TracebackType | None
+    ) -> None:
+        self.close()
+
+
+@contextmanager
+def transaction(*repos: AbstractRepository[Any]) -> Iterator[None]:
+    """
+    Единица работы, охватывающая несколько репозиториев: все изменения
+    внутри блока with фиксируются при выходе из него и откатываются
+    при исключении. Репозитории, работающие с одной базой данных,
+    разделяют одну транзакцию.
+    """
+    with ExitStack() as stack:
+        for repo in repos:
+            stack.enter_context(repo.transaction())
+        yield
+
 
 def repository_factory(
     repo_type : Any,
-    db_file   : str | None = None
+    db_file   : str | None = None,
+    **kwargs  : Any
 ) -> Callable[[Model], Any]:
     """
     Конкретная фабрика абстрактных репозиториев:
     больше абстракции богу абстракции!
+    Остальные аргументы kwargs передаются конструктору репозитория,
+    например профиль производительности SQLite (profile).
     """
 
     if db_file is None:
         def repo_gen_nofile(model: Model) -> Any:
-            return repo_type[model](cls=model)
+            return repo_type[model](cls=model, **kwargs)
         return repo_gen_nofile
 
     def repo_gen_withfile(model: Model) -> Any:
-        return repo_type[model](db_file=db_file, cls=model)
+        return repo_type[model](db_file=db_file, cls=model, **kwargs)
     return repo_gen_withfile
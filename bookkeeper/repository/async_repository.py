@@ -0,0 +1,308 @@
+"""
+Модуль описывает асинхронный интерфейс репозиториев для asyncio.
+
+Асинхронный репозиторий повторяет основные методы AbstractRepository
+в виде сопрограмм, так что цикл событий не блокируется на время работы
+с хранилищем:
+
+    async with AsyncSQLiteRepository(db_file, Expense) as repo:
+        pk   = await repo.add(Expense(100, 1))
+        exps = await repo.get_all({'category': 1})
+
+Реализации оборачивают синхронные репозитории: AsyncSQLiteRepository
+выполняет запросы в рабочем потоке SQLiteWorker, общем для всех
+репозиториев базы данных, а
+AsyncMemoryRepository, предназначенный для тестов, работает с данными
+в памяти прямо в цикле событий.
+"""
+
+import asyncio
+import os
+import threading
+
+from abc                import ABC, abstractmethod
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools          import partial
+from types              import TracebackType
+from typing             import Any, Callable, ClassVar, Generic, TypeVar
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.memory_repository   import MemoryRepository
+from bookkeeper.repository.query               import OrderBy
+from bookkeeper.repository.sqlite_connection   import PerformanceProfile
+from bookkeeper.repository.sqlite_repository   import SQLiteRepository
+
+# Result of a function called by a repository:
+V = TypeVar('V')
+
+# Database of a shared worker: (absolute path, performance profile)
+WorkerKey = tuple[str, PerformanceProfile | None]
+A = TypeVar('A', bound='AsyncAbstractRepository[Any]')
+
+
+class AsyncAbstractRepository(ABC, Generic[T]):
+    """
+    Абстрактный асинхронный репозиторий.
+    Абстрактные методы (сопрограммы):
+    add
+    get
+    get_all
+    update
+    delete
+
+    Методы имеют тот же смысл, что и в AbstractRepository. Массовые
+    операции add_many и delete_many по умолчанию выполняются поэлементно.
+    Ресурсы репозитория освобождаются сопрограммой close() или при выходе
+    из блока async with.
+    """
+
+    @abstractmethod
+    async def add(self, obj: T) -> int:
+        """
+        Добавить объект в репозиторий, вернуть id объекта,
+        также записать id в атрибут pk.
+        """
+
+    @abstractmethod
+    async def get(self, pk: int) -> T | None:
+        """ Получить объект по id """
+
+    @abstractmethod
+    async def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
+        """ Получить все записи по некоторому условию (см. AbstractRepository) """
+
+    @abstractmethod
+    async def update(self, obj: T) -> None:
+        """ Обновить данные об объекте. Объект должен содержать поле pk. """
+
+    @abstractmethod
+    async def delete(self, pk: int) -> None:
+        """ Удалить запись """
+
+    async def add_many(self, objs: list[T]) -> list[int]:
+        """ Добавить в репозиторий несколько объектов, вернуть их id """
+        return [await self.add(obj) for obj in objs]
+
+    async def delete_many(self, pks: list[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            await self.delete(pk)
+
+    async def close(self) -> None:
+        """ Освободить ресурсы, занятые репозиторием """
+
+    async def __aenter__(self: A) -> A:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type : type[BaseException] | None,
+        exc_val  : BaseException | None,
+        exc_tb   : TracebackType | None
+    ) -> None:
+        await self.close()
+
+
+class AsyncRepositoryAdapter(AsyncAbstractRepository[T]):
+    """
+    Асинхронный репозиторий поверх синхронного репозитория repo.
+    Методы repo выполняются исполнителем executor, а если он не задан -
+    прямо в цикле событий.
+    """
+
+    def __init__(
+        self,
+        repo     : AbstractRepository[T],
+        executor : Executor | None = None
+    ) -> None:
+        # Type annotations:
+        self.repo     : AbstractRepository[T]  # Wrapped repository
+        self.executor : Executor | None        # Executor of the calls
+
+        # Initialization:
+        self.repo     = repo
+        self.executor = executor
+
+    async def _run(self, func: Callable[..., V], *args: Any, **kwargs: Any) -> V:
+        """ Выполнить func(*args, **kwargs) исполнителем репозитория """
+        if self.executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def call(self, func: Callable[[AbstractRepository[T]], V]) -> V:
+        """
+        Выполнить func(repo) с синхронным репозиторием целиком, например
+        несколько изменений в одной транзакции или запрос, для которого
+        нет асинхронного метода:
+            await repo.call(lambda repo: repo.get_page('expense_date', 50))
+        """
+        return await self._run(func, self.repo)
+
+    async def add(self, obj: T) -> int:
+        return await self._run(self.repo.add, obj)
+
+    async def add_many(self, objs: list[T]) -> list[int]:
+        return await self._run(self.repo.add_many, objs)
+
+    async def get(self, pk: int) -> T | None:
+        return await self._run(self.repo.get, pk)
+
+    async def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
+        return await self._run(self.repo.get_all, where,
+                               order_by=order_by, limit=limit, offset=offset)
+
+    async def update(self, obj: T) -> None:
+        await self._run(self.repo.update, obj)
+
+    async def delete(self, pk: int) -> None:
+        await self._run(self.repo.delete, pk)
+
+    async def delete_many(self, pks: list[int]) -> None:
+        await self._run(self.repo.delete_many, pks)
+
+    async def close(self) -> None:
+        await self._run(self.repo.close)
+
+
+class AsyncMemoryRepository(AsyncRepositoryAdapter[T]):
+    """
+    Асинхронный репозиторий в оперативной памяти (MemoryRepository).
+    Операции выполняются сразу, без переключения потоков.
+    """
+
+    def __init__(self, cls: type | None = None) -> None:
+        super().__init__(MemoryRepository(cls=cls))
+
+
+class SQLiteWorker:
+    """
+    Рабочий поток для запросов к БД SQLite. Все запросы выполняются
+    по очереди в одном потоке, а значит на одном соединении пула:
+    записи упорядочены и не соперничают за блокировку базы данных.
+    Один рабочий поток может обслуживать все репозитории базы данных.
+
+    Общий рабочий поток базы данных (shared) ведет счетчик пользователей:
+    каждый пользователь освобождает его вызовом release(), а поток
+    останавливается, когда его освободит последний из них.
+    """
+
+    _shared      : ClassVar[dict[WorkerKey, 'SQLiteWorker']] = {}
+    _shared_lock : ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self) -> None:
+        # Type annotations:
+        self.executor : ThreadPoolExecutor  # The single thread
+        self.users    : int                 # Users of the shared worker
+        self.key      : WorkerKey | None    # Database of the shared worker
+
+        # Initialization:
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix="bookkeeper-sqlite")
+        self.users    = 0
+        self.key      = None
+
+    @classmethod
+    def shared(
+        cls,
+        db_file : str,
+        profile : PerformanceProfile | None = None
+    ) -> 'SQLiteWorker':
+        """
+        Получить общий рабочий поток для файла db_file и профиля profile,
+        как и общий пул соединений (SQLiteConnectionPool.shared).
+        Полученный поток должен быть освобожден вызовом release().
+        """
+        key = (os.path.abspath(db_file), profile)
+
+        with cls._shared_lock:
+            worker = cls._shared.get(key)
+            if worker is None:
+                worker     = cls()
+                worker.key = key
+                cls._shared[key] = worker
+            worker.users += 1
+
+        return worker
+
+    def release(self) -> None:
+        """
+        Освободить общий рабочий поток. Когда его освобождает последний
+        пользователь, поток останавливается, а следующий вызов shared()
+        создаст новый.
+        """
+        with self._shared_lock:
+            self.users = max(self.users - 1, 0)
+            if self.users != 0:
+                return
+            if self.key is not None:
+                self._shared.pop(self.key, None)
+
+        self.close()
+
+    def submit(self, func: Callable[..., V], *args: Any, **kwargs: Any) -> Future[V]:
+        """ Поставить выполнение func(*args, **kwargs) в очередь потока """
+        return self.executor.submit(func, *args, **kwargs)
+
+    def close(self) -> None:
+        """ Дождаться выполнения запросов и остановить поток """
+        self.executor.shutdown(wait=True)
+
+
+class AsyncSQLiteRepository(AsyncRepositoryAdapter[T]):
+    """
+    Асинхронный репозиторий, основанный на БД SQLite (SQLiteRepository).
+    Запросы выполняются рабочим потоком worker; если он не задан,
+    используется общий рабочий поток базы данных (SQLiteWorker.shared),
+    который освобождается при закрытии репозитория. Поэтому все
+    репозитории одной базы данных по умолчанию пишут из одного потока.
+    Репозитории с общим рабочим потоком используют одно соединение,
+    а значит и общие транзакции внутри call().
+    """
+
+    def __init__(
+        self,
+        db_file : str,
+        cls     : type,
+        profile : PerformanceProfile | None = None,
+        worker  : SQLiteWorker | None = None
+    ) -> None:
+        # Type annotations:
+        self.worker     : SQLiteWorker  # Thread running the queries
+        self.shared     : bool          # The shared worker is to be released
+
+        # Initialization:
+        self.shared = worker is None
+        self.worker = worker or SQLiteWorker.shared(db_file, profile)
+
+        # The table is created by the worker's connection as well:
+        try:
+            repo: SQLiteRepository[T] = self.worker.submit(
+                SQLiteRepository, db_file=db_file, cls=cls, profile=profile).result()
+        except BaseException:
+            if self.shared:
+                self.worker.release()
+            raise
+        super().__init__(repo, self.worker.executor)
+
+    async def close(self) -> None:
+        # The repository releases it's reference to the shared pool, the
+        # connections are closed with the last repository of the database:
+        await super().close()
+        if self.shared:
+            self.shared = False
+            self.worker.release()
@@ -0,0 +1,245 @@
+"""
+Модуль описывает кэширующий репозиторий - обертку над любым репозиторием.
+
+Обертка ведет карту идентичности (identity map) полученных объектов
+с вытеснением давно не используемых (LRU), и запоминает результаты
+запросов get_all. Пока объект находится в карте, все методы чтения
+возвращают один и тот же его экземпляр. Запись сквозная (write-through): изменения сначала
+применяются к основному репозиторию, затем к кэшу. Любое изменение
+сбрасывает запомненные результаты запросов, а откат транзакции - весь кэш.
+"""
+
+from collections import OrderedDict
+from contextlib  import contextmanager
+from typing      import Any, Hashable, Iterator
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.query               import OrderBy
+
+# Query key: (where, order_by, limit, offset) in a hashable form
+QueryKey = tuple[Hashable, ...]
+
+
+class CachedRepository(AbstractRepository[T]):
+    """
+    Кэширующая обертка над репозиторием repo.
+    max_objects - число объектов в карте идентичности,
+    max_queries - число запомненных результатов get_all.
+    Счетчики hits и misses учитывают обращения к кэшу из get и get_all.
+    Изменения, сделанные в обход обертки, кэш не отслеживает.
+    """
+
+    def __init__(
+        self,
+        repo        : AbstractRepository[T],
+        max_objects : int = 1024,
+        max_queries : int = 128
+    ) -> None:
+        # Type annotations:
+        self.repo        : AbstractRepository[T]           # Backing repository
+        self.max_objects : int                             # Identity map capacity
+        self.max_queries : int                             # Query cache capacity
+        self.hits        : int                             # Cache hits counter
+        self.misses      : int                             # Cache misses counter
+        self._objects    : OrderedDict[int, T]             # Identity map
+        self._queries    : OrderedDict[QueryKey, list[T]]  # get_all results
+
+        # Initialization:
+        self.repo        = repo
+        self.max_objects = max_objects
+        self.max_queries = max_queries
+        self.hits        = 0
+        self.misses      = 0
+        self._objects    = OrderedDict()
+        self._queries    = OrderedDict()
+
+    def _remember(self, obj: T) -> None:
+        """ Поместить объект в карту идентичности, вытеснив самый старый """
+        self._objects[obj.pk] = obj
+        self._objects.move_to_end(obj.pk)
+        if len(self._objects) > self.max_objects:
+            self._objects.popitem(last=False)
+
+    def _intern(self, objs: list[T]) -> list[T]:
+        """
+        Поместить полученные объекты в карту идентичности, заменив
+        уже известные объекты их экземплярами из карты.
+        """
+        result = []
+        for obj in objs:
+            known = self._objects.get(obj.pk)
+            if known is None:
+                self._remember(obj)
+            else:
+                self._objects.move_to_end(obj.pk)
+                obj = known
+            result.append(obj)
+        return result
+
+    def invalidate(self) -> None:
+        """ Сбросить весь кэш """
+        self._objects.clear()
+        self._queries.clear()
+
+    def add(self, obj: T) -> int:
+        pk = self.repo.add(obj)
+        self._queries.clear()
+        self._remember(obj)
+        return pk
+
+    def add_many(self, objs: list[T]) -> list[int]:
+        pks = self.repo.add_many(objs)
+        self._queries.clear()
+        for obj in objs:
+            self._remember(obj)
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        obj = self._objects.get(pk)
+        if obj is not None:
+            self.hits += 1
+            self._objects.move_to_end(pk)
+            return obj
+
+        self.misses += 1
+        obj = self.repo.get(pk)
+        if obj is not None:
+            self._remember(obj)
+        return obj
+
+    def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
+        key = query_key(where, order_by, limit, offset)
+        if key is None:
+            return self._intern(self.repo.get_all(where, order_by=order_by,
+                                                  limit=limit, offset=offset))
+
+        result = self._queries.get(key)
+        if result is not None:
+            self.hits += 1
+            self._queries.move_to_end(key)
+            return list(result)
+
+        self.misses += 1
+        result = self._intern(self.repo.get_all(where, order_by=order_by,
+                                                limit=limit, offset=offset))
+        self._queries[key] = result
+        if len(self._queries) > self.max_queries:
+            self._queries.popitem(last=False)
+        return list(result)
+
+    def iter_all(
+        self,
+        where      : dict[str, Any] | None = None,
+        *,
+        order_by   : OrderBy | None = None,
+        batch_size : int = 1000
+    ) -> Iterator[T]:
+        # Serve the stream from a remembered result, but never remember a stream:
+        key = query_key(where, order_by, None, None)
+        result = None if key is None else self._queries.get(key)
+        if result is not None:
+            self.hits += 1
+            yield from list(result)
+        else:
+            yield from self.repo.iter_all(where, order_by=order_by, batch_size=batch_size)
+
+    def get_page(
+        self,
+        key        : str,
+        limit      : int,
+        after      : tuple[Any, int] | None = None,
+        *,
+        descending : bool = False,
+        where      : dict[str, Any] | None = None
+    ) -> list[T]:
+        return self._intern(self.repo.get_page(key, limit, after,
+                                               descending=descending, where=where))
+
+    def aggregate(
+        self,
+        where        : dict[str, Any] | None = None,
+        group_by     : str | None = None,
+        **aggregates : str
+    ) -> dict[Any, Any]:
+        return self.repo.aggregate(where, group_by, **aggregates)
+
+    def rollup(
+        self,
+        records      : AbstractRepository[Any],
+        ref_field    : str,
+        value_field  : str,
+        where        : dict[str, Any] | None = None,
+        parent_field : str = 'parent'
+    ) -> dict[int, Any]:
+        # The backing repositories may compute it in one query:
+        if isinstance(records, CachedRepository):
+            records = records.repo
+        return self.repo.rollup(records, ref_field, value_field, where, parent_field)
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
+        return self.repo.get_all_by_pattern(patterns)
+
+    def update(self, obj: T) -> None:
+        self.repo.update(obj)
+        self._queries.clear()
+        self._remember(obj)
+
+    def update_many(self, objs: list[T]) -> None:
+        self.repo.update_many(objs)
+        self._queries.clear()
+        for obj in objs:
+            self._remember(obj)
+
+    def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+        self._queries.clear()
+        self._objects.pop(pk, None)
+
+    def delete_many(self, pks: list[int]) -> None:
+        self.repo.delete_many(pks)
+        self._queries.clear()
+        for pk in pks:
+            self._objects.pop(pk, None)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        try:
+            with self.repo.transaction():
+                yield
+        except BaseException:
+            # Cached objects may refer to the rolled back changes:
+            self.invalidate()
+            raise
+
+    def close(self) -> None:
+        self.invalidate()
+        self.repo.close()
+
+
+def query_key(
+    where    : dict[str, Any] | None,
+    order_by : OrderBy | None,
+    limit    : int | None,
+    offset   : int | None
+) -> QueryKey | None:
+    """
+    Получить ключ запроса для кэша или None, если условие
+    содержит нехешируемые значения.
+    """
+    if order_by is not None and not isinstance(order_by, str):
+        order_by = tuple(order_by)
+
+    where_key = None if where is None else tuple(sorted(where.items()))
+    key       = (where_key, order_by, limit, offset)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
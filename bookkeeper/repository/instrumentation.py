@@ -0,0 +1,377 @@
+"""
+Модуль описывает инструменты измерения работы репозиториев.
+
+Статистика RepositoryStats собирает число вызовов, гистограмму времени
+выполнения и число возвращенных записей по каждому методу репозитория
+и по каждому тексту SQL-запроса:
+
+    stats = RepositoryStats(slow_threshold=0.05)
+    sqlite_repo = SQLiteRepository(db_file, Expense)
+    sqlite_repo.pool.instrument(stats)              # SQL-запросы к базе данных
+    repo = InstrumentedRepository(sqlite_repo, stats, 'Expense')
+    with stats.flow('add_expense'):                 # одна операция презентера
+        bookkeeper.add_expense(...)
+    print(stats.summary())
+
+Измерение включается явно: обертка InstrumentedRepository подходит для
+любого репозитория, а запросы SQLite замеряются пулом соединений после
+вызова SQLiteConnectionPool.instrument(). Фабрика instrument_factory
+включает и то, и другое для всех репозиториев приложения. Вызовы и запросы,
+выполняющиеся дольше slow_threshold секунд, записываются в журнал logging
+с именем "bookkeeper.repository.slow".
+"""
+
+import logging
+
+from bisect      import bisect_left
+from contextlib  import contextmanager
+from dataclasses import dataclass, field
+from time        import perf_counter
+from typing      import Any, Callable, ClassVar, ContextManager, Iterator
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.query               import OrderBy
+
+# Log of the slow calls and queries:
+slow_log = logging.getLogger("bookkeeper.repository.slow")
+
+
+@dataclass
+class Histogram:
+    """
+    Гистограмма времени выполнения: число замеров в каждом из интервалов
+    (0, 1 мкс], (1 мкс, 10 мкс], ... (0.1 с, 1 с], (1 с, +inf).
+    """
+    BOUNDS : ClassVar[tuple[float, ...]] = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+    LABELS : ClassVar[tuple[str, ...]]   = ("1us", "10us", "100us", "1ms",
+                                            "10ms", "100ms", "1s", "inf")
+
+    counts : list[int] = field(default_factory=lambda: [0] * len(Histogram.LABELS))
+
+    def add(self, seconds: float) -> None:
+        """ Учесть замер длительностью seconds """
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+
+    def as_dict(self) -> dict[str, int]:
+        """ Получить непустые интервалы в виде {верхняя граница: число замеров} """
+        return {label: num for label, num in zip(self.LABELS, self.counts) if num}
+
+
+@dataclass
+class OperationStats:
+    """
+    Статистика одной операции: число вызовов, суммарное и наибольшее время
+    выполнения в секундах, число возвращенных записей и гистограмма времени.
+    """
+    calls     : int       = 0
+    total     : float     = 0.0
+    max       : float     = 0.0
+    rows      : int       = 0
+    histogram : Histogram = field(default_factory=Histogram)
+
+    def add(self, seconds: float, rows: int = 0) -> None:
+        """ Учесть вызов длительностью seconds, вернувший rows записей """
+        self.calls += 1
+        self.total += seconds
+        self.max    = max(self.max, seconds)
+        self.rows  += rows
+        self.histogram.add(seconds)
+
+    def as_dict(self) -> dict[str, Any]:
+        """ Получить статистику в виде словаря для вывода в JSON """
+        return {"calls": self.calls, "total": self.total, "max": self.max,
+                "rows": self.rows, "histogram": self.histogram.as_dict()}
+
+
+@dataclass
+class FlowStats(OperationStats):
+    """
+    Статистика операции, выделенной блоком RepositoryStats.flow(): кроме
+    числа выполнений блока и времени их выполнения, число вызовов методов
+    репозиториев (methods) и SQL-запросов (queries) внутри блока и число
+    возвращенных ими записей (rows).
+    """
+    methods : int = 0
+    queries : int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**super().as_dict(), "methods": self.methods, "queries": self.queries}
+
+
+class RepositoryStats:
+    """
+    Статистика работы репозиториев: по методам (methods, ключ -
+    "<репозиторий>.<метод>"), по текстам SQL-запросов (queries) и по
+    операциям, выделенным блоками flow() (flows, ключ - название операции).
+    slow_threshold - порог в секундах, начиная с которого вызовы и запросы
+    записываются в журнал медленных операций, None - не записываются.
+    """
+
+    def __init__(self, slow_threshold: float | None = None) -> None:
+        # Type annotations:
+        self.slow_threshold : float | None               # Slow log threshold, s
+        self.methods        : dict[str, OperationStats]  # Repository methods
+        self.queries        : dict[str, OperationStats]  # SQL query texts
+        self.flows          : dict[str, FlowStats]       # Operations of flow()
+        self._flows         : list[str]                  # Active flow() blocks
+
+        # Initialization:
+        self.slow_threshold = slow_threshold
+        self._flows         = []
+        self.reset()
+
+    def reset(self) -> None:
+        """ Сбросить собранную статистику """
+        self.methods = {}
+        self.queries = {}
+        self.flows   = {}
+
+    def record_call(self, method: str, seconds: float, rows: int = 0) -> None:
+        """ Учесть вызов метода репозитория """
+        self._record(self.methods, method, seconds, rows)
+        for flow in self._active_flows():
+            flow.methods += 1
+
+    def record_query(self, sql: str, seconds: float, rows: int = 0) -> None:
+        """ Учесть выполнение SQL-запроса """
+        self._record(self.queries, " ".join(sql.split()), seconds, rows)
+        for flow in self._active_flows():
+            flow.queries += 1
+
+    def _record(
+        self,
+        table   : dict[str, OperationStats],
+        key     : str,
+        seconds : float,
+        rows    : int
+    ) -> None:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = OperationStats()
+        stats.add(seconds, rows)
+
+        for flow in self._active_flows():
+            flow.rows += rows
+
+        if self.slow_threshold is not None and seconds >= self.slow_threshold:
+            slow_log.warning("%.1f ms, %d rows: %s", seconds * 1000, rows, key)
+
+    def _active_flows(self) -> list[FlowStats]:
+        """ Получить статистику операций, выполняющихся в данный момент """
+        return [self.flows.setdefault(name, FlowStats()) for name in self._flows]
+
+    @contextmanager
+    def flow(self, name: str) -> Iterator[None]:
+        """
+        Выделить операцию name (например, обработчик презентера): время
+        выполнения блока и число вызовов и запросов внутри него учитываются
+        в flows[name]. Блоки с разными названиями могут быть вложенными.
+        """
+        # Calls and queries inside the block are counted by record_call/record_query:
+        self._flows.append(name)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._flows.remove(name)
+            self.flows.setdefault(name, FlowStats()).add(perf_counter() - start)
+
+    def as_dict(self) -> dict[str, Any]:
+        """ Получить всю статистику в виде словаря для вывода в JSON """
+        return {name: {key: stats.as_dict() for key, stats in table.items()}
+                for name, table in (("methods", self.methods),
+                                    ("queries", self.queries),
+                                    ("flows",   self.flows))}
+
+    def summary(self, limit: int = 10) -> str:
+        """
+        Получить текстовый отчет: по limit методов, запросов и операций
+        с наибольшим суммарным временем выполнения.
+        """
+        lines = []
+        for name, table in (("methods", self.methods),
+                            ("queries", self.queries),
+                            ("flows",   self.flows)):
+            lines.append(f"{name}:")
+            ranked = sorted(table.items(), key=lambda item: item[1].total, reverse=True)
+            for key, stats in ranked[:limit]:
+                line = (f"  {stats.total * 1000:10.2f} ms {stats.calls:8} calls "
+                        f"{stats.rows:8} rows")
+                if isinstance(stats, FlowStats):
+                    line += f" {stats.methods:8} methods {stats.queries:8} queries"
+                lines.append(f"{line}  {key}")
+        return "\n".join(lines)
+
+
+class InstrumentedRepository(AbstractRepository[T]):
+    """
+    Обертка над репозиторием repo, учитывающая в статистике stats каждый
+    вызов его методов: время выполнения и число возвращенных записей.
+    Время перебора iter_all учитывается по мере получения записей.
+    name - название репозитория в статистике, по умолчанию - имя класса
+    обертываемого репозитория.
+    """
+
+    def __init__(
+        self,
+        repo  : AbstractRepository[T],
+        stats : RepositoryStats | None = None,
+        name  : str | None = None
+    ) -> None:
+        # Type annotations:
+        self.repo  : AbstractRepository[T]  # Measured repository
+        self.stats : RepositoryStats        # Collected statistics
+        self.name  : str                    # Name of the repository in stats
+
+        # Initialization:
+        self.repo  = repo
+        self.stats = RepositoryStats() if stats is None else stats
+        self.name  = type(repo).__name__ if name is None else name
+
+    def _timed(
+        self,
+        method   : str,
+        func     : Callable[..., Any],
+        *args    : Any,
+        **kwargs : Any
+    ) -> Any:
+        """ Вызвать func, учтя время и число возвращенных записей """
+        start   = perf_counter()
+        result  = func(*args, **kwargs)
+        seconds = perf_counter() - start
+
+        if isinstance(result, (list, dict)):
+            rows = len(result)
+        else:
+            rows = 0 if result is None else 1
+        self.stats.record_call(f"{self.name}.{method}", seconds, rows)
+        return result
+
+    def add(self, obj: T) -> int:
+        return int(self._timed('add', self.repo.add, obj))
+
+    def add_many(self, objs: list[T]) -> list[int]:
+        pks: list[int] = self._timed('add_many', self.repo.add_many, objs)
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        obj: T | None = self._timed('get', self.repo.get, pk)
+        return obj
+
+    def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
+        objs: list[T] = self._timed('get_all', self.repo.get_all, where,
+                                    order_by=order_by, limit=limit, offset=offset)
+        return objs
+
+    def iter_all(
+        self,
+        where      : dict[str, Any] | None = None,
+        *,
+        order_by   : OrderBy | None = None,
+        batch_size : int = 1000
+    ) -> Iterator[T]:
+        # Only the time spent getting the records is counted:
+        seconds = 0.0
+        rows    = 0
+        objs    = self.repo.iter_all(where, order_by=order_by, batch_size=batch_size)
+        try:
+            while True:
+                start = perf_counter()
+                obj   = next(objs, None)
+                seconds += perf_counter() - start
+                if obj is None:
+                    break
+                rows += 1
+                yield obj
+        finally:
+            self.stats.record_call(f"{self.name}.iter_all", seconds, rows)
+
+    def get_page(
+        self,
+        key        : str,
+        limit      : int,
+        after      : tuple[Any, int] | None = None,
+        *,
+        descending : bool = False,
+        where      : dict[str, Any] | None = None
+    ) -> list[T]:
+        objs: list[T] = self._timed('get_page', self.repo.get_page, key, limit, after,
+                                    descending=descending, where=where)
+        return objs
+
+    def aggregate(
+        self,
+        where        : dict[str, Any] | None = None,
+        group_by     : str | None = None,
+        **aggregates : str
+    ) -> dict[Any, Any]:
+        result: dict[Any, Any] = self._timed('aggregate', self.repo.aggregate,
+                                             where, group_by, **aggregates)
+        return result
+
+    def rollup(
+        self,
+        records      : AbstractRepository[Any],
+        ref_field    : str,
+        value_field  : str,
+        where        : dict[str, Any] | None = None,
+        parent_field : str = 'parent'
+    ) -> dict[int, Any]:
+        # The wrapped repositories may compute it in one query:
+        if isinstance(records, InstrumentedRepository):
+            records = records.repo
+        result: dict[int, Any] = self._timed('rollup', self.repo.rollup, records,
+                                             ref_field, value_field, where, parent_field)
+        return result
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
+        objs: list[T] = self._timed('get_all_by_pattern', self.repo.get_all_by_pattern,
+                                    patterns)
+        return objs
+
+    def update(self, obj: T) -> None:
+        self._timed('update', self.repo.update, obj)
+
+    def update_many(self, objs: list[T]) -> None:
+        self._timed('update_many', self.repo.update_many, objs)
+
+    def delete(self, pk: int) -> None:
+        self._timed('delete', self.repo.delete, pk)
+
+    def delete_many(self, pks: list[int]) -> None:
+        self._timed('delete_many', self.repo.delete_many, pks)
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.repo.transaction()
+
+    def close(self) -> None:
+        self.repo.close()
+
+
+def instrument_factory(
+    repository_factory : Callable[[Any], AbstractRepository[Any]],
+    stats              : RepositoryStats
+) -> Callable[[Any], AbstractRepository[Any]]:
+    """
+    Обернуть фабрику репозиториев: каждый созданный ею репозиторий
+    измеряется оберткой InstrumentedRepository с названием модели,
+    а запросы репозиториев SQLite - их пулом соединений.
+    """
+    def repo_gen(model: Any) -> AbstractRepository[Any]:
+        repo = repository_factory(model)
+
+        # The pool may be hidden by a caching wrapper:
+        inner = getattr(repo, 'repo', repo)
+        pool  = getattr(repo, 'pool', None) or getattr(inner, 'pool', None)
+        if pool is not None:
+            pool.instrument(stats)
+
+        return InstrumentedRepository(repo, stats, model.__name__)
+    return repo_gen
@@ -2,46 +2,384 @@
 Модуль описывает репозиторий, работающий в оперативной памяти
 """
 
-from itertools import count
-from typing import Any
+from bisect      import bisect_left, bisect_right
+from contextlib  import contextmanager
+from datetime    import date
+from itertools   import count, islice
+from operator    import itemgetter
+from typing      import Any, Callable, Iterable, Iterator, Sequence, get_args
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.query               import (
+    AllOf, Between, Compare, Condition, In, OrderBy,
+    apply, as_condition, contains, matches, compute_aggregates)
 
 
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+
+    Для полей из indexes (по умолчанию - из INDEXES класса cls) ведутся
+    хеш-индексы {значение: множество pk}: условия на равенство и вхождение
+    в набор значений по этим полям (и по pk) выбирают объекты через индекс,
+    а не перебором всего контейнера. Для полей из sorted_indexes (по
+    умолчанию - индексируемых полей с типом даты) ведутся упорядоченные
+    индексы: сравнения и отрезки по ним находятся двоичным поиском
+    за O(log n + k), а страницы get_page по этим полям - за O(log n + limit).
+    Индексы хранят значения полей на момент последнего add/update.
+
+    Внутри блока transaction() все изменения записываются в журнал и
+    отменяются при исключении. Журнал хранит сами объекты, поэтому
+    изменения атрибутов объектов, сделанные в обход репозитория,
+    не откатываются.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cls            : type | None = None,
+        indexes        : Sequence[str] | None = None,
+        sorted_indexes : Sequence[str] | None = None
+    ) -> None:
+        if indexes is None:
+            # Composite indexes are served by their leading field:
+            indexes = [index if isinstance(index, str) else index[0]
+                       for index in getattr(cls, 'INDEXES', ())]
+        if sorted_indexes is None:
+            annotations = getattr(cls, '__annotations__', {})
+            sorted_indexes = [attr for attr in indexes
+                              if is_date_type(annotations.get(attr))]
+
         self._container: dict[int, T] = {}
         self._counter = count(1)
+        self._undo_log: list[tuple[int, T | None]] | None = None
+
+        # Hash indexes, sorted indexes and indexed values of every stored object:
+        self._hash_fields   = tuple(dict.fromkeys(indexes))
+        self._sorted_fields = tuple(dict.fromkeys(sorted_indexes))
+        self._index_fields  = tuple(dict.fromkeys([*indexes, *sorted_indexes]))
+        self._indexes: dict[str, dict[Any, set[int]]] = {}
+        self._sorted: dict[str, list[tuple[Any, int]]] = {}
+        self._unsorted: set[str] = set()
+        self._index_keys: dict[int, dict[str, Any]] = {}
+        self._reindex()
+
+    def _index(self, pk: int, obj: T) -> None:
+        """ Внести объект в индексы """
+        keys = {attr: getattr(obj, attr) for attr in self._index_fields}
+        for attr in self._hash_fields:
+            self._indexes[attr].setdefault(keys[attr], set()).add(pk)
+        for attr in self._sorted_fields:
+            # None never satisfies a range condition, so it is not stored.
+            # Entries out of order are sorted lazily on the next lookup,
+            # so bulk loads cost O(n log n) instead of O(n) per insertion:
+            if keys[attr] is not None:
+                entries = self._sorted[attr]
+                entries.append((keys[attr], pk))
+                if len(entries) > 1 and entries[-2] > entries[-1]:
+                    self._unsorted.add(attr)
+        self._index_keys[pk] = keys
+
+    def _unindex(self, pk: int) -> None:
+        """ Удалить объект из индексов """
+        keys = self._index_keys.pop(pk, None)
+        if keys is None:
+            return
+        for attr in self._hash_fields:
+            pks = self._indexes[attr][keys[attr]]
+            pks.discard(pk)
+            if not pks:
+                del self._indexes[attr][keys[attr]]
+        for attr in self._sorted_fields:
+            if keys[attr] is not None:
+                entries = self._sorted_entries(attr)
+                del entries[bisect_left(entries, (keys[attr], pk))]
+
+    def _sorted_entries(self, attr: str) -> list[tuple[Any, int]]:
+        """ Получить упорядоченный индекс поля attr, досортировав его """
+        entries = self._sorted[attr]
+        if attr in self._unsorted:
+            entries.sort()
+            self._unsorted.discard(attr)
+        return entries
+
+    def _reindex(self) -> None:
+        """ Перестроить индексы по содержимому контейнера """
+        self._indexes = {attr: {} for attr in self._hash_fields}
+        self._sorted = {attr: [] for attr in self._sorted_fields}
+        self._unsorted = set()
+        self._index_keys = {}
+        for pk, obj in self._container.items():
+            self._index(pk, obj)
+
+    def _put(self, pk: int, obj: T) -> None:
+        """ Записать объект в контейнер, сохранив в журнал прежнее значение """
+        if self._undo_log is not None:
+            self._undo_log.append((pk, self._container.get(pk)))
+        self._container[pk] = obj
+        if self._index_fields:
+            self._unindex(pk)
+            self._index(pk, obj)
+
+    def _remove(self, pk: int) -> None:
+        """ Удалить объект из контейнера, сохранив его в журнал """
+        obj = self._container.pop(pk)
+        if self._undo_log is not None:
+            self._undo_log.append((pk, obj))
+        if self._index_fields:
+            self._unindex(pk)
+
+    def _select(self, where: dict[str, Any] | None) -> Iterable[T]:
+        """
+        Выбрать объекты-кандидаты для условия where: через наиболее
+        избирательный из подходящих индексов, а если такого нет - все.
+        Кандидаты идут в порядке pk и должны быть отфильтрованы по where.
+        """
+        best: set[int] | None = None
+        for attr, value in (where or {}).items():
+            pks = self._lookup(attr, as_condition(value))
+            if pks is not None and (best is None or len(pks) < len(best)):
+                best = pks
+
+        if best is None:
+            return self._container.values()
+        return [self._container[pk] for pk in sorted(best)]
+
+    def _lookup(self, attr: str, cond: Condition) -> set[int] | None:
+        """
+        Найти по индексу pk объектов, поле attr которых может удовлетворять
+        условию cond, или None, если индекс для этого неприменим.
+        """
+        if isinstance(cond, Compare) and cond.op == '=':
+            keys: tuple[Any, ...] = (cond.value,)
+        elif isinstance(cond, In):
+            keys = cond.values
+        else:
+            return self._lookup_range(attr, cond)
+
+        if attr == 'pk':
+            return {key for key in keys if key in self._container}
+        index = self._indexes.get(attr)
+        if index is None:
+            return self._lookup_range(attr, cond)
+        return set().union(*(index.get(key, ()) for key in keys))
+
+    def _lookup_range(self, attr: str, cond: Condition) -> set[int] | None:
+        """
+        Найти по упорядоченному индексу pk объектов, поле attr которых
+        попадает в диапазон значений условия cond, или None, если индекс
+        для этого неприменим.
+        """
+        if attr not in self._sorted:
+            return None
+
+        bounds = range_bounds(cond)
+        if bounds is None:
+            return None
+
+        entries = self._sorted_entries(attr)
+
+        (low, low_strict), (high, high_strict) = bounds
+        start, stop = 0, len(entries)
+        if low is not None:
+            find  = bisect_right if low_strict else bisect_left
+            start = find(entries, low, key=itemgetter(0))
+        if high is not None:
+            find = bisect_left if high_strict else bisect_right
+            stop = find(entries, high, key=itemgetter(0))
+        return {pk for _, pk in entries[start:stop]}
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'Trying to add object {obj} with filled `pk` attribute')
         pk = next(self._counter)
-        self._container[pk] = obj
+        self._put(pk, obj)
         obj.pk = pk
         return pk
 
+    def add_many(self, objs: list[T]) -> list[int]:
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'Trying to add object {obj} with filled `pk` attribute')
+
+        pks = []
+        for obj in objs:
+            pk = next(self._counter)
+            self._put(pk, obj)
+            obj.pk = pk
+            pks.append(pk)
+        return pks
+
     def get(self, pk: int) -> T | None:
         return self._container.get(pk)
 
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
-        if where is None:
+    def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
+        if where is None and order_by is None and limit is None and offset is None:
             return list(self._container.values())
-        return [obj for obj in self._container.values()
-                if all(getattr(obj, attr) == value for attr, value in where.items())]
+        return apply(self._select(where), where, order_by, limit, offset)
+
+    def iter_all(
+        self,
+        where      : dict[str, Any] | None = None,
+        *,
+        order_by   : OrderBy | None = None,
+        batch_size : int = 1000
+    ) -> Iterator[T]:
+        # Objects are already in memory, so unordered selection is lazy.
+        # The repository must not be changed during the iteration:
+        if order_by is not None:
+            yield from apply(self._select(where), where, order_by)
+        elif where is None:
+            yield from self._container.values()
+        else:
+            yield from (obj for obj in self._select(where) if matches(obj, where))
+
+    def get_page(
+        self,
+        key        : str,
+        limit      : int,
+        after      : tuple[Any, int] | None = None,
+        *,
+        descending : bool = False,
+        where      : dict[str, Any] | None = None
+    ) -> list[T]:
+        if key not in self._sorted:
+            return super().get_page(key, limit, after, descending=descending, where=where)
+
+        # Entries of a sorted index are already ordered by (value, pk),
+        # so the page starts right after the cursor found by bisection:
+        entries = self._sorted_entries(key)
+        if descending:
+            stop = len(entries) if after is None else bisect_left(entries, after)
+            positions = range(stop - 1, -1, -1)
+        else:
+            start = 0 if after is None else bisect_right(entries, after)
+            positions = range(start, len(entries))
+
+        objs = (self._container[entries[i][1]] for i in positions)
+        if where:
+            objs = (obj for obj in objs if matches(obj, where))
+        return list(islice(objs, limit))
+
+    def aggregate(
+        self,
+        where        : dict[str, Any] | None = None,
+        group_by     : str | None = None,
+        **aggregates : str
+    ) -> dict[Any, Any]:
+        # Aggregate in one pass without materializing the selection:
+        objs: Iterable[T] = self._container.values()
+        if where is not None:
+            objs = (obj for obj in self._select(where) if matches(obj, where))
+        return compute_aggregates(objs, group_by, aggregates)
 
     def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
-        return [obj for obj in self._container.values()
-                if all(value in getattr(obj, attr) for attr, value in patterns.items())]
+        return self.get_all({attr: contains(value) for attr, value in patterns.items()})
 
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('Attempt to update object with unknown primary key')
-        self._container[obj.pk] = obj
+        self._put(obj.pk, obj)
+
+    def update_many(self, objs: list[T]) -> None:
+        if any(obj.pk == 0 for obj in objs):
+            raise ValueError('Attempt to update object with unknown primary key')
+        for obj in objs:
+            self._put(obj.pk, obj)
 
     def delete(self, pk: int) -> None:
-        self._container.pop(pk)
+        self._remove(pk)
+
+    def delete_many(self, pks: list[int]) -> None:
+        # Check all the keys first to leave the repository intact on error,
+        # a repeated key fails as in SQLiteRepository:
+        if len(set(pks)) != len(pks):
+            raise ValueError(f"Unable to delete objects with pk={pks}")
+        for pk in pks:
+            if pk not in self._container:
+                raise KeyError(pk)
+        for pk in pks:
+            self._remove(pk)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        outer_log      = self._undo_log
+        self._undo_log = []
+        try:
+            yield
+        except BaseException:
+            # Undo the changes in reverse order:
+            for pk, obj in reversed(self._undo_log):
+                if obj is None:
+                    self._container.pop(pk, None)
+                else:
+                    self._container[pk] = obj
+
+            # Restored objects should keep their places in pk order:
+            self._container = dict(sorted(self._container.items()))
+            self._reindex()
+            raise
+        else:
+            # Nested transaction is undone together with the outer one:
+            if outer_log is not None:
+                outer_log.extend(self._undo_log)
+        finally:
+            self._undo_log = outer_log
+
+
+# Range bound: (value or None if unbounded, whether the bound is strict)
+Bound = tuple[Any, bool]
+
+
+def range_bounds(cond: Condition) -> tuple[Bound, Bound] | None:
+    """
+    Получить нижнюю и верхнюю границы диапазона значений, задаваемого
+    условием, или None, если условие диапазоном не выражается. Для AllOf
+    диапазон строится по тем условиям, которые им выражаются: остальные
+    проверяются при фильтрации кандидатов.
+    """
+    low: Bound = (None, False)
+    high: Bound = (None, False)
+
+    if isinstance(cond, Between):
+        low, high = (cond.low, False), (cond.high, False)
+    elif isinstance(cond, Compare) and cond.value is not None and cond.op != '!=':
+        if cond.op in ('=', '>', '>='):
+            low = (cond.value, cond.op == '>')
+        if cond.op in ('=', '<', '<='):
+            high = (cond.value, cond.op == '<')
+    elif isinstance(cond, AllOf):
+        parts = [bounds for bounds in map(range_bounds, cond.conditions)
+                 if bounds is not None]
+        if not parts:
+            return None
+        for part_low, part_high in parts:
+            low = _tighter(low, part_low, max)
+            high = _tighter(high, part_high, min)
+    else:
+        return None
+
+    return low, high
+
+
+def _tighter(bound: Bound, other: Bound, pick: Callable[[Any, Any], Any]) -> Bound:
+    """ Выбрать более строгую из двух границ: pick - min или max """
+    if bound[0] is None:
+        return other
+    if other[0] is None:
+        return bound
+    if bound[0] == other[0]:
+        return bound[0], bound[1] or other[1]
+    return bound if pick(bound[0], other[0]) == bound[0] else other
+
+
+def is_date_type(annotation: Any) -> bool:
+    """ Проверить, является ли тип поля датой (возможно, необязательной) """
+    return any(isinstance(arg, type) and issubclass(arg, date)
+               for arg in (annotation, *get_args(annotation)))
@@ -0,0 +1,590 @@
+"""
+Модуль описывает выражения запросов к репозиторию.
+
+Условие в get_all(where=...) задается словарем {'название_поля': значение},
+где значение - либо само значение поля (проверка на равенство), либо
+условие, построенное функциями этого модуля:
+
+    repo.get_all(where={'expense_date': ge(week_start) & lt(week_end),
+                        'category':     in_([1, 2, 3])},
+                 order_by='-expense_date', limit=20)
+
+Каждое условие умеет как проверять значение в памяти (MemoryRepository),
+так и компилироваться в параметризованный SQL (SQLiteRepository).
+Исключение - условие-подзапрос InQuery, которое проверяется только в БД.
+Семантика сравнений повторяет SQL: значение None (NULL) не удовлетворяет
+никакому сравнению, кроме проверки на равенство None. Сравнивать с None
+можно только на равенство и неравенство (eq, ne), упорядочивающие
+сравнения с None вызывают ValueError.
+
+Агрегатные функции (AGGREGATES) вычисляются в памяти за один проход
+функцией compute_aggregates с той же семантикой, что и в SQL.
+Постраничная выборка по ключу (keyset pagination, см. get_page
+репозиториев) строится функциями keyset_where и keyset_follows.
+Поиск подстроки (contains) в нестроковом значении ведется по его
+текстовому представлению (text_value), в котором значение хранится в БД.
+Даты (date) в сравнениях, отрезках и наборах значений приводятся к началу
+дня (datetime), так что их можно сравнивать с полями datetime.
+
+Текст SQL условия зависит только от его формы (shape): поля, оператора,
+проверки на NULL, но не от сравниваемых значений. Поэтому QueryTemplates
+запоминает текст запроса по форме условия и для повторяющихся запросов
+только собирает параметры, а SQLite повторно использует подготовленный
+запрос из кэша соединения. Наборы значений in_ дополняются до степени
+двойки, чтобы наборы разной длины разделяли немногие шаблоны.
+"""
+
+import operator
+
+from abc         import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime    import date, datetime, time
+from typing      import Any, Callable, Hashable, Iterable, Sequence
+
+
+def text_value(value: Any) -> str:
+    """ Текстовое представление значения поля, в котором оно хранится в БД """
+    if isinstance(value, datetime):
+        # Fixed width keeps the text order the same as the datetime order:
+        return value.isoformat(sep=' ', timespec='microseconds')
+    return str(value)
+
+
+def condition_value(value: Any) -> Any:
+    """
+    Значение, с которым сравнивается поле в условии: дата date приводится
+    к началу дня (datetime), чтобы ее можно было сравнивать с полями datetime
+    одинаково в памяти и в БД.
+    """
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time())
+    return value
+
+
+class Condition(ABC):
+    """
+    Условие на значение поля.
+    Условия можно объединять оператором &.
+    """
+
+    @abstractmethod
+    def matches(self, value: Any) -> bool:
+        """ Проверить, удовлетворяет ли значение поля условию """
+
+    @abstractmethod
+    def template(self, column: str) -> str:
+        """ Получить SQL-выражение для столбца column """
+
+    @abstractmethod
+    def params(self) -> list[Any]:
+        """ Получить параметры SQL-выражения """
+
+    @abstractmethod
+    def shape(self) -> Hashable:
+        """ Получить форму условия, от которой зависит текст SQL-выражения """
+
+    def sql(self, column: str) -> tuple[str, list[Any]]:
+        """ Получить SQL-выражение для столбца column и его параметры """
+        return self.template(column), self.params()
+
+    def __and__(self, other: 'Condition') -> 'Condition':
+        return AllOf((self, other))
+
+
+@dataclass(frozen=True)
+class Compare(Condition):
+    """ Сравнение значения поля с заданным значением """
+    op    : str
+    value : Any
+
+    OPERATORS = {'=':  operator.eq, '!=': operator.ne,
+                 '<':  operator.lt, '<=': operator.le,
+                 '>':  operator.gt, '>=': operator.ge}
+
+    def __post_init__(self) -> None:
+        # The dataclass is frozen, so the value is normalized in place:
+        object.__setattr__(self, 'value', condition_value(self.value))
+
+        if self.op not in self.OPERATORS:
+            raise ValueError(f"Unknown comparison operator \"{self.op}\"")
+
+        # NULL is not ordered, so it is only checked for (in)equality:
+        if self.value is None and self.op not in ('=', '!='):
+            raise ValueError(f"None can not be compared with \"{self.op}\"")
+
+    def matches(self, value: Any) -> bool:
+        if self.value is None:
+            return (value is None) == (self.op == '=')
+        return value is not None and bool(self.OPERATORS[self.op](value, self.value))
+
+    def template(self, column: str) -> str:
+        if self.value is None:
+            return f"{column} IS {'NOT ' if self.op == '!=' else ''}NULL"
+        return f"{column} {self.op} ?"
+
+    def params(self) -> list[Any]:
+        return [] if self.value is None else [self.value]
+
+    def shape(self) -> Hashable:
+        return (self.op, self.value is None)
+
+
+@dataclass(frozen=True)
+class Between(Condition):
+    """ Значение поля лежит в отрезке [low, high] """
+    low  : Any
+    high : Any
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, 'low',  condition_value(self.low))
+        object.__setattr__(self, 'high', condition_value(self.high))
+
+    def matches(self, value: Any) -> bool:
+        return value is not None and bool(self.low <= value <= self.high)
+
+    def template(self, column: str) -> str:
+        return f"{column} BETWEEN ? AND ?"
+
+    def params(self) -> list[Any]:
+        return [self.low, self.high]
+
+    def shape(self) -> Hashable:
+        return 'between'
+
+
+@dataclass(frozen=True)
+class In(Condition):
+    """ Значение поля входит в заданный набор значений """
+    values : tuple[Any, ...]
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, 'values', tuple(map(condition_value, self.values)))
+
+    def matches(self, value: Any) -> bool:
+        return value in self.values
+
+    def size(self) -> int:
+        """ Число параметров: длина набора, дополненная до степени двойки """
+        return 0 if not self.values else 1 << (len(self.values) - 1).bit_length()
+
+    def template(self, column: str) -> str:
+        pholder = ", ".join("?" * self.size())
+        return f"{column} IN ({pholder})"
+
+    def params(self) -> list[Any]:
+        # Repeating a value does not change the result of IN:
+        padding = self.size() - len(self.values)
+        return list(self.values) + list(self.values[-1:]) * padding
+
+    def shape(self) -> Hashable:
+        return ('in', self.size())
+
+
+@dataclass(frozen=True)
+class InQuery(Condition):
+    """
+    Значение поля входит в результат SQL-подзапроса query с параметрами
+    args. Такое условие проверяется только в БД.
+    """
+    query : str
+    args  : tuple[Any, ...] = ()
+
+    def matches(self, value: Any) -> bool:
+        raise TypeError("Subquery condition can be checked only in a database")
+
+    def template(self, column: str) -> str:
+        return f"{column} IN ({self.query})"
+
+    def params(self) -> list[Any]:
+        return list(self.args)
+
+    def shape(self) -> Hashable:
+        return ('subquery', self.query)
+
+
+@dataclass(frozen=True)
+class Contains(Condition):
+    """ Значение поля содержит заданную подстроку """
+    substring : str
+
+    def matches(self, value: Any) -> bool:
+        if value is None:
+            return False
+        if not isinstance(value, str):
+            value = text_value(value)
+        return self.substring in value
+
+    def template(self, column: str) -> str:
+        return f"{column} LIKE ? ESCAPE '\\'"
+
+    def params(self) -> list[Any]:
+        # Escape LIKE wildcards to match the substring literally:
+        escaped = (self.substring.replace("\\", "\\\\")
+                                 .replace("%", "\\%")
+                                 .replace("_", "\\_"))
+        return [f"%{escaped}%"]
+
+    def shape(self) -> Hashable:
+        return 'like'
+
+
+@dataclass(frozen=True)
+class AllOf(Condition):
+    """ Выполнены все условия одновременно """
+    conditions : tuple[Condition, ...]
+
+    def matches(self, value: Any) -> bool:
+        return all(cond.matches(value) for cond in self.conditions)
+
+    def template(self, column: str) -> str:
+        return " AND ".join(f"({cond.template(column)})" for cond in self.conditions)
+
+    def params(self) -> list[Any]:
+        return [param for cond in self.conditions for param in cond.params()]
+
+    def shape(self) -> Hashable:
+        return ('and',) + tuple(cond.shape() for cond in self.conditions)
+
+    def __and__(self, other: Condition) -> Condition:
+        return AllOf(self.conditions + (other,))
+
+
+############################
+## Condition constructors ##
+############################
+
+def eq(value: Any) -> Condition:
+    """ Значение поля равно value """
+    return Compare('=', value)
+
+
+def ne(value: Any) -> Condition:
+    """ Значение поля не равно value """
+    return Compare('!=', value)
+
+
+def lt(value: Any) -> Condition:
+    """ Значение поля меньше value """
+    return Compare('<', value)
+
+
+def le(value: Any) -> Condition:
+    """ Значение поля не больше value """
+    return Compare('<=', value)
+
+
+def gt(value: Any) -> Condition:
+    """ Значение поля больше value """
+    return Compare('>', value)
+
+
+def ge(value: Any) -> Condition:
+    """ Значение поля не меньше value """
+    return Compare('>=', value)
+
+
+def between(low: Any, high: Any) -> Condition:
+    """ Значение поля лежит в отрезке [low, high] (включая границы) """
+    return Between(low, high)
+
+
+def in_(values: Iterable[Any]) -> Condition:
+    """ Значение поля входит в набор values """
+    return In(tuple(values))
+
+
+def contains(substring: str) -> Condition:
+    """ Значение поля содержит подстроку substring """
+    return Contains(substring)
+
+
+def as_condition(value: Any) -> Condition:
+    """ Привести значение из словаря where к условию """
+    if isinstance(value, Condition):
+        return value
+    return eq(value)
+
+
+##################################
+## Evaluation and SQL compiling ##
+##################################
+
+OrderBy = str | Sequence[str]
+
+
+def order_fields(order_by: OrderBy | None) -> list[tuple[str, bool]]:
+    """
+    Разобрать порядок сортировки: список пар (поле, по убыванию).
+    Поле с префиксом '-' сортируется по убыванию.
+    """
+    if order_by is None:
+        return []
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    return [(name[1:], True) if name.startswith('-') else (name, False)
+            for name in order_by]
+
+
+def matches(obj: Any, where: dict[str, Any]) -> bool:
+    """ Проверить, удовлетворяет ли объект условию where """
+    return all(as_condition(value).matches(getattr(obj, attr))
+               for attr, value in where.items())
+
+
+def apply(
+    objs     : Iterable[Any],
+    where    : dict[str, Any] | None = None,
+    order_by : OrderBy | None = None,
+    limit    : int | None = None,
+    offset   : int | None = None
+) -> list[Any]:
+    """
+    Выполнить запрос над объектами в памяти: отфильтровать, упорядочить
+    и выбрать нужный диапазон.
+    """
+    if where:
+        conditions = [(attr, as_condition(value)) for attr, value in where.items()]
+        objs = [obj for obj in objs
+                if all(cond.matches(getattr(obj, attr)) for attr, cond in conditions)]
+    result = list(objs)
+
+    # Stable sorts from the last key to the first one give lexicographic order.
+    # As in SQL, None (NULL) goes before all the other values:
+    for name, descending in reversed(order_fields(order_by)):
+        result.sort(key=_sort_key(name), reverse=descending)
+
+    start = offset or 0
+    stop  = None if limit is None else start + limit
+    return result[start:stop]
+
+
+def _sort_key(name: str) -> Callable[[Any], tuple[bool, Any]]:
+    def key(obj: Any) -> tuple[bool, Any]:
+        value = getattr(obj, name)
+        return (value is not None, value)
+    return key
+
+
+def keyset_where(
+    where      : dict[str, Any] | None,
+    key        : str,
+    after      : tuple[Any, Any] | None,
+    descending : bool
+) -> dict[str, Any]:
+    """
+    Дополнить условие where условием на поле key для страницы записей,
+    упорядоченных по (key, pk) и следующих за курсором after = (key, pk)
+    последней полученной записи. Условие ограничивает только значение key:
+    записи с тем же значением key, что и у курсора, нужно дополнительно
+    отобрать по pk (keyset_follows). Записи без значения key (None)
+    в страницы не попадают.
+    """
+    if after is None:
+        cond = ne(None)
+    else:
+        cond = le(after[0]) if descending else ge(after[0])
+
+    where = dict(where or {})
+    where[key] = as_condition(where[key]) & cond if key in where else cond
+    return where
+
+
+def keyset_follows(
+    obj        : Any,
+    key        : str,
+    after      : tuple[Any, Any],
+    descending : bool
+) -> bool:
+    """ Проверить, что объект следует за курсором after в порядке (key, pk) """
+    position = (getattr(obj, key), obj.pk)
+    return position < after if descending else position > after
+
+
+def compile_query(
+    where    : dict[str, Any] | None,
+    order_by : OrderBy | None,
+    limit    : int | None,
+    offset   : int | None,
+    column   : Callable[[str], str]
+) -> tuple[str, list[Any]]:
+    """
+    Скомпилировать запрос в окончание SQL-запроса SELECT (WHERE, ORDER BY,
+    LIMIT, OFFSET) и список его параметров. Функция column сопоставляет
+    названию поля имя столбца таблицы.
+    """
+    sql    = ""
+    params = []
+
+    if where:
+        parts = []
+        for attr, value in where.items():
+            part, part_params = as_condition(value).sql(column(attr))
+            parts.append(part)
+            params += part_params
+        sql += " WHERE " + " AND ".join(parts)
+
+    order = order_fields(order_by)
+    if order:
+        sql += " ORDER BY " + ", ".join(
+            column(name) + (" DESC" if descending else "") for name, descending in order)
+
+    if limit is not None or offset is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset or 0]
+
+    return sql, params
+
+
+class QueryTemplates:  # pylint: disable=too-few-public-methods
+    """
+    Запомненные тексты окончаний SQL-запросов (см. compile_query) по форме
+    запроса: полям и формам условий where, порядку сортировки и наличию
+    LIMIT. Для запроса уже встречавшейся формы текст берется готовым,
+    а вычисляются только параметры. Хранится не более size шаблонов,
+    давно не использованные вытесняются (LRU). Счетчики hits и misses
+    учитывают обращения к запомненным шаблонам.
+    """
+
+    def __init__(self, column: Callable[[str], str], size: int = 128) -> None:
+        # Type annotations:
+        self.column     : Callable[[str], str]        # Field to column mapping
+        self.size       : int                         # Templates capacity
+        self.hits       : int                         # Templates reused
+        self.misses     : int                         # Templates compiled
+        self._templates : OrderedDict[Hashable, str]  # Templates by shape
+
+        # Initialization:
+        self.column     = column
+        self.size       = size
+        self.hits       = 0
+        self.misses     = 0
+        self._templates = OrderedDict()
+
+    def compile(
+        self,
+        where    : dict[str, Any] | None,
+        order_by : OrderBy | None,
+        limit    : int | None,
+        offset   : int | None
+    ) -> tuple[str, list[Any]]:
+        """
+        Скомпилировать запрос так же, как compile_query, используя
+        запомненный шаблон запроса той же формы.
+        """
+        conditions = [(attr, as_condition(value))
+                      for attr, value in (where or {}).items()]
+        paged      = limit is not None or offset is not None
+        order      = (order_by if order_by is None or isinstance(order_by, str)
+                      else tuple(order_by))
+        key        = (tuple((attr, cond.shape()) for attr, cond in conditions),
+                      order, paged)
+
+        sql = self._templates.get(key)
+        if sql is None:
+            self.misses += 1
+            sql, _ = compile_query(where, order_by, limit, offset, self.column)
+            self._templates[key] = sql
+            if len(self._templates) > self.size:
+                self._templates.popitem(last=False)
+        else:
+            self.hits += 1
+            self._templates.move_to_end(key)
+
+        # Parameters go in the same order as in compile_query:
+        params = [param for _, cond in conditions for param in cond.params()]
+        if paged:
+            params += [-1 if limit is None else limit, offset or 0]
+        return sql, params
+
+
+###########################
+## Aggregate computation ##
+###########################
+
+AGGREGATES = ('sum', 'count', 'min', 'max', 'avg')
+
+
+def check_aggregates(aggregates: dict[str, str]) -> None:
+    """ Проверить названия агрегатных функций """
+    if len(aggregates) == 0:
+        raise ValueError("No aggregate functions requested")
+    for func in aggregates:
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate function \"{func}\", "
+                             f"should be one of {AGGREGATES}")
+
+
+class _Accumulator:  # pylint: disable=too-few-public-methods
+    """ Состояние агрегатной функции func по полю field """
+
+    def __init__(self, func: str, field: str) -> None:
+        self.func  = func
+        self.field = field
+        self.count = 0
+        self.value : Any = None
+
+    def add(self, obj: Any) -> None:
+        if self.field == '*':
+            self.count += 1
+            return
+
+        value = getattr(obj, self.field)
+        if value is None:
+            return
+
+        self.count += 1
+        if self.value is None:
+            self.value = value
+        elif self.func in ('sum', 'avg'):
+            self.value += value
+        elif self.func == 'min':
+            self.value = min(self.value, value)
+        elif self.func == 'max':
+            self.value = max(self.value, value)
+
+    def result(self) -> Any:
+        if self.func == 'count':
+            return self.count
+        if self.func == 'sum':
+            return 0 if self.value is None else self.value
+        if self.func == 'avg':
+            return None if self.count == 0 else self.value / self.count
+        return self.value
+
+
+def compute_aggregates(
+    objs       : Iterable[Any],
+    group_by   : str | None,
+    aggregates : dict[str, str]
+) -> dict[Any, Any]:
+    """
+    Вычислить агрегатные функции над объектами за один проход.
+    aggregates - словарь {'функция': 'поле'}, для count поле может быть '*'.
+    Без группировки возвращает словарь {'функция': значение}, иначе -
+    словарь {значение поля group_by: {'функция': значение}}.
+    Сумма по пустому набору равна 0, как и количество.
+    """
+    check_aggregates(aggregates)
+
+    def new_group() -> list[_Accumulator]:
+        return [_Accumulator(func, field) for func, field in aggregates.items()]
+
+    groups: dict[Any, list[_Accumulator]] = {}
+    if group_by is None:
+        groups[None] = new_group()
+
+    for obj in objs:
+        key  = None if group_by is None else getattr(obj, group_by)
+        accs = groups.get(key)
+        if accs is None:
+            accs = groups[key] = new_group()
+        for acc in accs:
+            acc.add(obj)
+
+    result = {key: {acc.func: acc.result() for acc in accs}
+              for key, accs in groups.items()}
+
+    if group_by is None:
+        return result[None]
+    return result
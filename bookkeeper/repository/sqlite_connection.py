@@ -0,0 +1,340 @@
+"""
+Модуль описывает пул соединений с базой данных SQLite.
+
+Вместо открытия нового соединения на каждую операцию репозитории используют
+долгоживущие соединения: по одному на поток. Все репозитории, работающие
+с одним файлом базы данных, разделяют общий пул, а значит и транзакции:
+изменения, сделанные внутри блока transaction() любым из них, фиксируются
+(или откатываются) вместе.
+
+Соединения пула умеют замерять выполнение SQL-запросов: после вызова
+instrument(stats) время выполнения каждого запроса вместе с получением
+его результата и число полученных строк учитываются в статистике stats
+(см. модуль instrumentation).
+
+Настройки производительности соединений задаются профилем PerformanceProfile:
+журнал с упреждающей записью (WAL), режим синхронизации, размеры кэша страниц
+и отображаемой в память части файла, хранение временных данных. Без профиля
+соединения работают с настройками SQLite по умолчанию.
+"""
+
+import os
+import sqlite3
+import threading
+
+from contextlib  import contextmanager
+from dataclasses import dataclass
+from time        import perf_counter
+from types       import TracebackType
+from typing      import Any, Callable, ClassVar, Iterator
+
+from bookkeeper.repository.instrumentation import RepositoryStats
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Курсор, учитывающий в статистике stats выполнение запроса: время
+    выполнения вместе с получением результата и число полученных строк.
+    Запрос учитывается, когда его результат получен полностью, курсор
+    закрыт или выполняет следующий запрос.
+    """
+
+    stats    : RepositoryStats | None = None
+    _sql     : str | None             = None
+    _elapsed : float                  = 0.0
+    _rows    : int                    = 0
+
+    def _start(self, sql: str) -> None:
+        self._finish()
+        self._sql, self._elapsed, self._rows = sql, 0.0, 0
+
+    def _finish(self) -> None:
+        if self._sql is not None and self.stats is not None:
+            self.stats.record_query(self._sql, self._elapsed, self._rows)
+        self._sql = None
+
+    def _timed(self, func: Callable[..., Any], *args: Any) -> Any:
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._elapsed += perf_counter() - start
+
+    def execute(self, sql: str, parameters: Any = (), /) -> 'ProfiledCursor':
+        self._start(sql)
+        self._timed(super().execute, sql, parameters)
+
+        # Statements without a result are complete right away:
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Any, /) -> 'ProfiledCursor':
+        self._start(sql)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def fetchone(self) -> Any:
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: int | None = None) -> list[Any]:
+        if size is None:
+            size = self.arraysize
+        rows: list[Any] = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self) -> list[Any]:
+        rows: list[Any] = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
+
+    def __del__(self) -> None:
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Соединение, запросы которого замеряются курсорами ProfiledCursor,
+    если задана статистика stats. Иначе запросы выполняются как обычно.
+    """
+
+    stats : RepositoryStats | None = None
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        if self.stats is None:
+            return super().execute(sql, parameters)
+        cur = self.cursor(ProfiledCursor)
+        cur.stats = self.stats
+        return cur.execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any, /) -> sqlite3.Cursor:
+        if self.stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        cur = self.cursor(ProfiledCursor)
+        cur.stats = self.stats
+        return cur.executemany(sql, seq_of_parameters)
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """
+    Профиль производительности соединений SQLite: значения PRAGMA,
+    применяемые один раз при открытии каждого соединения.
+
+    journal_mode - режим журнала. В режиме WAL чтение не блокируется
+    записью, а фиксация транзакции дописывает страницы в журнал.
+    synchronous  - ожидание записи на диск. NORMAL в режиме WAL сохраняет
+    целостность базы данных, но последние транзакции могут быть потеряны
+    при сбое питания.
+    cache_size   - размер кэша страниц соединения: в страницах, если
+    значение положительное, или в КиБ, если отрицательное.
+    mmap_size    - размер части файла, отображаемой в память, в байтах.
+    temp_store   - хранение временных таблиц и индексов.
+    """
+
+    # Allowed values of the textual settings:
+    JOURNAL_MODES : ClassVar[tuple[str, ...]] = (
+        "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+    SYNCHRONOUS   : ClassVar[tuple[str, ...]] = ("OFF", "NORMAL", "FULL", "EXTRA")
+    TEMP_STORES   : ClassVar[tuple[str, ...]] = ("DEFAULT", "FILE", "MEMORY")
+
+    journal_mode : str = "WAL"
+    synchronous  : str = "NORMAL"
+    cache_size   : int = -64 * 1024         # 64 MiB
+    mmap_size    : int = 256 * 1024 * 1024  # 256 MiB
+    temp_store   : str = "MEMORY"
+
+    def __post_init__(self) -> None:
+        # The values are substituted into the text of the pragmas:
+        for name, allowed in (("journal_mode", self.JOURNAL_MODES),
+                              ("synchronous",  self.SYNCHRONOUS),
+                              ("temp_store",   self.TEMP_STORES)):
+            value = getattr(self, name)
+            if value.upper() not in allowed:
+                raise ValueError(f"Invalid {name} \"{value}\", "
+                                 f"should be one of {allowed}")
+        if not isinstance(self.cache_size, int) or not isinstance(self.mmap_size, int):
+            raise ValueError("cache_size and mmap_size should be integers")
+
+    def pragmas(self) -> list[str]:
+        """ Получить PRAGMA профиля в порядке применения """
+        # The journal mode goes first: it decides how the other settings work
+        return [f"PRAGMA journal_mode = {self.journal_mode}",
+                f"PRAGMA synchronous = {self.synchronous}",
+                f"PRAGMA cache_size = {self.cache_size}",
+                f"PRAGMA mmap_size = {self.mmap_size}",
+                f"PRAGMA temp_store = {self.temp_store}"]
+
+
+class SQLiteConnectionPool:
+    """
+    Пул соединений с БД SQLite: по одному долгоживущему соединению на поток.
+    Настройки соединения (PRAGMA) и профиль производительности profile
+    применяются один раз при его открытии.
+    После вызова close() пул остается пригодным к использованию:
+    соединения будут открыты заново при следующем обращении.
+
+    Общий пул (shared) ведет счетчик пользователей: каждый пользователь
+    освобождает пул вызовом release(), а соединения закрываются, только
+    когда пул освободит последний из них.
+    """
+
+    # Class static variables:
+    PRAGMAS : ClassVar[tuple[str, ...]] = ("PRAGMA foreign_keys = ON",)
+
+    # Prepared statements kept by a connection. It is shared by all the
+    # repositories of the database: each has about a dozen of fixed queries
+    # and up to QueryTemplates.size dynamic ones (128 by default):
+    CACHED_STATEMENTS : ClassVar[int] = 512
+
+    _shared      : ClassVar[dict[tuple[str, PerformanceProfile | None],
+                                 'SQLiteConnectionPool']] = {}
+    _shared_lock : ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, db_file: str, profile: PerformanceProfile | None = None) -> None:
+        # Type annotations:
+        self.db_file      : str                        # Database file
+        self.profile      : PerformanceProfile | None  # Performance settings
+        self._local       : threading.local            # Per-thread connection storage
+        self._connections : list[ProfiledConnection]   # All opened connections
+        self._lock        : threading.Lock             # Guards the connection list
+        self.stats        : RepositoryStats | None     # Statistics of the queries
+        self.users        : int                        # Users of the shared pool
+
+        # Initialization:
+        self.db_file      = db_file
+        self.profile      = profile
+        self._local       = threading.local()
+        self._connections = []
+        self._lock        = threading.Lock()
+        self.stats        = None
+        self.users        = 0
+
+    @classmethod
+    def shared(
+        cls,
+        db_file : str,
+        profile : PerformanceProfile | None = None
+    ) -> 'SQLiteConnectionPool':
+        """
+        Получить общий для всех репозиториев пул соединений с файлом db_file
+        и профилем производительности profile. Репозитории с разными профилями
+        используют разные пулы, а значит и разные транзакции.
+        Полученный пул должен быть освобожден вызовом release().
+        """
+        key = (os.path.abspath(db_file), profile)
+
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls(db_file, profile)
+                cls._shared[key] = pool
+            pool.users += 1
+
+        return pool
+
+    def release(self) -> None:
+        """
+        Освободить пул, полученный методом shared(). Соединения закрываются,
+        когда пул освобождает последний пользователь: закрытие одного
+        репозитория не затрагивает транзакции остальных.
+        """
+        with self._shared_lock:
+            self.users = max(self.users - 1, 0)
+            if self.users == 0:
+                self.close()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Получить соединение текущего потока, открыв его при необходимости.
+        """
+        con: ProfiledConnection | None = getattr(self._local, 'connection', None)
+        if con is not None:
+            return con
+
+        # The connection is only used by the thread that opened it,
+        # but may be closed from any other thread by close():
+        con = sqlite3.connect(self.db_file, check_same_thread=False,
+                              factory=ProfiledConnection,
+                              cached_statements=self.CACHED_STATEMENTS)
+        con.stats = self.stats
+        pragmas = list(self.PRAGMAS)
+        if self.profile is not None:
+            pragmas += self.profile.pragmas()
+        for pragma in pragmas:
+            con.execute(pragma).fetchall()
+
+        self._local.connection = con
+        with self._lock:
+            self._connections.append(con)
+
+        return con
+
+    def instrument(self, stats: RepositoryStats | None) -> None:
+        """
+        Учитывать SQL-запросы всех соединений пула, открытых и будущих,
+        в статистике stats. Значение None отключает учет.
+        """
+        with self._lock:
+            self.stats = stats
+            for con in self._connections:
+                con.stats = stats
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выполнить блок в транзакции на соединении текущего потока.
+        Транзакция фиксируется при выходе из блока и откатывается при
+        исключении. Вложенные блоки выполняются в рамках внешней транзакции:
+        фиксация и откат происходят только на самом внешнем уровне.
+        """
+        con   = self.connection()
+        depth = getattr(self._local, 'depth', 0)
+
+        self._local.depth = depth + 1
+        try:
+            if depth == 0:
+                # Commit on success, rollback on exception:
+                with con:
+                    yield con
+            else:
+                yield con
+        finally:
+            self._local.depth = depth
+
+    def close(self) -> None:
+        """
+        Закрыть все открытые пулом соединения.
+        """
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+
+            # Forget the connections cached by every thread:
+            self._local = threading.local()
+
+    def __enter__(self) -> 'SQLiteConnectionPool':
+        return self
+
+    def __exit__(
+        self,
+        exc_type : type[BaseException] | None,
+        exc_val  : BaseException | None,
+        exc_tb   : TracebackType | None
+    ) -> None:
+        self.close()
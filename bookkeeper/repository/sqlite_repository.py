@@ -2,13 +2,20 @@
 Модуль описывает репозиторий, работающий поверх базы данных SQLite, хранящейся в файле.
 """
 
-import sqlite3
-
-from inspect  import get_annotations
-from datetime import datetime
-from typing   import Any, Callable
+from dataclasses import fields, is_dataclass
+from inspect     import get_annotations
+from datetime    import datetime
+from types       import NoneType
+from typing      import (
+    Any, Callable, ClassVar, ContextManager, Iterator, Sequence, get_args,
+    get_origin)
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.sqlite_connection   import (
+    PerformanceProfile, SQLiteConnectionPool)
+from bookkeeper.repository.query               import (
+    Condition, InQuery, OrderBy, QueryTemplates, contains, check_aggregates, keyset_where,
+    text_value)
 
 ###################################
 ## SQL repository implementation ##
@@ -18,67 +25,299 @@ from bookkeeper.repository.abstract_repository import AbstractRepository, T
 class SQLiteRepository(AbstractRepository[T]):
     """
     Репозиторий, основанный на БД SQLite. Работает поверх файловой системы.
+
+    Схема таблицы строится по аннотациям класса: поле pk хранится в столбце
+    INTEGER PRIMARY KEY, остальные поля - в столбцах с типом, соответствующим
+    аннотации. Для полей, перечисленных в атрибуте класса INDEXES, создаются
+    индексы. Элемент INDEXES - название поля или кортеж названий полей
+    (составной индекс), например:
+
+        INDEXES = ('expense_date', 'category', ('category', 'expense_date'))
+
+    Значения datetime хранятся в виде текста ISO 8601 фиксированной длины
+    ("YYYY-MM-DD HH:MM:SS.ffffff"), поэтому сравнение строк в БД совпадает
+    с хронологическим порядком. Строки таблицы превращаются в объекты
+    декодером, построенным один раз при создании репозитория.
+
+    Если в атрибуте класса HIERARCHY указано поле со ссылкой на родителя
+    (HIERARCHY = 'parent'), записи образуют дерево, и рядом с таблицей
+    ведется таблица замыкания <table>_closure (ancestor, descendant, depth)
+    со всеми парами предок-потомок. Она поддерживается триггерами в той же
+    транзакции, что и изменения записей, и позволяет получать всех потомков
+    (get_descendants) и предков (get_ancestors) записи одним запросом,
+    а также отбирать записи других таблиц по поддереву (subtree).
+
+    Соединения с БД берутся из пула SQLiteConnectionPool. По умолчанию
+    используется общий пул для файла db_file, так что все репозитории,
+    работающие с одной базой данных, используют одно соединение на поток
+    и общую транзакцию внутри блока transaction(). Профиль производительности
+    profile (PerformanceProfile) задает настройки соединений этого пула,
+    например журнал WAL; без профиля используются настройки SQLite.
+    Метод close() освобождает общий пул: его соединения закрываются вместе
+    с последним использующим его репозиторием. Переданный пул pool
+    репозиторий не закрывает.
     """
 
     # Class static variables:
-    DEFAULT_DATE_FORMAT : str
-    DEFAULT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
-
-    def __init__(self, db_file: str, cls: type) -> None:
+    # Column affinities for the types of stored fields:
+    COLUMN_TYPES : dict[type, str]
+    COLUMN_TYPES = {int: "INTEGER", bool: "INTEGER", float: "REAL",
+                    str: "TEXT", datetime: "TEXT"}
+
+    def __init__(  # pylint: disable=too-many-locals
+        self,
+        db_file : str,
+        cls     : type,
+        pool    : SQLiteConnectionPool | None = None,
+        profile : PerformanceProfile | None = None
+    ) -> None:
         # Type annotations:
-        self.db_file    : str              # Database file
-        self.table_name : str              # Name of a table in database
-        self.cls        : Callable[[], T]  # Class constructor of type T
-        self.fields     : dict[str, type]  # Field of a class to be stored
-        self.queries    : dict[str, str]   # Shortcuts of SQL queries to be made
+        self.db_file    : str                    # Database file
+        self.pool       : SQLiteConnectionPool   # Source of database connections
+        self.shared     : bool                   # The shared pool is to be released
+        self.table_name : str                    # Name of a table in database
+        self.cls        : Callable[..., T]       # Class constructor of type T
+        self.fields     : dict[str, type]        # Field of a class to be stored
+        self.decode_row : Callable[[Any], T]     # Row to object converter
+        self.indexes    : list[tuple[str, ...]]  # Indexed fields
+        self.hierarchy  : str | None             # Field referencing the parent
+        self.closure    : str                    # Name of the hierarchy closure table
+        self.queries    : dict[str, str]         # Shortcuts of SQL queries to be made
+        self.templates  : QueryTemplates         # Memoised dynamic queries
 
         # Initialization:
         self.table_name = cls.__name__.lower()
         self.db_file    = db_file
-        self.fields     = get_annotations(cls, eval_str=True)
-        self.fields.pop('pk')
+        self.shared     = pool is None
+        self.pool       = pool or SQLiteConnectionPool.shared(db_file, profile)
+        self.fields     = {name: field_type for name, field_type
+                           in get_annotations(cls, eval_str=True).items()
+                           if not self.is_class_var(field_type)}
         self.cls = cls
 
+        # Rows are selected in the order of declaration of the fields with pk
+        # taken from ROWID, so that they could be passed to the constructor:
+        row_fields      = list(self.fields.keys())
+        self.decode_row = self.make_decoder(row_fields)
+        self.fields.pop('pk')
+
+        self.indexes = [(index,) if isinstance(index, str) else tuple(index)
+                        for index in getattr(cls, 'INDEXES', ())]
+        self.hierarchy = getattr(cls, 'HIERARCHY', None)
+        self.closure   = f"{self.table_name}_closure"
+        self.templates = QueryTemplates(self.column)
+
         # Pregenerate the queries to be used in database access methods:
         names   = ", ".join(self.fields.keys())
+        select  = ", ".join("ROWID" if name == 'pk' else name for name in row_fields)
         pholder = ", ".join("?" * len(self.fields))
         ph_upd  = ", ".join([f"{field}=?" for field in self.fields.keys()])
+        columns = ", ".join(["pk INTEGER PRIMARY KEY"] +
+                            [f"{name} {self.column_type(field_type)}".rstrip()
+                             for name, field_type in self.fields.items()])
 
         self.queries = {
-            'foreign_keys': "PRAGMA foreign_keys = ON",
-            'create':       f"CREATE TABLE IF NOT EXISTS {self.table_name} ({names})",
+            'create':       f"CREATE TABLE IF NOT EXISTS {self.table_name} ({columns})",
             'add':          f"INSERT INTO {self.table_name} ({names}) VALUES ({pholder})",
-            'get':          f"SELECT ROWID, * FROM {self.table_name} WHERE ROWID = ?",
-            'get_all':      f"SELECT ROWID, * FROM {self.table_name}",
+            'last_pk':      f"SELECT MAX(ROWID) FROM {self.table_name}",
+            'get':          f"SELECT {select} FROM {self.table_name} WHERE ROWID = ?",
+            'get_all':      f"SELECT {select} FROM {self.table_name}",
             'update':       f"UPDATE {self.table_name} SET {ph_upd} WHERE ROWID = ?",
             'delete':       f"DELETE FROM {self.table_name} WHERE ROWID = ?",
         }
 
-        # Create the requested table in the database file:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['create'])
-        con.close()
-
-    def generate_object(self, fields: dict[str, type], values: list[Any]) -> T:
+        create_closure: list[str] = []
+        if self.hierarchy is not None:
+            create_closure, closure_queries = self.closure_queries(self.hierarchy,
+                                                                   row_fields)
+            self.queries.update(closure_queries)
+
+        # Create the requested table and it's indexes in the database file:
+        with self.pool.transaction() as con:
+            con.execute(self.queries['create'])
+            for index in self.indexes:
+                con.execute(self.index_query(index))
+
+            if self.hierarchy is not None:
+                for query in create_closure:
+                    con.execute(query)
+
+                # Fill the closure table for the records stored before:
+                if con.execute(self.queries['closure_empty']).fetchone() is None:
+                    con.execute(self.queries['fill_closure'])
+
+    def index_query(self, index: tuple[str, ...]) -> str:
+        """ Получить запрос, создающий индекс по полям index """
+        index_name = "_".join((self.table_name,) + index + ("idx",))
+        index_cols = ", ".join(self.column(field) for field in index)
+
+        return (f"CREATE INDEX IF NOT EXISTS {index_name} "
+                f"ON {self.table_name} ({index_cols})")
+
+    def closure_queries(
+        self,
+        field      : str,
+        row_fields : list[str]
+    ) -> tuple[list[str], dict[str, str]]:
+        """
+        Получить запросы, создающие таблицу замыкания иерархии по полю field,
+        содержащему ссылку на родителя, и поддерживающие ее триггеры, а также
+        запросы для выборок по ней.
         """
-        Вспомогательный метод, используемый для генерации объектов класса T
-        из значений, хранящихся в базе даных.
+        table   = self.table_name
+        closure = self.closure
+        parent  = self.column(field)
+        select  = ", ".join(f"{table}.ROWID" if name == 'pk' else f"{table}.{name}"
+                            for name in row_fields)
+        subtree = f"SELECT descendant FROM {closure} WHERE ancestor = NEW.ROWID"
+
+        create = [
+            f"""CREATE TABLE IF NOT EXISTS {closure} (
+                    ancestor INTEGER, descendant INTEGER, depth INTEGER,
+                    PRIMARY KEY (ancestor, descendant)) WITHOUT ROWID""",
+            f"""CREATE INDEX IF NOT EXISTS {closure}_descendant_idx
+                ON {closure} (descendant)""",
+
+            # A new record is a descendant of itself and of all it's parent ancestors:
+            f"""CREATE TRIGGER IF NOT EXISTS {closure}_insert AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO {closure} (ancestor, descendant, depth)
+                    SELECT NEW.ROWID, NEW.ROWID, 0
+                    UNION ALL
+                    SELECT ancestor, NEW.ROWID, depth + 1 FROM {closure}
+                    WHERE descendant = NEW.{parent};
+                END""",
+
+            f"""CREATE TRIGGER IF NOT EXISTS {closure}_check BEFORE UPDATE OF {parent}
+                ON {table} WHEN NEW.{parent} IN ({subtree})
+                BEGIN
+                    SELECT RAISE(ABORT, 'Record can not become a descendant of itself');
+                END""",
+
+            # The moved subtree is detached from the old ancestors
+            # and attached to the new ones:
+            f"""CREATE TRIGGER IF NOT EXISTS {closure}_update AFTER UPDATE OF {parent}
+                ON {table} WHEN OLD.{parent} IS NOT NEW.{parent}
+                BEGIN
+                    DELETE FROM {closure}
+                    WHERE descendant IN ({subtree}) AND ancestor NOT IN ({subtree});
+                    INSERT INTO {closure} (ancestor, descendant, depth)
+                    SELECT up.ancestor, down.descendant, up.depth + down.depth + 1
+                    FROM {closure} AS up, {closure} AS down
+                    WHERE up.descendant = NEW.{parent} AND down.ancestor = NEW.ROWID;
+                END""",
+
+            # Children of a deleted record keep their paths to the upper ancestors:
+            f"""CREATE TRIGGER IF NOT EXISTS {closure}_delete AFTER DELETE ON {table}
+                BEGIN
+                    DELETE FROM {closure}
+                    WHERE ancestor = OLD.ROWID OR descendant = OLD.ROWID;
+                END""",
+        ]
+
+        # Depth is limited by the number of records to stop on cycles in the data:
+        fill = f"""
+            INSERT INTO {closure} (ancestor, descendant, depth)
+            WITH RECURSIVE paths(ancestor, descendant, depth) AS (
+                SELECT ROWID, ROWID, 0 FROM {table}
+                UNION ALL
+                SELECT paths.ancestor, {table}.ROWID, paths.depth + 1
+                FROM paths JOIN {table} ON {table}.{parent} = paths.descendant
+                WHERE paths.depth < (SELECT COUNT(*) FROM {table}))
+            SELECT ancestor, descendant, depth FROM paths
         """
-        class_arguments = {}
 
-        for field_name, field_value in zip(fields.keys(), values[1:]):
-            field_type = fields[field_name]
+        return create, {
+            'fill_closure':   fill,
+            'closure_empty':  f"SELECT 1 FROM {closure} LIMIT 1",
+            'descendants':    f"SELECT {select} FROM {closure} "
+                              f"JOIN {table} ON {table}.ROWID = {closure}.descendant "
+                              f"WHERE {closure}.ancestor = ? AND {closure}.depth > 0 "
+                              f"ORDER BY {closure}.depth, {table}.ROWID",
+            'ancestors':      f"SELECT {select} FROM {closure} "
+                              f"JOIN {table} ON {table}.ROWID = {closure}.ancestor "
+                              f"WHERE {closure}.descendant = ? AND {closure}.depth > 0 "
+                              f"ORDER BY {closure}.depth",
+            'subtree':        f"SELECT descendant FROM {closure} WHERE ancestor = ?",
+        }
+
+    @classmethod
+    def column_type(cls, field_type: Any) -> str:
+        """
+        Получить тип столбца для поля с аннотацией field_type.
+        Для необязательных полей (int | None) используется тип значения,
+        для неизвестных типов тип столбца не указывается.
+        """
+        return cls.COLUMN_TYPES.get(cls.value_type(field_type), "")
+
+    @staticmethod
+    def value_type(field_type: Any) -> Any:
+        """ Получить тип значения необязательного поля (int | None -> int) """
+        args = [arg for arg in get_args(field_type) if arg is not NoneType]
+        if len(args) == 1:
+            return args[0]
+        return field_type
+
+    @staticmethod
+    def is_class_var(field_type: Any) -> bool:
+        """ Проверить, является ли аннотация аннотацией переменной класса """
+        return field_type is ClassVar or get_origin(field_type) is ClassVar
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.pool.transaction()
+
+    def close(self) -> None:
+        # The shared pool is closed by it's last user, the given one is
+        # left to it's owner:
+        if self.shared:
+            self.shared = False
+            self.pool.release()
+
+    @staticmethod
+    def encode_value(value: Any) -> Any:
+        """ Преобразовать значение поля или параметра запроса для записи в БД """
+        if isinstance(value, datetime):
+            return text_value(value)
+        return value
+
+    @staticmethod
+    def decode_datetime(value: Any) -> Any:
+        """ Преобразовать хранящееся в БД значение в datetime """
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return value
+
+    def encode_object(self, obj: T) -> list[Any]:
+        """ Получить значения полей объекта для записи в БД """
+        return [self.encode_value(getattr(obj, field)) for field in self.fields]
+
+    def make_decoder(self, row_fields: list[str]) -> Callable[[Any], T]:
+        """
+        Построить функцию, создающую объект класса T из строки таблицы
+        со значениями полей row_fields. Если конструктор класса принимает
+        все поля позиционно в порядке объявления (обычный dataclass),
+        объект создается без промежуточного словаря.
+        """
+        cls       = self.cls
+        converted = [i for i, name in enumerate(row_fields)
+                     if self.value_type(self.fields[name]) is datetime]
 
-            if field_type == datetime:
-                field_value = datetime.strptime(field_value, self.DEFAULT_DATE_FORMAT)
+        positional = is_dataclass(cls) and [
+            f.name for f in fields(cls) if f.init and not f.kw_only] == row_fields
 
-            class_arguments[field_name] = field_value
+        decode = self.decode_datetime
 
-        obj    = self.cls(**class_arguments)
-        obj.pk = values[0]
+        def convert(row: Any) -> list[Any]:
+            values = list(row)
+            for i in converted:
+                values[i] = decode(values[i])
+            return values
 
-        return obj
+        if positional and len(converted) == 0:
+            return lambda row: cls(*row)
+        if positional:
+            return lambda row: cls(*convert(row))
+        return lambda row: cls(**dict(zip(row_fields, convert(row))))
 
     def add(self, obj: T) -> int:
         # Check for input values:
@@ -86,27 +325,45 @@ class SQLiteRepository(AbstractRepository[T]):
             raise ValueError(f"Unable to add object {obj} with filled `pk` attribute")
 
         # Generate the query:
-        values = [getattr(obj, x) for x in self.fields]
+        values = self.encode_object(obj)
 
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['foreign_keys'])
-
-            # Insert row into database:
-            cur.execute(self.queries['add'], values)
-        con.close()
+        # Insert row into database (committed on exit from the block):
+        with self.pool.transaction() as con:
+            cur = con.execute(self.queries['add'], values)
 
         if cur.lastrowid is not None:
             obj.pk = cur.lastrowid
 
         return obj.pk
 
+    def add_many(self, objs: list[T]) -> list[int]:
+        # Check for input values:
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f"Unable to add object {obj} with filled `pk` attribute")
+
+        if len(objs) == 0:
+            return []
+
+        values = [self.encode_object(obj) for obj in objs]
+
+        # Insert all rows in a single transaction. While the transaction holds
+        # the write lock, SQLite assigns consecutive ROWIDs after the maximal one,
+        # so the inserted rows get the last len(objs) values:
+        with self.pool.transaction() as con:
+            con.executemany(self.queries['add'], values)
+            last_pk = con.execute(self.queries['last_pk']).fetchone()[0]
+
+        pks = list(range(last_pk - len(objs) + 1, last_pk + 1))
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+
+        return pks
+
     def get(self, pk: int) -> T | None:
         # Generate the query:
-        with sqlite3.connect(self.db_file) as con:
-            cur  = con.cursor()
-            rows = cur.execute(self.queries['get'], [pk]).fetchall()
-        con.close()
+        con  = self.pool.connection()
+        rows = con.execute(self.queries['get'], [pk]).fetchall()
 
         # Check result:
         num_rows = len(rows)
@@ -116,60 +373,269 @@ class SQLiteRepository(AbstractRepository[T]):
             raise ValueError(f"Several entries found with pk={pk}")
 
         # Generate the resulting object:
-        return self.generate_object(self.fields, rows[0])
+        return self.decode_row(rows[0])
 
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def column(self, field: str) -> str:
+        """
+        Получить имя столбца таблицы, хранящего поле field.
+        Проверяет название поля, так как оно подставляется в текст запроса.
+        """
+        if field == 'pk':
+            return "ROWID"
+        if field not in self.fields:
+            raise ValueError(f"Unknown field \"{field}\" for table {self.table_name}")
+        return field
+
+    def get_all(
+        self,
+        where    : dict[str, Any] | None = None,
+        *,
+        order_by : OrderBy | None = None,
+        limit    : int | None = None,
+        offset   : int | None = None
+    ) -> list[T]:
         # Generate the query:
-        query_base = self.queries['get_all']
+        tail, params = self.templates.compile(where, order_by, limit, offset)
+        params       = [self.encode_value(param) for param in params]
 
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
+        con  = self.pool.connection()
+        rows = con.execute(self.queries['get_all'] + tail, params).fetchall()
 
-            if where is not None:
-                conditions = " AND ".join([f"{field} = ?" for field in where.keys()])
-                query      = query_base + f" WHERE {conditions}"
+        return [self.decode_row(row) for row in rows]
 
-                rows = cur.execute(query, list(where.values())).fetchall()
+    def iter_all(
+        self,
+        where      : dict[str, Any] | None = None,
+        *,
+        order_by   : OrderBy | None = None,
+        batch_size : int = 1000
+    ) -> Iterator[T]:
+        # Generate the query:
+        tail, params = self.templates.compile(where, order_by, None, None)
+        params       = [self.encode_value(param) for param in params]
+
+        # Fetch the rows in batches, decoding each batch lazily:
+        cur = self.pool.connection().execute(self.queries['get_all'] + tail, params)
+        try:
+            while rows := cur.fetchmany(batch_size):
+                for row in rows:
+                    yield self.decode_row(row)
+        finally:
+            cur.close()
+
+    def get_page(
+        self,
+        key        : str,
+        limit      : int,
+        after      : tuple[Any, int] | None = None,
+        *,
+        descending : bool = False,
+        where      : dict[str, Any] | None = None
+    ) -> list[T]:
+        # Generate the query. The index on key also stores ROWID, so it serves
+        # both the seek to the cursor and the (key, pk) order without sorting:
+        column = self.column(key)
+        tail, params = self.templates.compile(keyset_where(where, key, after, descending),
+                                              None, None, None)
+        if after is not None:
+            # With the bound on key it means (key, pk) < after (or > for ascending):
+            op = "<" if descending else ">"
+            tail   += f" AND ({column} {op} ? OR ROWID {op} ?)"
+            params += list(after)
+
+        order = [f"-{key}", "-pk"] if descending else [key, "pk"]
+        order_tail, order_params = self.templates.compile(None, order, limit, None)
+        params = [self.encode_value(param) for param in params + order_params]
+
+        con  = self.pool.connection()
+        rows = con.execute(self.queries['get_all'] + tail + order_tail, params).fetchall()
+
+        return [self.decode_row(row) for row in rows]
+
+    def aggregate(
+        self,
+        where        : dict[str, Any] | None = None,
+        group_by     : str | None = None,
+        **aggregates : str
+    ) -> dict[Any, Any]:
+        check_aggregates(aggregates)
+
+        # Generate the SELECT list. Sum of an empty set is 0 as in MemoryRepository:
+        columns = []
+        for func, field in aggregates.items():
+            column = "*" if func == 'count' and field == '*' else self.column(field)
+            if func == 'sum':
+                columns.append(f"COALESCE(SUM({column}), 0)")
             else:
-                rows = cur.execute(query_base).fetchall()
-        con.close()
+                columns.append(f"{func.upper()}({column})")
+
+        if group_by is not None:
+            columns.insert(0, self.column(group_by))
+
+        tail, params = self.templates.compile(where, None, None, None)
+        params       = [self.encode_value(param) for param in params]
+        query = f"SELECT {', '.join(columns)} FROM {self.table_name}{tail}"
+        if group_by is not None:
+            query += f" GROUP BY {self.column(group_by)}"
+
+        # Calculate the aggregates in the database:
+        con  = self.pool.connection()
+        rows = con.execute(query, params).fetchall()
+
+        # Dates are stored as text, so their minimums, maximums and groups
+        # are decoded back as in MemoryRepository:
+        funcs  = list(aggregates.keys())
+        dates  = [func in ('min', 'max') and self.is_datetime(field)
+                  for func, field in aggregates.items()]
+        if group_by is None:
+            return self.decode_aggregates(funcs, dates, rows[0])
+        group_dates = self.is_datetime(group_by)
+        return {
+            self.decode_datetime(row[0]) if group_dates else row[0]:
+                self.decode_aggregates(funcs, dates, row[1:])
+            for row in rows
+        }
 
-        return [self.generate_object(self.fields, row) for row in rows]
+    def decode_aggregates(
+        self,
+        funcs  : list[str],
+        dates  : list[bool],
+        values : Sequence[Any]
+    ) -> dict[str, Any]:
+        """ Собрать значения агрегатов, раскодировав даты """
+        return {func: self.decode_datetime(value) if date else value
+                for func, date, value in zip(funcs, dates, values)}
+
+    def is_datetime(self, field: str) -> bool:
+        """ Проверить, хранит ли поле field значения datetime """
+        return self.value_type(self.fields.get(field)) is datetime
+
+    def check_hierarchy(self) -> None:
+        """ Проверить, что для таблицы ведется иерархия """
+        if self.hierarchy is None:
+            raise ValueError(f"Table {self.table_name} has no hierarchy")
+
+    def get_descendants(self, pk: int) -> list[T]:
+        """
+        Получить всех потомков записи pk в иерархии (без нее самой)
+        по уровням: сначала детей, затем внуков и т.д.
+        """
+        self.check_hierarchy()
+        con  = self.pool.connection()
+        rows = con.execute(self.queries['descendants'], [pk]).fetchall()
+        return [self.decode_row(row) for row in rows]
 
-    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
-        # Insert '%' sign to allow pattern-matching
-        values = [f"%{v}%" for v in patterns.values()]
-        where  = dict(zip(patterns.keys(), values))
+    def get_ancestors(self, pk: int) -> list[T]:
+        """
+        Получить всех предков записи pk в иерархии от родителя до записи
+        верхнего уровня.
+        """
+        self.check_hierarchy()
+        con  = self.pool.connection()
+        rows = con.execute(self.queries['ancestors'], [pk]).fetchall()
+        return [self.decode_row(row) for row in rows]
+
+    def subtree(self, pk: int) -> Condition:
+        """
+        Получить условие "ссылается на запись pk или любого ее потомка"
+        для отбора записей этой или другой таблицы той же БД, например:
+            expense_repo.get_all({'category': category_repo.subtree(pk)})
+        """
+        self.check_hierarchy()
+        return InQuery(self.queries['subtree'], (pk,))
+
+    def rollup(
+        self,
+        records      : AbstractRepository[Any],
+        ref_field    : str,
+        value_field  : str,
+        where        : dict[str, Any] | None = None,
+        parent_field : str = 'parent'
+    ) -> dict[int, Any]:
+        # Only the tables of the same database can be joined:
+        if not isinstance(records, SQLiteRepository) or records.pool is not self.pool:
+            return super().rollup(records, ref_field, value_field, where, parent_field)
+
+        table  = self.table_name
+        parent = self.column(parent_field)
+        tail, params = records.templates.compile(where, None, None, None)
+        params       = [self.encode_value(param) for param in params]
+
+        # Totals of the records are summed over all the pairs (ancestor, descendant)
+        # found by walking up from every record of the hierarchy. Depth is limited
+        # by the number of records to stop on cycles in the data:
+        query = f"""
+            WITH RECURSIVE
+            totals(node, total) AS (
+                SELECT {records.column(ref_field)}, SUM({records.column(value_field)})
+                FROM {records.table_name}{tail}
+                GROUP BY 1),
+            paths(ancestor, descendant, depth) AS (
+                SELECT ROWID, ROWID, 0 FROM {table}
+                UNION ALL
+                SELECT {table}.{parent}, paths.descendant, paths.depth + 1
+                FROM paths JOIN {table} ON {table}.ROWID = paths.ancestor
+                WHERE {table}.{parent} IS NOT NULL
+                  AND paths.depth < (SELECT COUNT(*) FROM {table}))
+            SELECT paths.ancestor, COALESCE(SUM(totals.total), 0)
+            FROM paths LEFT JOIN totals ON totals.node = paths.descendant
+            WHERE paths.ancestor IN (SELECT ROWID FROM {table})
+            GROUP BY paths.ancestor
+        """
 
-        # Call regular get_all():
-        return self.get_all(where=where)
+        con = self.pool.connection()
+        return dict(con.execute(query, params).fetchall())
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
+        # Compile the patterns into LIKE '%value%' conditions:
+        return self.get_all({field: contains(value) for field, value in patterns.items()})
 
     def update(self, obj: T) -> None:
         if getattr(obj, 'pk', None) is None:
             raise ValueError("Unable to update object without `pk` attribute")
 
-        values = [getattr(obj, field) for field in self.fields] + [obj.pk]
-
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['foreign_keys'])
+        values = self.encode_object(obj) + [obj.pk]
 
-            # Update the entry with ROWID=pk:
-            print(self.queries['update'])
-            print(values)
-
-            cur.execute(self.queries['update'], values)
+        # Update the entry with ROWID=pk (rolled back on error):
+        with self.pool.transaction() as con:
+            cur = con.execute(self.queries['update'], values)
 
             if cur.rowcount == 0:
                 raise ValueError(f"Unable to update object with pk={obj.pk}")
-        con.close()
+
+    def update_many(self, objs: list[T]) -> None:
+        for obj in objs:
+            if getattr(obj, 'pk', None) is None:
+                raise ValueError("Unable to update object without `pk` attribute")
+
+        if len(objs) == 0:
+            return
+
+        values = [self.encode_object(obj) + [obj.pk] for obj in objs]
+
+        # Update all the entries in a single transaction (rolled back on error):
+        with self.pool.transaction() as con:
+            cur = con.executemany(self.queries['update'], values)
+
+            if cur.rowcount != len(objs):
+                raise ValueError("Unable to update objects with pk="
+                                 f"{[obj.pk for obj in objs]}")
 
     def delete(self, pk: int) -> None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
+        # Remove the entry with ROWID=pk (rolled back on error):
+        with self.pool.transaction() as con:
+            cur = con.execute(self.queries['delete'], [pk])
 
-            # Remove the entry with ROWID=pk:
-            cur.execute(self.queries['delete'], [pk])
             if cur.rowcount == 0:
-                raise ValueError("Unable to delete object with pk={pk}")
-        con.close()
+                raise ValueError(f"Unable to delete object with pk={pk}")
+
+    def delete_many(self, pks: list[int]) -> None:
+        if len(pks) == 0:
+            return
+
+        # Remove all the entries in a single transaction (rolled back on error):
+        with self.pool.transaction() as con:
+            cur = con.executemany(self.queries['delete'], [[pk] for pk in pks])
+
+            if cur.rowcount != len(pks):
+                raise ValueError(f"Unable to delete objects with pk={pks}")
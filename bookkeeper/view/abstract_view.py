@@ -1,9 +1,12 @@
-from typing import Protocol, Callable
+from typing import Protocol, Callable, Any
 
-from bookkeeper.models.category import Category
+from bookkeeper.models.category import Category, CategoryIndex
 from bookkeeper.models.expense  import Expense
 from bookkeeper.models.budget   import Budget
 
+# Progress of a background task: (done, total)
+Progress = Callable[[int, int], None]
+
 
 class AbstractView(Protocol):
     """
@@ -13,15 +16,51 @@ class AbstractView(Protocol):
     def show_main_window(self) -> None:
         pass
 
-    def set_categories(self, cats : list[Category]) -> None:
+    # Background work: task(progress) is run off the interface thread,
+    # on_done(result) or on_error(exception) - in it, before the error is
+    # reported. Tasks are run one at a time in their order:
+    def run_in_background(
+        self,
+        task     : Callable[[Progress], Any],
+        on_done  : Callable[[Any], None],
+        title    : str | None = None,
+        on_error : Callable[[Exception], None] | None = None
+    ) -> None:
+        pass
+
+    def wait_background(self) -> None:
+        pass
+
+    # The index of the categories is shared by the presenter, if given:
+    def set_categories(
+        self,
+        cats  : list[Category],
+        index : CategoryIndex | None = None
+    ) -> None:
         pass
 
     def set_expenses(self, cats : list[Expense]) -> None:
         pass
 
+    def set_expense_source(
+        self,
+        fetch: Callable[[Expense | None, int], list[Expense]]
+    ) -> None:
+        pass
+
     def set_budgets(self, cats : list[Budget]) -> None:
         pass
 
+    # Incremental updates of the shown expenses:
+    def expense_added(self, exp : Expense) -> None:
+        pass
+
+    def expense_updated(self, exp : Expense) -> None:
+        pass
+
+    def expenses_removed(self, pks : set[int]) -> None:
+        pass
+
     def set_category_add_handler(
         self,
         cat_add_handler: Callable[[str, str | None], None]
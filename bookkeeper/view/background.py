@@ -0,0 +1,140 @@
+from itertools import count
+from threading import Event
+from typing    import Any, Callable, Iterator
+
+from PySide6.QtCore import (  # pylint: disable=no-name-in-module
+    QCoreApplication, QObject, QRunnable, QThreadPool, Signal, Slot)
+
+from bookkeeper.view.abstract_view import Progress
+
+# Background task: receives the progress callback, returns the result
+Task = Callable[[Progress], Any]
+
+# Handlers of a task: of the result, of an exception and of the progress
+Handlers = tuple[Callable[[Any], None], Callable[[Exception], None], Progress]
+
+
+class WorkerSignals(QObject):  # pylint: disable=too-few-public-methods
+    """
+    Сигналы фоновой задачи номер key: результат, исключение и ход
+    выполнения. Испускаются в рабочем потоке, а обрабатываются в потоке
+    получателя (главном потоке интерфейса).
+    """
+
+    done     = Signal(int, object)
+    failed   = Signal(int, object)
+    progress = Signal(int, int, int)
+
+
+class Worker(QRunnable):
+    """
+    Фоновая задача task номер key, выполняемая пулом потоков.
+    """
+
+    def __init__(self, key: int, task: Task) -> None:
+        super().__init__()
+        self.key      = key
+        self.task     = task
+        self.signals  = WorkerSignals()
+        self.finished = Event()
+
+        # The worker is deleted by it's runner, not by the pool:
+        self.setAutoDelete(False)
+
+    def run(self) -> None:
+        try:
+            result = self.task(self.report)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            # Any error is passed to the interface thread to be handled there:
+            self.signals.failed.emit(self.key, exc)
+        else:
+            self.signals.done.emit(self.key, result)
+        finally:
+            # The result is already posted to the interface thread:
+            self.finished.set()
+
+    def report(self, done: int, total: int) -> None:
+        """ Сообщить о ходе выполнения задачи """
+        self.signals.progress.emit(self.key, done, total)
+
+
+class BackgroundRunner(QObject):
+    """
+    Исполнитель фоновых задач: задачи выполняются по очереди в пуле
+    из одного потока, поэтому хранилище данных никогда не используется
+    из двух потоков одновременно, а задачи выполняются в порядке запуска.
+    Результат задачи передается обработчику on_done в главном потоке.
+    Исключение задачи передается обработчику on_error, ход выполнения -
+    обработчику on_progress, также в главном потоке.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+
+        # Type annotations:
+        self.pool     : QThreadPool          # Pool of a single thread
+        self.workers  : dict[int, Worker]    # Running tasks by their keys
+        self.handlers : dict[int, Handlers]  # Handlers of the running tasks
+        self.keys     : Iterator[int]        # Keys of the next tasks
+
+        # Initialization:
+        self.pool     = QThreadPool()
+        self.workers  = {}
+        self.handlers = {}
+        self.keys     = count()
+
+        # The thread never expires: a new thread would open another
+        # connection to the database, while the old one is never closed:
+        self.pool.setMaxThreadCount(1)
+        self.pool.setExpiryTimeout(-1)
+
+    def run(
+        self,
+        task        : Task,
+        on_done     : Callable[[Any], None],
+        on_error    : Callable[[Exception], None],
+        on_progress : Progress = lambda done, total: None
+    ) -> None:
+        """ Запустить задачу task в фоне """
+        worker = Worker(next(self.keys), task)
+        worker.signals.done.connect(self.task_done)
+        worker.signals.failed.connect(self.task_failed)
+        worker.signals.progress.connect(self.task_progress)
+
+        # The worker is kept until it's results are delivered:
+        self.workers[worker.key]  = worker
+        self.handlers[worker.key] = (on_done, on_error, on_progress)
+        self.pool.start(worker)
+
+    def busy(self) -> bool:
+        """ Есть ли задачи, результаты которых еще не обработаны """
+        return len(self.handlers) != 0
+
+    def wait(self) -> None:
+        """
+        Дождаться выполнения всех задач, в том числе запущенных
+        обработчиками результатов, и обработать их результаты.
+        """
+        # QThreadPool.waitForDone() would also remove the thread of the pool:
+        while self.busy():
+            for worker in list(self.workers.values()):
+                worker.finished.wait()
+            QCoreApplication.sendPostedEvents()
+
+    @Slot(int, object)
+    def task_done(self, key: int, result: Any) -> None:
+        self.workers.pop(key)
+        on_done, _, _ = self.handlers.pop(key)
+        on_done(result)
+
+    @Slot(int, object)
+    def task_failed(self, key: int, exc: Exception) -> None:
+        self.workers.pop(key)
+        _, on_error, _ = self.handlers.pop(key)
+        on_error(exc)
+
+    @Slot(int, int, int)
+    def task_progress(self, key: int, done: int, total: int) -> None:
+        handlers = self.handlers.get(key)
+        if handlers is not None:
+            handlers[2](done, total)
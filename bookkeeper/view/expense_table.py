@@ -1,39 +1,252 @@
+from copy   import copy
 from typing import Callable, Any
 
 from PySide6        import QtWidgets
-from PySide6.QtCore import Signal, Qt  # pylint: disable=no-name-in-module
+from PySide6.QtCore import (  # pylint: disable=no-name-in-module
+    QAbstractTableModel, QModelIndex, QPersistentModelIndex, Qt)
 
 from bookkeeper.models.expense import Expense
 
+# Source of expenses: (last loaded expense or None, number) -> next expenses
+ExpenseFetcher = Callable[[Expense | None, int], list[Expense]]
 
-class ExpenseTableWidget(QtWidgets.QTableWidget):
+# Runs a page fetch (load) somewhere and passes it's result to on_done
+# or it's exception to on_error: (load, on_done, on_error)
+PageLoader = Callable[[Callable[[], list[Expense]],
+                       Callable[[list[Expense]], None],
+                       Callable[[Exception], None]],
+                      None]
+
+# Index of a model cell:
+Index = QModelIndex | QPersistentModelIndex
+
+
+class ExpenseTableModel(QAbstractTableModel):
     """
-    Виджет для расхода.
+    Модель таблицы расходов, последние расходы идут первыми.
+    Расходы подгружаются страницами по PAGE_SIZE штук по мере прокрутки
+    таблицы (canFetchMore/fetchMore) из источника, заданного set_source,
+    поэтому в памяти хранятся только показанные строки. Источник получает
+    последний загруженный расход в том виде, в котором он был загружен,
+    и продолжает выборку с него. Если задан загрузчик loader (set_loader),
+    страницы получаются через него, например в фоновом потоке: пока страница
+    загружается, следующая не запрашивается, а страницы замененного
+    источника отбрасываются. Изменение ячейки (setData) передается
+    обработчику expense_modify_handler.
     """
 
-    cellDoubleClicked : Signal  # Double-click handler with attachable pre-handler
-    cellChanged       : Signal  # Cell changed handler with attachable pre-handler
+    # Number of expenses fetched at once:
+    PAGE_SIZE = 100
+
+    col_to_attr = {0: "expense_date", 1: "amount", 2: "category", 3: "comment"}
+    headers     = "Дата Сумма Категория Комментарий".split()
 
-    data : list[list[str]]
+    expenses : list[Expense]          # Loaded expenses
+    rows     : dict[int, int]         # Row of every loaded expense by it's pk
+    fetcher  : ExpenseFetcher | None  # Source of the next expenses
+    loader   : PageLoader | None      # Runner of the fetches, None - in place
+    source   : int                    # Number of the current source
+    last     : Expense | None         # Copy of the last fetched expense
+    fetched  : bool                   # All the expenses are loaded
+    loading  : bool                   # A page is being loaded
 
     def __init__(
         self,
+        category_pk_to_name    : Callable[[int], str],
         expense_modify_handler : Callable[[int, str, Any], None],
         *args                  : Any,
         **kwargs               : Any
     ):
         super().__init__(*args, **kwargs)
 
+        self.category_pk_to_name    = category_pk_to_name
         self.expense_modify_handler = expense_modify_handler
 
-        self.col_to_attr = {0: "expense_date", 1: "amount", 2: "category", 3: "comment"}
+        self.expenses = []
+        self.rows     = {}
+        self.fetcher  = None
+        self.loader   = None
+        self.source   = 0
+        self.last     = None
+        self.fetched  = True
+        self.loading  = False
+
+    ########################
+    ## Qt model interface ##
+    ########################
+
+    # pylint: disable=invalid-name
+    def rowCount(self, parent: Index = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.expenses)
+
+    def columnCount(self, parent: Index = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.col_to_attr)
+
+    def headerData(
+        self,
+        section     : int,
+        orientation : Qt.Orientation,
+        role        : int = Qt.DisplayRole  # type: ignore
+    ) -> Any:
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:  # type: ignore
+            return self.headers[section]
+        return None
+
+    def data(self, index: Index, role: int = Qt.DisplayRole) -> Any:  # type: ignore
+        if not index.isValid():
+            return None
+
+        text = self.cell_text(self.expenses[index.row()], index.column())
+        if role == Qt.DisplayRole:  # type: ignore
+            return text.capitalize()
+        if role == Qt.EditRole:  # type: ignore
+            return text
+        return None
+
+    def flags(self, index: Index) -> Qt.ItemFlag:
+        return super().flags(index) | Qt.ItemIsEditable  # type: ignore
+
+    def setData(
+        self,
+        index : Index,
+        value : Any,
+        role  : int = Qt.EditRole  # type: ignore
+    ) -> bool:
+        if not index.isValid() or role != Qt.EditRole:  # type: ignore
+            return False
+
+        # The row itself is updated by the presenter with update_expense():
+        pk = self.expenses[index.row()].pk
+        self.expense_modify_handler(pk, self.col_to_attr[index.column()], str(value))
+        return True
+
+    def canFetchMore(self, parent: Index = QModelIndex()) -> bool:
+        return not parent.isValid() and not self.fetched and not self.loading
+
+    def fetchMore(self, parent: Index = QModelIndex()) -> None:
+        if parent.isValid() or self.fetcher is None or self.loading:
+            return
+
+        fetcher, last, source = self.fetcher, self.last, self.source
+        if self.loader is None:
+            self.add_page(source, fetcher(last, self.PAGE_SIZE))
+            return
+
+        self.loading = True
+        self.loader(lambda: fetcher(last, self.PAGE_SIZE),
+                    lambda page: self.add_page(source, page),
+                    lambda exc: self.page_failed(source))
+    # pylint: enable=invalid-name
+
+    ######################
+    ## Expenses content ##
+    ######################
+
+    def add_page(self, source: int, page: list[Expense]) -> None:
+        # The page of a replaced source is out of date:
+        if source != self.source:
+            return
+
+        self.loading = False
+        self.fetched = len(page) < self.PAGE_SIZE
+
+        if page:
+            # The shown expense may be modified later, the cursor may not:
+            self.last = copy(page[-1])
+
+            start = len(self.expenses)
+            self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+            for row, exp in enumerate(page, start):
+                self.rows[exp.pk] = row
+            self.expenses.extend(page)
+            self.endInsertRows()
+
+    def page_failed(self, source: int) -> None:
+        # A failing query is not repeated on every scroll: the expenses
+        # are not fetched any more until the source is set again:
+        if source == self.source:
+            self.loading = False
+            self.fetched = True
+
+    def cell_text(self, exp: Expense, column: int) -> str:
+        value = getattr(exp, self.col_to_attr[column])
+        if not value:
+            return ""
+        if column == 2:
+            return str(self.category_pk_to_name(value))
+        return str(value)
+
+    def set_loader(self, loader: PageLoader | None) -> None:
+        self.loader = loader
+
+    def set_source(self, fetcher: ExpenseFetcher) -> None:
+        self.beginResetModel()
+        self.expenses = []
+        self.rows     = {}
+        self.fetcher  = fetcher
+        self.source  += 1
+        self.last     = None
+        self.fetched  = False
+        self.loading  = False
+        self.endResetModel()
+
+    def set_expenses(self, exps: list[Expense]) -> None:
+        self.beginResetModel()
+        self.expenses = exps
+        self.rows     = {exp.pk: row for row, exp in enumerate(exps)}
+        self.fetcher  = None
+        self.source  += 1
+        self.last     = None
+        self.fetched  = True
+        self.loading  = False
+        self.endResetModel()
+
+    def add_expense(self, exp: Expense) -> None:
+        # The first page is not fetched yet and will contain the expense:
+        if self.last is None and not self.fetched:
+            return
+
+        # A new expense is the most recent one, so it goes first:
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.expenses.insert(0, exp)
+        self.rows = {item.pk: row for row, item in enumerate(self.expenses)}
+        self.endInsertRows()
+
+    def update_expense(self, exp: Expense) -> None:
+        row = self.rows.get(exp.pk)
+        if row is None:
+            return
+
+        self.expenses[row] = exp
+        self.dataChanged.emit(self.index(row, 0),
+                              self.index(row, self.columnCount() - 1))
+
+    def remove_expenses(self, pks: set[int]) -> None:
+        # Remove from the bottom up to keep the indices of the remaining rows:
+        rows = sorted((self.rows[pk] for pk in pks if pk in self.rows), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.expenses[row]
+            self.endRemoveRows()
+
+        if rows:
+            self.rows = {exp.pk: row for row, exp in enumerate(self.expenses)}
+
+
+class ExpenseTableView(QtWidgets.QTableView):  # pylint: disable=too-few-public-methods
+    """
+    Таблица расходов.
+    """
 
-        # Table configuration:
-        self.setColumnCount(4)
-        self.setRowCount(20)
+    def __init__(
+        self,
+        model    : ExpenseTableModel,
+        *args    : Any,
+        **kwargs : Any
+    ):
+        super().__init__(*args, **kwargs)
 
-        headers = "Дата Сумма Категория Комментарий".split()
-        self.setHorizontalHeaderLabels(headers)
+        self.setModel(model)
 
         # Configure table header:
         header = self.horizontalHeader()
@@ -53,37 +266,8 @@ class ExpenseTableWidget(QtWidgets.QTableWidget):
         self.setEditTriggers(
             QtWidgets.QAbstractItemView.DoubleClicked)  # type: ignore
 
-        # Handle the change event of all cells collectively:
-        #   On cell double-click bind onChange handler.
-        #   Reset it on "onChanged" event.
-        self.cellDoubleClicked.connect(self.double_click)
-
-    def double_click(self, row: int, column: int) -> None:
-        # Parameters unused:
-        del row, column
-
-        # Bind the cell_changed() as cellChanged handler
-        self.cellChanged.connect(self.cell_changed)
-
-    def cell_changed(self, row: int, column: int) -> None:
-        # Unbind cell_changed():
-        self.cellChanged.disconnect(self.cell_changed)
-
-        # Generate a database request on edit:
-        pk      = int(self.data[row][-1])
-        new_val = self.item(row, column).text()
-        attr    = self.col_to_attr[column]
-
-        self.expense_modify_handler(pk, attr, new_val)
-
-    def add_data(self, data: list[list[str]]) -> None:
-        self.data = data
-        for row_i, row in enumerate(data):
-            for item_j, item in enumerate(row[:-1]):
-                self.setItem(
-                    row_i, item_j,
-                    QtWidgets.QTableWidgetItem(item.capitalize())
-                )
+    def selected_rows(self) -> set[int]:
+        return {index.row() for index in self.selectionModel().selectedIndexes()}
 
 
 class LabeledExpenseTable(QtWidgets.QGroupBox):
@@ -91,9 +275,6 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
     Виджет для расхода с подписью.
     """
 
-    expenses : list[Expense]
-    data     : list[list[str]]
-
     def __init__(
         self,
         category_pk_to_name    : Callable[[int], str],
@@ -112,7 +293,8 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
         self.label.setAlignment(Qt.AlignCenter)  # type: ignore
 
         # Expense table:
-        self.table = ExpenseTableWidget(expense_modify_handler)
+        self.model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+        self.table = ExpenseTableView(self.model)
 
         # Delete button:
         self.del_button = QtWidgets.QPushButton('Удалить выбранные траты')
@@ -126,48 +308,30 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
 
         self.setLayout(self.vbox)
 
+    @property
+    def expenses(self) -> list[Expense]:
+        return self.model.expenses
+
     def set_expenses(self, exps: list[Expense]) -> None:
-        self.expenses = exps
+        self.model.set_expenses(exps)
 
-        # Update rendered data:
-        self.data = self.exps_to_data(self.expenses)
-
-        # Update the subsequent table:
-        self.table.clearContents()
-        self.table.add_data(self.data)
-
-    def exps_to_data(self, exps: list[Expense]) -> list[list[str]]:
-        data = []
-        for exp in exps:
-            # Visualize category fields:
-            item = ["", "", "", "", str(exp.pk)]
-            if exp.expense_date:
-                item[0] = str(exp.expense_date)
-            if exp.amount:
-                item[1] = str(exp.amount)
-            if exp.category:
-                item[2] = str(
-                    self.category_pk_to_name(exp.category))
-            if exp.comment:
-                item[3] = str(exp.comment)
-
-            # Insert category visualization:
-            data.append(item)
-
-        return data
+    def set_source(self, fetcher: ExpenseFetcher) -> None:
+        self.model.set_source(fetcher)
 
-    def delete_selected_expenses(self) -> None:
-        # List of primary keys to delete:
-        pks_to_del = []
+    def set_loader(self, loader: PageLoader | None) -> None:
+        self.model.set_loader(loader)
 
-        # Iterate over ranges shosen for removal:
-        chosen_ranges = self.table.selectedRanges()
+    # Incremental updates touch only the rows of the changed expenses:
+    def add_expense(self, exp: Expense) -> None:
+        self.model.add_expense(exp)
 
-        for ch_range in chosen_ranges:
-            start = ch_range.topRow()
-            end   = min(ch_range.bottomRow(), len(self.data))
+    def update_expense(self, exp: Expense) -> None:
+        self.model.update_expense(exp)
 
-            pks_to_del += [int(i[-1]) for i in self.data[start:end + 1]]
+    def remove_expenses(self, pks: set[int]) -> None:
+        self.model.remove_expenses(pks)
 
-        # Remove from the database all utems with selected pk
-        self.expanse_delete_handler(set(pks_to_del))
+    def delete_selected_expenses(self) -> None:
+        # Remove from the database all items in the selected rows:
+        pks_to_del = {self.model.expenses[row].pk for row in self.table.selected_rows()}
+        self.expanse_delete_handler(pks_to_del)
@@ -1,14 +1,16 @@
 from typing import Callable, Any
 
-from PySide6 import QtWidgets
+from PySide6        import QtWidgets
+from PySide6.QtCore import Qt  # pylint: disable=no-name-in-module
 
+from bookkeeper.view.background           import BackgroundRunner, Task
 from bookkeeper.view.main_window          import MainWindow
 from bookkeeper.view.budget_table         import LabeledBudgetTable
 from bookkeeper.view.new_expense          import NewExpense
-from bookkeeper.view.expense_table        import LabeledExpenseTable
+from bookkeeper.view.expense_table        import LabeledExpenseTable, ExpenseFetcher
 from bookkeeper.view.category_edit_window import CategoryEditWindow
 
-from bookkeeper.models.category import Category
+from bookkeeper.models.category import Category, CategoryIndex
 from bookkeeper.models.expense  import Expense
 from bookkeeper.models.budget   import Budget
 
@@ -37,10 +39,11 @@ class View:
     new_expense      : NewExpense
     expense_table    : LabeledExpenseTable
     cats_edit_window : CategoryEditWindow
+    runner           : BackgroundRunner
 
     # Internal representation:
-    categories : list[Category] = []
-    expenses   : list[Expense]
+    categories     : list[Category] = []
+    category_index : CategoryIndex
     budgets    : list[Budget]
 
     # All sorts of handlers:
@@ -59,6 +62,9 @@ class View:
         if self.app is None:
             raise RuntimeError("Unable to locate the open QApplication instance")
 
+        self.category_index = CategoryIndex(self.categories)
+        self.runner         = BackgroundRunner()
+
         self.config_category_edit()
         self.budget_table = LabeledBudgetTable(self.modify_budget)
         self.new_expense  = NewExpense(self.categories,
@@ -67,6 +73,7 @@ class View:
         self.expense_table = LabeledExpenseTable(self.category_pk_to_name,
                                                  self.modify_expense,
                                                  self.delete_expenses)
+        self.expense_table.set_loader(self.load_page)
 
         self.config_main_window()
 
@@ -99,6 +106,65 @@ class View:
     def show_category_edit(self) -> None:
         self.cats_edit_window.show()
 
+    #####################
+    ## Background work ##
+    #####################
+
+    def run_in_background(
+        self,
+        task     : Task,
+        on_done  : Callable[[Any], None],
+        title    : str | None = None,
+        on_error : Callable[[Exception], None] | None = None
+    ) -> None:
+        # Long tasks show their progress, while the window stays responsive:
+        dialog = None if title is None else self.progress_dialog(title)
+
+        def progress(done: int, total: int) -> None:
+            if dialog is not None:
+                dialog.setMaximum(total)
+                dialog.setValue(done)
+
+        def finish() -> None:
+            if dialog is not None:
+                dialog.close()
+                dialog.deleteLater()
+
+        def done(result: Any) -> None:
+            finish()
+            on_done(result)
+
+        def failed(exc: Exception) -> None:
+            finish()
+            if on_error is not None:
+                on_error(exc)
+            if not isinstance(exc, ValueError):
+                raise exc
+            QtWidgets.QMessageBox.critical(self.main_window, 'Ошибка', str(exc))
+
+        self.runner.run(task, done, failed, progress)
+
+    def wait_background(self) -> None:
+        self.runner.wait()
+
+    def progress_dialog(self, title: str) -> QtWidgets.QProgressDialog:
+        # Busy indicator until the task reports it's progress:
+        dialog = QtWidgets.QProgressDialog(self.main_window, labelText=title,
+                                           minimum=0, maximum=0, minimumDuration=500,
+                                           autoClose=False, autoReset=False)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)  # type: ignore
+        dialog.setCancelButton(None)
+        return dialog
+
+    def load_page(
+        self,
+        load     : Callable[[], list[Expense]],
+        on_done  : Callable[[list[Expense]], None],
+        on_error : Callable[[Exception], None]
+    ) -> None:
+        self.run_in_background(lambda progress: load(), on_done, on_error=on_error)
+
     #########################
     ## Category operations ##
     #########################
@@ -129,13 +195,16 @@ class View:
 
     # Direct operations:
     def category_pk_to_name(self, pk: int) -> str:
-        name = [c.name for c in self.categories if int(c.pk) == int(pk)]
-        if len(name):
-            return str(name[0])
-        return ""
+        return self.category_index.name(int(pk))
 
-    def set_categories(self, cats: list[Category]) -> None:
-        self.categories = cats
+    def set_categories(
+        self,
+        cats  : list[Category],
+        index : CategoryIndex | None = None
+    ) -> None:
+        # The presenter's index is used as is, otherwise the view builds one:
+        self.categories     = cats
+        self.category_index = CategoryIndex(cats) if index is None else index
         self.new_expense.set_categories(self.categories)
         self.cats_edit_window.set_categories(self.categories)
 
@@ -169,9 +238,25 @@ class View:
         self.exp_modify_handler = try_for_widget(exp_modify_handler, self.main_window)
 
     # Direct operations:
+    @property
+    def expenses(self) -> list[Expense]:
+        return self.expense_table.expenses
+
     def set_expenses(self, exps: list[Expense]) -> None:
-        self.expenses = exps
-        self.expense_table.set_expenses(self.expenses)
+        # The list is updated incrementally, so the caller's one is copied:
+        self.expense_table.set_expenses(list(exps))
+
+    def set_expense_source(self, fetch: ExpenseFetcher) -> None:
+        self.expense_table.set_source(fetch)
+
+    def expense_added(self, exp: Expense) -> None:
+        self.expense_table.add_expense(exp)
+
+    def expense_updated(self, exp: Expense) -> None:
+        self.expense_table.update_expense(exp)
+
+    def expenses_removed(self, pks: set[int]) -> None:
+        self.expense_table.remove_expenses(pks)
 
     def add_expense(self, amount: str, cat_name: str, comment: str = "") -> None:
         self.exp_add_handler(amount, cat_name, comment)
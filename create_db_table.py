@@ -1,26 +1,13 @@
-import sqlite3
-
-from inspect import get_annotations
-
 from bookkeeper.models.category              import Category
 from bookkeeper.models.expense               import Expense
 from bookkeeper.models.budget                import Budget
 from bookkeeper.repository.sqlite_repository import SQLiteRepository
 from bookkeeper.utils                        import read_tree
 
+# Create typed tables with their indexes for all the models:
 for db_file in ["database/bookkeeper.db"]:
     for cls in [Category, Expense, Budget]:
-        table_name = cls.__name__.lower()
-        fields = get_annotations(cls, eval_str=True)
-        fields.pop('pk')
-
-        # Create table with name of a class from the list:
-        with sqlite3.connect(db_file) as con:
-            cur = con.cursor()
-
-            query_fields = ', '.join(fields.keys())
-            cur.execute(f"CREATE TABLE IF NOT EXISTS {table_name}({query_fields})")
-        con.close()
+        SQLiteRepository(db_file=db_file, cls=cls)
 
 cat_repo = SQLiteRepository[Category](db_file="database/bookkeeper.db", cls=Category)
 
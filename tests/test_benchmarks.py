@@ -0,0 +1,82 @@
+import json
+from random import Random
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.cases import CASES
+from benchmarks.data import make_category_tree, make_expenses
+from benchmarks.stand import BACKENDS, Stand
+
+
+def test_make_category_tree():
+    tree = make_category_tree(2, 3, 1)
+    assert len(tree) == 2 + 2 * 3
+    assert [parent for _, parent in tree[:2]] == [None, None]
+    assert [parent for _, parent in tree[2:5]] == [tree[0][0]] * 3
+
+    # Parents go before their children:
+    seen = set()
+    for name, parent in tree:
+        assert parent is None or parent in seen
+        seen.add(name)
+
+
+def test_make_expenses():
+    exps = make_expenses(50, [1, 2], Random(0))
+    assert len(exps) == 50
+    assert {exp.category for exp in exps} <= {1, 2}
+    assert all(exp.pk == 0 for exp in exps)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_cases_run(backend):
+    with Stand(backend, 50) as stand:
+        assert len(stand.expense_repo.get_all()) == 50
+        for case in CASES:
+            if case.applies_to(stand):
+                case.prepare(stand)()
+
+
+def test_tuned_backend():
+    with Stand("sqlite-tuned", 10) as stand:
+        con = stand.expense_repo.pool.connection()
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Stand("csv", 10)
+
+
+def test_main(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--sizes", "20", "--backends", "memory", "--cases", "repo.get",
+          "--repeat", "2", "--output", str(output)])
+
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert set(results["meta"]) >= {"python", "sqlite", "timestamp"}
+    assert [row["case"] for row in results["results"]] == [
+        "fill", "repo.get", "repo.get_all[category]", "repo.get_all[week]",
+        "repo.get_all[amount]", "repo.get_all_by_pattern", "repo.get_page"]
+
+    # Concurrent reads are measured for SQLite only:
+    main(["--sizes", "20", "--backends", "memory", "sqlite-tuned", "--cases", "repo.get[",
+          "--repeat", "1", "--output", str(output)])
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert [(row["case"], row["backend"]) for row in results["results"]] == [
+        ("fill", "memory"), ("fill", "sqlite-tuned"),
+        ("repo.get[writing]", "sqlite-tuned")]
+    assert all(row["min"] <= row["median"] for row in results["results"])
+
+
+def test_main_profile(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--sizes", "20", "--backends", "sqlite", "--cases", "repo.get_page",
+          "bookkeeper.fetch_expenses", "--repeat", "2", "--profile",
+          "--output", str(output)])
+
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert results["meta"]["profile"]
+    assert [(row["calls"], row["queries"]) for row in results["results"][1:]] == [
+        (1, 1), (1, 1)]
@@ -0,0 +1,156 @@
+"""
+Тесты презентера Bookkeeper
+"""
+
+import pytest
+
+from bookkeeper.bookkeeper                   import Bookkeeper
+from bookkeeper.models.category              import Category
+from bookkeeper.models.expense               import Expense
+from bookkeeper.models.budget                import Budget
+from bookkeeper.repository.memory_repository import MemoryRepository
+
+
+class InlineView:
+    """ Представление, выполняющее фоновые задачи сразу """
+
+    def __init__(self):
+        self.calls = []
+
+    def run_in_background(self, task, on_done, title=None):
+        on_done(task(lambda done, total: None))
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+class QueuedView(InlineView):
+    """ Представление, выполняющее фоновые задачи по требованию """
+
+    def __init__(self):
+        super().__init__()
+        self.tasks  = []
+        self.errors = []
+
+    def run_in_background(self, task, on_done, title=None, on_error=None):
+        self.tasks.append((task, on_done))
+
+    def run_tasks(self, handle=True):
+        # Errors are reported as the view does, results are handled on demand:
+        tasks, self.tasks = self.tasks, []
+        results = []
+        for task, on_done in tasks:
+            try:
+                results.append((on_done, task(lambda done, total: None)))
+            except ValueError as exc:
+                self.errors.append(str(exc))
+        if handle:
+            for on_done, result in results:
+                on_done(result)
+        return results
+
+
+@pytest.fixture
+def repos():
+    return {model: MemoryRepository(cls=model) for model in (Category, Expense, Budget)}
+
+
+@pytest.fixture
+def bookkeeper(repos):
+    return Bookkeeper(InlineView(), repos.__getitem__)
+
+
+def test_delete_category_rollback(bookkeeper, repos, monkeypatch):
+    bookkeeper.add_category('food')
+    bookkeeper.add_category('meat', 'food')
+    bookkeeper.add_category('raw', 'meat')
+    bookkeeper.add_expense('100', 'meat')
+
+    def fail(pks):
+        raise RuntimeError
+
+    monkeypatch.setattr(repos[Expense], 'delete_many', fail)
+    with pytest.raises(RuntimeError):
+        bookkeeper.delete_category('meat')
+
+    # The child edited for the update is restored together with it's parent:
+    meat = bookkeeper.category_index.get('meat')
+    assert repos[Category].get(meat.pk) == meat
+    assert repos[Category].get_all({'name': 'raw'})[0].parent == meat.pk
+    assert bookkeeper.category_index.get('raw').parent == meat.pk
+
+
+def test_modify_expense_rollback(bookkeeper, repos, monkeypatch):
+    bookkeeper.add_category('food')
+    bookkeeper.modify_budget(None, '1000', 'day')
+    bookkeeper.add_expense('100', 'food')
+    pk = repos[Expense].get_all()[0].pk
+
+    def fail(objs):
+        raise RuntimeError
+
+    monkeypatch.setattr(repos[Budget], 'update_many', fail)
+    with pytest.raises(RuntimeError):
+        bookkeeper.modify_expense(pk, 'amount', '300')
+
+    # Neither the expense nor the budget is changed:
+    assert repos[Expense].get(pk).amount == 100
+    assert repos[Budget].get_all()[0].spent == 100
+    assert bookkeeper.budgets[0].spent == 100
+
+
+@pytest.fixture
+def queued(repos):
+    view = QueuedView()
+    bookkeeper = Bookkeeper(view, repos.__getitem__)
+    view.run_tasks()
+    return bookkeeper, view
+
+
+def test_add_category_twice(queued, repos):
+    bookkeeper, view = queued
+
+    # Both calls pass the check, the second task finds the category:
+    bookkeeper.add_category('food')
+    bookkeeper.add_category('food')
+    view.run_tasks()
+
+    assert [cat.name for cat in repos[Category].get_all()] == ['food']
+    assert view.errors == ['Категория "food" уже существует']
+
+
+def test_add_expense_after_category_deleted(queued, repos):
+    bookkeeper, view = queued
+    bookkeeper.add_category('food')
+    view.run_tasks()
+
+    # The expense is queued behind the deletion of it's category:
+    bookkeeper.delete_category('food')
+    bookkeeper.add_expense('100', 'food')
+    view.run_tasks()
+
+    assert repos[Expense].get_all() == []
+    assert view.errors == ['Категории "food" не существует']
+
+
+def test_budgets_assigned_on_done(queued, repos):
+    bookkeeper, view = queued
+    bookkeeper.add_category('food')
+    bookkeeper.modify_budget(None, '1000', 'day')
+    view.run_tasks()
+    budgets = bookkeeper.budgets
+
+    # The tasks do not change the presenter's state:
+    bookkeeper.add_expense('100', 'food')
+    bookkeeper.add_expense('50', 'food')
+    results = view.run_tasks(handle=False)
+    assert bookkeeper.budgets is budgets
+    assert budgets[0].spent == 0
+
+    # Each handler applies the budgets of it's own task:
+    on_done, result = results[0]
+    on_done(result)
+    assert bookkeeper.budgets[0].spent == 100
+    on_done, result = results[1]
+    on_done(result)
+    assert bookkeeper.budgets[0].spent == 150
@@ -1,7 +1,10 @@
+from datetime import datetime, timedelta
+
 import pytest
 
 from bookkeeper.repository.memory_repository import MemoryRepository
-from bookkeeper.models.budget import Budget
+from bookkeeper.models.budget  import Budget
+from bookkeeper.models.expense import Expense
 
 
 @pytest.fixture
@@ -32,3 +35,51 @@ def test_can_add_to_repo(repo):
     pk = repo.add(b)
 
     assert b.pk == pk
+
+
+@pytest.mark.parametrize("period, start, end", [
+    ("day",   datetime(2023, 3, 15), datetime(2023, 3, 16)),
+    ("week",  datetime(2023, 3, 13), datetime(2023, 3, 20)),
+    ("month", datetime(2023, 3, 1),  datetime(2023, 4, 1)),
+])
+def test_period_bounds(period, start, end):
+    b = Budget(100, period)
+    assert b.period_bounds(datetime(2023, 3, 15, 12, 30)) == (start, end)
+
+
+def test_period_bounds_december():
+    b = Budget(100, "month")
+    assert b.period_bounds(datetime(2023, 12, 31)) == (datetime(2023, 12, 1),
+                                                       datetime(2024, 1, 1))
+
+
+@pytest.mark.parametrize("period", ["day", "week", "month"])
+def test_update_spent(repo, period):
+    now = datetime.now()
+    b   = Budget(100, period)
+    start, end = b.period_bounds(now)
+
+    repo.add_many([Expense(10, 1, expense_date=now),
+                   Expense(20, 1, expense_date=start),
+                   Expense(40, 1, expense_date=end),
+                   Expense(80, 1, expense_date=start - timedelta(seconds=1))])
+    b.update_spent(repo)
+
+    assert b.spent == 30
+
+
+def test_apply_delta():
+    now = datetime(2023, 3, 15, 12, 30)
+    b   = Budget(100, "week", spent=10)
+
+    assert b.apply_delta(datetime(2023, 3, 13), 20, now) is True
+    assert b.spent == 30
+
+    assert b.apply_delta(datetime(2023, 3, 19, 23, 59), -5, now) is True
+    assert b.spent == 25
+
+    # Expenses out of the current period and zero changes are ignored:
+    assert b.apply_delta(datetime(2023, 3, 20), 20, now) is False
+    assert b.apply_delta(datetime(2023, 3, 12), 20, now) is False
+    assert b.apply_delta(datetime(2023, 3, 15), 0, now) is False
+    assert b.spent == 25
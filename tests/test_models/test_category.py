@@ -5,7 +5,7 @@ from inspect import isgenerator
 
 import pytest
 
-from bookkeeper.models.category import Category
+from bookkeeper.models.category import Category, CategoryIndex, CategoryTree
 from bookkeeper.repository.memory_repository import MemoryRepository
 
 
@@ -106,3 +106,93 @@ def test_create_from_tree_error(repo):
     tree = [('1', 'parent'), ('parent', None)]
     with pytest.raises(KeyError):
         Category.create_from_tree(tree, repo)
+
+
+@pytest.fixture
+def tree_repo(repo):
+    # 1 ─┬─ 2 ─┬─ 4
+    #    │     └─ 5 ── 6
+    #    └─ 3
+    # 7
+    Category.create_from_tree([('1', None), ('2', '1'), ('3', '1'), ('4', '2'),
+                               ('5', '2'), ('6', '5'), ('7', None)], repo)
+    return repo
+
+
+def test_category_tree(tree_repo):
+    tree = CategoryTree.from_repo(tree_repo)
+    assert len(tree) == 7 and 6 in tree and 8 not in tree
+    assert tree.children(None) == [1, 7]
+    assert tree.children(2) == [4, 5]
+    assert tree.parent(6) == 5
+    assert tree.ancestors(6) == [5, 2, 1]
+    assert tree.ancestors(1) == []
+    assert tree.descendants(1) == [2, 4, 5, 6, 3]
+    assert tree.descendants(7) == []
+    assert [tree.depth(pk) for pk in range(1, 8)] == [0, 1, 1, 2, 2, 3, 0]
+    assert [tree.root(pk) for pk in range(1, 8)] == [1, 1, 1, 1, 1, 1, 7]
+    assert tree.in_subtree(6, 2) and tree.in_subtree(2, 2)
+    assert not tree.in_subtree(3, 2) and not tree.in_subtree(1, 6)
+
+
+def test_category_tree_any_order():
+    cats = [Category('b', 2, pk=3), Category('a', 1, pk=2), Category('root', pk=1)]
+    tree = CategoryTree(cats)
+    assert tree.ancestors(3) == [2, 1]
+    with pytest.raises(KeyError):
+        CategoryTree([Category('orphan', 5, pk=1)])
+    with pytest.raises(ValueError):
+        CategoryTree([Category('a', 2, pk=1), Category('b', 1, pk=2)])
+
+
+def test_category_tree_updates(tree_repo):
+    tree = CategoryTree.from_repo(tree_repo)
+    assert tree.in_subtree(6, 2)
+
+    tree.add(Category('8', 6, pk=8))
+    assert tree.depth(8) == 4 and tree.root(8) == 1
+    assert tree.in_subtree(8, 2)
+    with pytest.raises(ValueError):
+        tree.add(Category('8', None, pk=8))
+    with pytest.raises(KeyError):
+        tree.add(Category('9', 100, pk=9))
+
+    tree.reparent(5, 7)
+    assert tree.ancestors(8) == [6, 5, 7]
+    assert tree.root(6) == 7 and tree.depth(6) == 2
+    assert tree.descendants(7) == [5, 6, 8]
+    assert not tree.in_subtree(8, 2)
+    with pytest.raises(ValueError):
+        tree.reparent(7, 6)
+
+    tree.delete(5)
+    assert 5 not in tree
+    assert tree.children(7) == [6]
+    assert tree.ancestors(8) == [6, 7]
+    assert tree.depth(8) == 2
+    assert tree.descendants(7) == [6, 8]
+
+    tree.reparent(7, None)
+    tree.delete(1)
+    assert tree.children(None) == [7, 2, 3]
+    assert tree.root(4) == 2 and tree.depth(4) == 1
+
+
+def test_category_index():
+    cats = [Category('a', pk=1), Category('b', 1, pk=2)]
+    index = CategoryIndex(cats)
+    assert len(index) == 2
+    assert 'a' in index and 'c' not in index
+    assert index.get('b') is cats[1]
+    assert index.get_by_pk(1) is cats[0]
+    assert index.name(2) == 'b'
+    assert index.name(3) == ''
+
+    cat = Category('c', pk=3)
+    index.add(cat)
+    assert index.get('c') is cat and index.name(3) == 'c'
+    index.remove(cats[0])
+    assert 'a' not in index and index.get_by_pk(1) is None
+
+    index.rebuild(cats[:1])
+    assert len(index) == 1 and index.name(1) == 'a'
@@ -0,0 +1,67 @@
+"""
+Тесты для отчетов по расходам
+"""
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.models.report import CategoryTotal, spending_tree
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.query import ge
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+def memory_repos(tmp_path):
+    return MemoryRepository(cls=Category), MemoryRepository(cls=Expense)
+
+
+def sqlite_repos(tmp_path):
+    db_file = str(tmp_path / "report.db")
+    return (SQLiteRepository(db_file=db_file, cls=Category),
+            SQLiteRepository(db_file=db_file, cls=Expense))
+
+
+def cached_repos(tmp_path):
+    return tuple(CachedRepository(repo) for repo in sqlite_repos(tmp_path))
+
+
+@pytest.fixture(params=[memory_repos, sqlite_repos, cached_repos])
+def repos(request, tmp_path):
+    cat_repo, exp_repo = request.param(tmp_path)
+    Category.create_from_tree([('продукты', None), ('мясо', 'продукты'),
+                               ('сырое мясо', 'мясо'), ('хлеб', 'продукты'),
+                               ('книги', None)], cat_repo)
+    exp_repo.add_many([
+        Expense(100, 3, expense_date=datetime(2023, 1, 1)),
+        Expense(20, 2, expense_date=datetime(2023, 1, 2)),
+        Expense(5, 4, expense_date=datetime(2023, 2, 1)),
+        Expense(7, 1, expense_date=datetime(2023, 2, 2)),
+    ])
+    return cat_repo, exp_repo
+
+
+def test_rollup(repos):
+    cat_repo, exp_repo = repos
+    assert cat_repo.rollup(exp_repo, 'category', 'amount') == {
+        1: 132, 2: 120, 3: 100, 4: 5, 5: 0}
+    assert cat_repo.rollup(exp_repo, 'category', 'amount',
+                           where={'expense_date': ge(datetime(2023, 1, 2))}) == {
+        1: 32, 2: 20, 3: 0, 4: 5, 5: 0}
+
+
+def test_rollup_ignores_unknown_categories(repos):
+    cat_repo, exp_repo = repos
+    exp_repo.add(Expense(1000, 100))
+    assert cat_repo.rollup(exp_repo, 'category', 'amount')[1] == 132
+
+
+def test_spending_tree(repos):
+    cat_repo, exp_repo = repos
+    report = spending_tree(cat_repo, exp_repo)
+    assert [(row.category.name, row.depth, row.total) for row in report] == [
+        ('продукты', 0, 132), ('мясо', 1, 120), ('сырое мясо', 2, 100),
+        ('хлеб', 1, 5), ('книги', 0, 0)]
+    assert isinstance(report[0], CategoryTotal)
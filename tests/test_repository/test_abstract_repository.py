@@ -1,4 +1,6 @@
-from bookkeeper.repository.abstract_repository import AbstractRepository
+from contextlib import contextmanager
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, transaction
 
 import pytest
 
@@ -30,3 +32,37 @@ def test_can_create_subclass():
 
     t = Test()
     assert isinstance(t, AbstractRepository)
+
+
+def test_transaction_spans_repositories():
+    entered = []
+
+    class Test(AbstractRepository):
+        def add(self, obj):
+            pass
+
+        def get(self, pk):
+            pass
+
+        def get_all(self, where=None):
+            pass
+
+        def get_all_by_pattern(self, patterns=None):
+            pass
+
+        def update(self, obj):
+            pass
+
+        def delete(self, pk):
+            pass
+
+        @contextmanager
+        def transaction(self):
+            entered.append(self)
+            yield
+            entered.remove(self)
+
+    repos = [Test(), Test()]
+    with transaction(*repos):
+        assert entered == repos
+    assert entered == []
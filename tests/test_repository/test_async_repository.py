@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import repository_factory
+from bookkeeper.repository.async_repository import (
+    AsyncMemoryRepository, AsyncSQLiteRepository, SQLiteWorker)
+from bookkeeper.repository.query import ge
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_repo(request, tmp_path):
+    if request.param == "memory":
+        return repository_factory(AsyncMemoryRepository)
+    return repository_factory(AsyncSQLiteRepository, db_file=str(tmp_path / "async.db"))
+
+
+def test_crud(make_repo):
+    async def scenario():
+        async with make_repo(Expense) as repo:
+            exp = Expense(100, 1)
+            pk = await repo.add(exp)
+            assert exp.pk == pk
+            assert (await repo.get(pk)).amount == 100
+
+            exp.amount = 200
+            await repo.update(exp)
+            assert (await repo.get(pk)).amount == 200
+
+            await repo.delete(pk)
+            assert await repo.get(pk) is None
+
+    asyncio.run(scenario())
+
+
+def test_get_all(make_repo):
+    async def scenario():
+        async with make_repo(Expense) as repo:
+            pks = await repo.add_many([Expense(i, 1) for i in range(5)])
+            found = await repo.get_all({'amount': ge(2)}, order_by='-amount', limit=2)
+            assert [exp.amount for exp in found] == [4, 3]
+
+            await repo.delete_many(pks[:3])
+            assert len(await repo.get_all()) == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_writes(make_repo):
+    async def scenario():
+        async with make_repo(Expense) as repo:
+            pks = await asyncio.gather(*(repo.add(Expense(i, 1)) for i in range(50)))
+            assert len(set(pks)) == 50
+            assert len(await repo.get_all()) == 50
+
+    asyncio.run(scenario())
+
+
+def test_call_in_transaction(make_repo):
+    def add_and_fail(repo):
+        with repo.transaction():
+            repo.add(Expense(1, 1))
+            raise RuntimeError
+
+    async def scenario():
+        async with make_repo(Expense) as repo:
+            with pytest.raises(RuntimeError):
+                await repo.call(add_and_fail)
+            assert await repo.get_all() == []
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_worker_thread(tmp_path):
+    worker  = SQLiteWorker()
+    db_file = str(tmp_path / "worker.db")
+
+    async def scenario():
+        cat_repo = AsyncSQLiteRepository(db_file, Category, worker=worker)
+        exp_repo = AsyncSQLiteRepository(db_file, Expense, worker=worker)
+
+        # All the queries run on the worker's connection, not in the event loop:
+        threads = await asyncio.gather(
+            cat_repo.call(lambda repo: threading.current_thread()),
+            exp_repo.call(lambda repo: threading.current_thread()))
+        assert threads[0] is threads[1] is not threading.current_thread()
+        assert (await cat_repo.call(lambda repo: repo.pool.connection()) is
+                await exp_repo.call(lambda repo: repo.pool.connection()))
+        await exp_repo.close()
+
+        # The shared worker is not stopped by its repositories:
+        pk = await cat_repo.add(Category("food"))
+        assert (await cat_repo.get(pk)).name == "food"
+        await cat_repo.close()
+
+    asyncio.run(scenario())
+    worker.close()
+
+
+def test_shared_worker(tmp_path):
+    repo_gen = repository_factory(AsyncSQLiteRepository, db_file=str(tmp_path / "w.db"))
+
+    async def scenario():
+        cat_repo = repo_gen(Category)
+        exp_repo = repo_gen(Expense)
+
+        # Repositories of a database have a single writer thread:
+        assert cat_repo.worker is exp_repo.worker
+        assert cat_repo.worker.users == 2
+
+        # Closing a repository leaves the connection of the others open:
+        con = await exp_repo.call(lambda repo: repo.pool.connection())
+        await cat_repo.close()
+        assert await exp_repo.call(lambda repo: repo.pool.connection()) is con
+
+        # The worker is stopped by the last repository:
+        worker = exp_repo.worker
+        assert (await exp_repo.add(Expense(1, 1))) == 1
+        await exp_repo.close()
+        assert worker.users == 0
+        repo = repo_gen(Expense)
+        assert repo.worker is not worker
+        await repo.close()
+
+    asyncio.run(scenario())
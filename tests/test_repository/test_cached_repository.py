@@ -0,0 +1,129 @@
+from bookkeeper.repository.cached_repository import CachedRepository, query_key
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.query import ge, in_
+
+import pytest
+
+
+@pytest.fixture
+def custom_class():
+    class Custom():
+        def __init__(self, value=0):
+            self.pk = 0
+            self.value = value
+
+    return Custom
+
+
+@pytest.fixture
+def backing():
+    return MemoryRepository()
+
+
+@pytest.fixture
+def repo(backing):
+    return CachedRepository(backing, max_objects=2)
+
+
+def test_crud(repo, backing, custom_class):
+    obj = custom_class()
+    pk = repo.add(obj)
+    assert backing.get(pk) is obj
+    assert repo.get(pk) is obj
+    obj2 = custom_class()
+    obj2.pk = pk
+    repo.update(obj2)
+    assert repo.get(pk) is obj2
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    assert backing.get(pk) is None
+
+
+def test_get_is_cached(repo, backing, custom_class):
+    pks = backing.add_many([custom_class() for i in range(3)])
+    assert repo.get(pks[0]) is backing.get(pks[0])
+    assert (repo.hits, repo.misses) == (0, 1)
+    repo.get(pks[0])
+    assert (repo.hits, repo.misses) == (1, 1)
+
+
+def test_get_lru_eviction(repo, backing, custom_class):
+    pks = backing.add_many([custom_class() for i in range(3)])
+    repo.get(pks[0])
+    repo.get(pks[1])
+    repo.get(pks[0])
+    repo.get(pks[2])  # evicts pks[1]
+    repo.get(pks[0])
+    repo.get(pks[1])
+    assert (repo.hits, repo.misses) == (2, 4)
+
+
+def test_get_all_is_memoised(repo, backing, custom_class):
+    objects = [custom_class(i) for i in range(4)]
+    backing.add_many(objects)
+
+    assert repo.get_all({'value': ge(2)}) == objects[2:]
+    result = repo.get_all({'value': ge(2)})
+    assert result == objects[2:]
+    assert (repo.hits, repo.misses) == (1, 1)
+
+    # Returned lists are copies:
+    result.clear()
+    assert repo.get_all({'value': ge(2)}) == objects[2:]
+    assert list(repo.iter_all({'value': ge(2)})) == objects[2:]
+    assert repo.hits == 3
+
+
+def test_get_all_keeps_identity(tmp_path):
+    # SQLite returns new objects on every read:
+    backing = SQLiteRepository(db_file=str(tmp_path / "cached.db"), cls=Expense)
+    backing.add_many([Expense(i, 1) for i in range(1, 4)])
+    repo = CachedRepository(backing)
+
+    # Objects already known are returned as is, new ones become known:
+    known = repo.get(1)
+    exps  = repo.get_all(order_by='pk')
+    assert exps[0] is known
+    assert repo.get(2) is exps[1]
+    assert repo.get_all({'amount': in_([1, 2, 3])})[2] is exps[2]
+    assert repo.get_page('expense_date', 1)[0] is known
+    backing.close()
+
+
+@pytest.mark.parametrize("write", [
+    lambda repo, cls, objs: repo.add(cls(5)),
+    lambda repo, cls, objs: repo.add_many([cls(5)]),
+    lambda repo, cls, objs: repo.update(objs[0]),
+    lambda repo, cls, objs: repo.update_many(objs[:1]),
+    lambda repo, cls, objs: repo.delete(objs[0].pk),
+    lambda repo, cls, objs: repo.delete_many([objs[0].pk]),
+])
+def test_writes_invalidate_queries(repo, custom_class, write):
+    objects = [custom_class(i) for i in range(2)]
+    repo.add_many(objects)
+    repo.get_all()
+    write(repo, custom_class, objects)
+    repo.get_all()
+    assert repo.misses == 2
+
+
+def test_rollback_invalidates(repo, custom_class):
+    obj = custom_class()
+    pk = repo.add(obj)
+    repo.get_all()
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.delete(pk)
+            repo.add(custom_class())
+            raise RuntimeError
+    assert repo.get_all() == [obj]
+    assert repo.misses == 2
+
+
+def test_query_key():
+    assert query_key({'a': 1, 'b': 2}, ['x'], 1, None) == query_key(
+        {'b': 2, 'a': 1}, ('x',), 1, None)
+    assert query_key({'a': in_([1])}, None, None, None) is not None
+    assert query_key({'a': [1]}, None, None, None) is None
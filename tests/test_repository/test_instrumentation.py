@@ -0,0 +1,141 @@
+import logging
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.instrumentation import (
+    Histogram, InstrumentedRepository, RepositoryStats, instrument_factory)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.query import ge
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@pytest.fixture
+def stats():
+    return RepositoryStats()
+
+
+@pytest.fixture
+def repo(stats):
+    return InstrumentedRepository(MemoryRepository(cls=Expense), stats, "Expense")
+
+
+def test_histogram():
+    hist = Histogram()
+    for seconds in [5e-7, 1e-6, 2e-6, 0.5, 3.0]:
+        hist.add(seconds)
+    assert hist.as_dict() == {"1us": 2, "10us": 1, "1s": 1, "inf": 1}
+
+
+def test_record_call(stats):
+    stats.record_call("Expense.get", 0.002, 1)
+    stats.record_call("Expense.get", 0.001, 0)
+
+    get = stats.methods["Expense.get"]
+    assert (get.calls, get.rows) == (2, 1)
+    assert get.total == pytest.approx(0.003)
+    assert get.max == 0.002
+    assert stats.as_dict()["methods"]["Expense.get"]["histogram"] == {"10ms": 1, "1ms": 1}
+
+    stats.reset()
+    assert stats.methods == {}
+
+
+def test_queries_are_normalized(stats):
+    stats.record_query("SELECT *\n    FROM expense", 0.001, 3)
+    assert list(stats.queries) == ["SELECT * FROM expense"]
+
+
+def test_flows(stats):
+    with stats.flow("outer"):
+        stats.record_call("Expense.get", 0.001, 1)
+        with stats.flow("inner"):
+            stats.record_query("SELECT 1", 0.001, 1)
+            stats.record_query("SELECT 2", 0.001, 2)
+    with stats.flow("outer"):
+        pass
+
+    outer, inner = stats.flows["outer"], stats.flows["inner"]
+    assert (outer.calls, outer.methods, outer.queries, outer.rows) == (2, 1, 2, 4)
+    assert (inner.calls, inner.methods, inner.queries, inner.rows) == (1, 0, 2, 3)
+    assert "queries" in stats.summary()
+
+
+def test_slow_log(caplog):
+    stats = RepositoryStats(slow_threshold=0.01)
+    with caplog.at_level(logging.WARNING, logger="bookkeeper.repository.slow"):
+        stats.record_query("SELECT fast", 0.001)
+        stats.record_query("SELECT slow", 0.02, 5)
+    assert [record.getMessage() for record in caplog.records] == [
+        "20.0 ms, 5 rows: SELECT slow"]
+
+
+def test_instrumented_repository(repo, stats):
+    pks = repo.add_many([Expense(i, 1) for i in range(5)])
+    assert repo.get(pks[0]).amount == 0
+    assert len(repo.get_all({'amount': ge(2)})) == 3
+    repo.delete(pks[0])
+
+    assert {name: (ops.calls, ops.rows) for name, ops in stats.methods.items()} == {
+        "Expense.add_many": (1, 5), "Expense.get": (1, 1),
+        "Expense.get_all": (1, 3), "Expense.delete": (1, 0)}
+
+
+def test_instrumented_iter_all(repo, stats):
+    repo.add_many([Expense(i, 1) for i in range(5)])
+
+    objs = repo.iter_all()
+    next(objs)
+    next(objs)
+    objs.close()
+    assert list(repo.iter_all()) == repo.get_all()
+
+    assert stats.methods["Expense.iter_all"].calls == 2
+    assert stats.methods["Expense.iter_all"].rows == 7
+
+
+def test_instrumented_transaction(repo):
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(Expense(1, 1))
+            raise RuntimeError
+    assert repo.get_all() == []
+
+
+def test_sqlite_queries(tmp_path, stats):
+    sqlite_repo = SQLiteRepository(db_file=str(tmp_path / "stats.db"), cls=Expense)
+    sqlite_repo.add_many([Expense(i, 1) for i in range(5)])
+    sqlite_repo.pool.instrument(stats)
+
+    assert len(sqlite_repo.get_all()) == 5
+    assert len(list(sqlite_repo.iter_all(batch_size=2))) == 5
+    sqlite_repo.delete(1)
+
+    queries = {sql.split()[0]: (ops.calls, ops.rows)
+               for sql, ops in stats.queries.items()}
+    assert queries == {"SELECT": (2, 10), "DELETE": (1, 0)}
+
+    sqlite_repo.pool.instrument(None)
+    sqlite_repo.get(2)
+    assert sum(ops.calls for ops in stats.queries.values()) == 3
+
+
+def test_instrument_factory(tmp_path, stats):
+    def cached_gen(model):
+        return CachedRepository(SQLiteRepository(db_file=str(tmp_path / "f.db"),
+                                                 cls=model))
+
+    repo_gen = instrument_factory(cached_gen, stats)
+    cat_repo = repo_gen(Category)
+    exp_repo = repo_gen(Expense)
+
+    with stats.flow("add"):
+        pk = cat_repo.add(Category("food"))
+        exp_repo.add(Expense(10, pk))
+    assert cat_repo.rollup(exp_repo, 'category', 'amount') == {pk: 10}
+
+    assert set(stats.methods) == {"Category.add", "Expense.add", "Category.rollup"}
+    assert stats.flows["add"].methods == 2
+    assert stats.flows["add"].queries >= 2
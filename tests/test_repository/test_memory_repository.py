@@ -1,4 +1,10 @@
 from bookkeeper.repository.memory_repository import MemoryRepository
+from datetime import datetime
+from random import Random
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import range_bounds
+from bookkeeper.repository.query import ge, gt, le, lt, between, eq, ne, in_, contains
 
 import pytest
 
@@ -69,3 +75,262 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'name': '0'}) == [objects[0]]
     assert repo.get_all({'test': 'test'}) == objects
+
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class() for i in range(5)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert repo.get_all() == objects
+
+
+def test_cannot_add_many_with_pk(repo, custom_class):
+    objects = [custom_class() for i in range(2)]
+    objects[1].pk = 1
+    with pytest.raises(ValueError):
+        repo.add_many(objects)
+    assert repo.get_all() == []
+
+
+def test_update_many(repo, custom_class):
+    pks = repo.add_many([custom_class() for i in range(3)])
+    objects = []
+    for pk in pks:
+        o = custom_class()
+        o.pk = pk
+        objects.append(o)
+    repo.update_many(objects)
+    assert repo.get_all() == objects
+
+
+def test_delete_many(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    pks = repo.add_many(objects)
+    repo.delete_many(pks[:2])
+    assert repo.get_all() == objects[2:]
+
+
+def test_cannot_delete_many_unexistent(repo, custom_class):
+    pk = repo.add(custom_class())
+    with pytest.raises(KeyError):
+        repo.delete_many([pk, pk + 1])
+    assert repo.get(pk) is not None
+
+
+def test_cannot_delete_many_repeated(repo, custom_class):
+    pk = repo.add(custom_class())
+    with pytest.raises(ValueError):
+        repo.delete_many([pk, pk])
+    assert repo.get(pk) is not None
+
+
+def test_transaction_commit(repo, custom_class):
+    with repo.transaction():
+        pk = repo.add(custom_class())
+    assert repo.get(pk) is not None
+
+
+def test_transaction_rollback(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    repo.add_many(objects)
+    replaced = custom_class()
+    replaced.pk = objects[1].pk
+
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(custom_class())
+            repo.update(replaced)
+            repo.delete(objects[0].pk)
+            with repo.transaction():
+                repo.delete(objects[2].pk)
+            raise RuntimeError
+
+    assert repo.get_all() == objects
+
+
+def test_nested_transaction_rollback(repo, custom_class):
+    with repo.transaction():
+        pk = repo.add(custom_class())
+        with pytest.raises(RuntimeError):
+            with repo.transaction():
+                repo.delete(pk)
+                raise RuntimeError
+    assert repo.get(pk) is not None
+
+
+def test_get_all_with_query(repo, custom_class):
+    objects = []
+    for i in range(5):
+        o = custom_class()
+        o.value = i % 3
+        objects.append(o)
+    repo.add_many(objects)
+
+    assert repo.get_all({'value': ge(1)}) == [objects[1], objects[2], objects[4]]
+    assert repo.get_all(order_by=['-value', 'pk'], limit=2, offset=1) == [
+        objects[1], objects[4]]
+
+
+def test_iter_all(repo, custom_class):
+    objects = []
+    for i in range(5):
+        o = custom_class()
+        o.value = i % 3
+        objects.append(o)
+    repo.add_many(objects)
+
+    assert list(repo.iter_all()) == objects
+    assert list(repo.iter_all({'value': ge(1)})) == [objects[1], objects[2], objects[4]]
+    assert list(repo.iter_all(order_by='-value')) == [
+        objects[2], objects[1], objects[4], objects[0], objects[3]]
+
+
+def test_get_all_by_pattern(repo, custom_class):
+    objects = []
+    for name in ["abc", "bcd", "cde"]:
+        o = custom_class()
+        o.name = name
+        objects.append(o)
+    repo.add_many(objects)
+
+    assert repo.get_all_by_pattern({'name': 'bc'}) == objects[:2]
+
+
+def test_aggregate(repo, custom_class):
+    objects = []
+    for i in range(5):
+        o = custom_class()
+        o.value = i
+        o.parity = i % 2
+        objects.append(o)
+    repo.add_many(objects)
+
+    assert repo.aggregate(where={'value': ge(1)}, sum='value', count='*') == {
+        'sum': 10, 'count': 4}
+    assert repo.aggregate(group_by='parity', max='value') == {
+        0: {'max': 4}, 1: {'max': 3}}
+
+
+@pytest.fixture
+def indexed_class():
+    class Indexed():
+        INDEXES = ('name', ('value', 'name'))
+
+        def __init__(self, name='', value=0):
+            self.pk = 0
+            self.name = name
+            self.value = value
+
+    return Indexed
+
+
+def test_indexed_lookup(indexed_class):
+    repo = MemoryRepository(cls=indexed_class)
+    objects = [indexed_class("abc"[i % 3], i) for i in range(6)]
+    repo.add_many(objects)
+
+    assert repo.get_all({'name': 'b'}) == [objects[1], objects[4]]
+    assert repo.get_all({'name': in_(['a', 'c']), 'value': ge(2)}) == [
+        objects[2], objects[3], objects[5]]
+    assert repo.get_all({'value': 4, 'name': 'a'}) == []
+    assert repo.get_all({'pk': in_([objects[5].pk, 100, objects[0].pk])}) == [
+        objects[0], objects[5]]
+    assert list(repo.iter_all({'name': 'c'})) == [objects[2], objects[5]]
+    assert repo.aggregate({'name': 'a'}, sum='value') == {'sum': 3}
+
+
+def test_index_follows_changes(indexed_class):
+    repo = MemoryRepository(cls=indexed_class, indexes=['name'])
+    objects = [indexed_class("ab"[i % 2], i) for i in range(4)]
+    repo.add_many(objects)
+
+    objects[0].name = 'b'
+    repo.update(objects[0])
+    repo.delete(objects[1].pk)
+    assert repo.get_all({'name': 'a'}) == [objects[2]]
+    assert repo.get_all({'name': 'b'}) == [objects[0], objects[3]]
+
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.delete(objects[3].pk)
+            repo.add(indexed_class('b'))
+            raise RuntimeError
+    assert repo.get_all({'name': 'b'}) == [objects[0], objects[3]]
+
+
+def test_range_bounds():
+    assert range_bounds(ge(1) & lt(5)) == ((1, False), (5, True))
+    assert range_bounds(gt(1) & ge(1) & le(3) & between(0, 4)) == ((1, True), (3, False))
+    assert range_bounds(eq(2) & ne(3)) == ((2, False), (2, False))
+    assert range_bounds(ne(3)) is None
+    assert range_bounds(in_([1])) is None
+
+
+def test_sorted_index_on_dates():
+    repo = MemoryRepository(cls=Expense)
+    rnd = Random(1)
+    expenses = [Expense(amount=i, category=1,
+                        expense_date=datetime(2023, rnd.randint(1, 3),
+                                              rnd.randint(1, 28)))
+                for i in range(200)]
+    repo.add_many(expenses)
+    repo.delete_many([exp.pk for exp in expenses[::7]])
+    expenses[1].expense_date = datetime(2023, 2, 1)
+    repo.update(expenses[1])
+    stored = [exp for exp in expenses if exp.pk % 7 != 1]
+
+    for cond in [ge(datetime(2023, 2, 1)) & lt(datetime(2023, 3, 1)),
+                 gt(datetime(2023, 2, 1)), le(datetime(2023, 1, 5)),
+                 between(datetime(2023, 1, 10), datetime(2023, 1, 20)),
+                 lt(datetime(2023, 1, 1)), contains("2023-02-01")]:
+        assert repo.get_all({'expense_date': cond}) == [
+            exp for exp in stored if cond.matches(exp.expense_date)]
+
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.delete(expenses[1].pk)
+            raise RuntimeError
+    assert expenses[1] in repo.get_all({'expense_date': between(datetime(2023, 2, 1),
+                                                                datetime(2023, 2, 1))})
+
+
+def all_pages(repo, key, limit, **kwargs):
+    pages, after = [], None
+    while True:
+        page = repo.get_page(key, limit, after, **kwargs)
+        pages.append(page)
+        if len(page) < limit:
+            return pages
+        after = (getattr(page[-1], key), page[-1].pk)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_get_page(descending):
+    repo = MemoryRepository(cls=Expense)
+    rnd = Random(2)
+    expenses = [Expense(amount=i, category=i % 2,
+                        expense_date=datetime(2023, 1, rnd.randint(1, 5)))
+                for i in range(50)]
+    repo.add_many(expenses)
+    ordered = sorted(expenses, key=lambda exp: (exp.expense_date, exp.pk),
+                     reverse=descending)
+
+    # Pages follow each other without gaps and repeats on equal dates:
+    pages = all_pages(repo, 'expense_date', 7, descending=descending)
+    assert [len(page) for page in pages] == [7] * 7 + [1]
+    assert sum(pages, []) == ordered
+
+    pages = all_pages(repo, 'expense_date', 7, descending=descending,
+                      where={'category': 1})
+    assert sum(pages, []) == [exp for exp in ordered if exp.category == 1]
+
+
+def test_get_page_not_sorted_field(repo, custom_class):
+    objs = [custom_class() for _ in range(10)]
+    for i, obj in enumerate(objs):
+        obj.value = i % 3 if i != 4 else None
+    repo.add_many(objs)
+
+    pages = all_pages(repo, 'value', 3, descending=True)
+    assert sum(pages, []) == sorted((obj for obj in objs if obj.value is not None),
+                                    key=lambda obj: (obj.value, obj.pk), reverse=True)
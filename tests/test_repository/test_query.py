@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.repository.query import (
+    Compare, InQuery, QueryTemplates, eq, ne, lt, le, gt, ge, between, in_, contains,
+    apply, compile_query, compute_aggregates, keyset_follows, keyset_where)
+
+
+@dataclass
+class Obj:
+    x    : int | None
+    name : str = ""
+
+
+@pytest.mark.parametrize("cond, value, result", [
+    (eq(1), 1, True), (eq(1), 2, False), (eq(None), None, True), (eq(None), 1, False),
+    (ne(1), 2, True), (ne(None), 1, True), (ne(1), None, False),
+    (lt(2), 1, True), (lt(2), 2, False), (lt(2), None, False),
+    (le(2), 2, True), (gt(2), 3, True), (gt(2), 2, False), (ge(2), 2, True),
+    (between(1, 3), 1, True), (between(1, 3), 3, True), (between(1, 3), 4, False),
+    (in_([1, 2]), 2, True), (in_([1, 2]), 3, False),
+    (contains("b"), "abc", True), (contains("d"), "abc", False),
+    (contains("2023-03"), datetime(2023, 3, 1), True), (contains("1"), 12, True),
+    (contains("a"), None, False),
+    (ge(1) & lt(3), 2, True), (ge(1) & lt(3), 3, False),
+    (ge(1) & lt(3) & ne(2), 2, False),
+])
+def test_matches(cond, value, result):
+    assert cond.matches(value) is result
+
+
+@pytest.mark.parametrize("make", [lt, le, gt, ge])
+def test_none_ordering_rejected(make):
+    # NULL is not ordered in SQL, so the backends could not agree on the result:
+    with pytest.raises(ValueError):
+        make(None)
+
+
+def test_unknown_operator():
+    with pytest.raises(ValueError):
+        Compare('<>', 1)
+
+
+def test_compile_query():
+    sql, params = compile_query(
+        {'x': ge(1) & lt(5), 'name': 'a', 'pk': in_([1, 2])},
+        ['-x', 'name'], 10, 20, lambda field: field.upper())
+
+    assert sql == (" WHERE (X >= ?) AND (X < ?) AND NAME = ? AND PK IN (?, ?)"
+                   " ORDER BY X DESC, NAME LIMIT ? OFFSET ?")
+    assert params == [1, 5, 'a', 1, 2, 10, 20]
+
+
+def test_compile_empty_query():
+    assert compile_query(None, None, None, None, str) == ("", [])
+    assert compile_query({'x': None}, None, None, 5, str) == (
+        " WHERE x IS NULL LIMIT ? OFFSET ?", [-1, 5])
+
+
+def test_compile_contains_escapes_wildcards():
+    sql, params = contains("5%_off").sql("name")
+    assert sql == "name LIKE ? ESCAPE '\\'"
+    assert params == ["%5\\%\\_off%"]
+
+
+def test_in_is_padded():
+    assert in_([1, 2, 3]).sql("x") == ("x IN (?, ?, ?, ?)", [1, 2, 3, 3])
+    assert in_([]).sql("x") == ("x IN ()", [])
+    assert in_([1, 2, 3]).shape() == in_([4, 5, 6, 7]).shape()
+    assert in_([1, 2]).shape() != in_([1, 2, 3]).shape()
+
+
+def test_shape():
+    assert (ge(1) & lt(5)).shape() == (ge(2) & lt(3)).shape()
+    assert ge(1).shape() != gt(1).shape()
+    assert eq(1).shape() != eq(None).shape()
+    assert contains("a").shape() == contains("b").shape()
+
+
+def test_query_templates():
+    templates = QueryTemplates(lambda field: field.upper(), size=2)
+    for value in range(3):
+        where = {'x': ge(value) & lt(5), 'name': str(value)}
+        assert templates.compile(where, '-x', 10, None) == compile_query(
+            where, '-x', 10, None, lambda field: field.upper())
+    assert (templates.hits, templates.misses) == (2, 1)
+
+    # Other shapes get their own templates, the oldest ones are evicted:
+    templates.compile({'x': None}, None, None, None)
+    templates.compile({'x': 1}, None, None, None)
+    templates.compile({'x': ge(0) & lt(5), 'name': "a"}, '-x', 10, None)
+    assert (templates.hits, templates.misses) == (2, 4)
+
+
+def test_subquery():
+    cond = InQuery("SELECT x FROM t WHERE y = ?", (1,))
+    assert cond.sql("z") == ("z IN (SELECT x FROM t WHERE y = ?)", [1])
+    with pytest.raises(TypeError):
+        cond.matches(1)
+
+
+def test_keyset_where():
+    assert keyset_where(None, 'x', None, False) == {'x': ne(None)}
+    assert keyset_where({'name': 'a'}, 'x', (3, 7), True) == {'name': 'a', 'x': le(3)}
+    assert keyset_where({'x': gt(1)}, 'x', (3, 7), False) == {'x': gt(1) & ge(3)}
+
+    obj = Obj(3)
+    obj.pk = 5
+    assert keyset_follows(obj, 'x', (3, 7), True) is True
+    assert keyset_follows(obj, 'x', (3, 7), False) is False
+    assert keyset_follows(obj, 'x', (2, 9), False) is True
+
+
+def test_apply():
+    objs = [Obj(3, "c"), Obj(None, "n"), Obj(1, "a"), Obj(3, "b"), Obj(2, "d")]
+
+    assert apply(objs, {'x': gt(1)}) == [objs[0], objs[3], objs[4]]
+    assert apply(objs, order_by='x') == [objs[1], objs[2], objs[4], objs[0], objs[3]]
+    assert apply(objs, order_by=['-x', 'name']) == [
+        objs[3], objs[0], objs[4], objs[2], objs[1]]
+    assert apply(objs, order_by='name', limit=2, offset=1) == [objs[3], objs[0]]
+
+
+def test_compute_aggregates():
+    objs = [Obj(3, "a"), Obj(None, "a"), Obj(1, "b")]
+
+    assert compute_aggregates(objs, None, {'sum': 'x', 'count': '*', 'min': 'x',
+                                           'max': 'x', 'avg': 'x'}) == {
+        'sum': 4, 'count': 3, 'min': 1, 'max': 3, 'avg': 2}
+    assert compute_aggregates(objs, 'name', {'sum': 'x', 'count': 'x'}) == {
+        'a': {'sum': 3, 'count': 1}, 'b': {'sum': 1, 'count': 1}}
+
+
+def test_compute_aggregates_empty():
+    assert compute_aggregates([], None, {'sum': 'x', 'count': '*', 'avg': 'x'}) == {
+        'sum': 0, 'count': 0, 'avg': None}
+    assert compute_aggregates([], 'name', {'sum': 'x'}) == {}
+
+
+def test_compute_unknown_aggregate():
+    with pytest.raises(ValueError):
+        compute_aggregates([], None, {'median': 'x'})
+    with pytest.raises(ValueError):
+        compute_aggregates([], None, {})
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from bookkeeper.repository.sqlite_connection import (
+    PerformanceProfile, SQLiteConnectionPool)
+
+DB_FILE = "database/bookkeeper_test.db"
+
+
+def test_shared_pool_is_reused():
+    pool = SQLiteConnectionPool.shared(DB_FILE)
+    assert SQLiteConnectionPool.shared(DB_FILE) is pool
+    pool.release()
+    pool.release()
+
+
+def test_shared_pool_closed_by_last_user(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    pool = SQLiteConnectionPool.shared(db_file)
+    SQLiteConnectionPool.shared(db_file)
+    con = pool.connection()
+
+    # The connection is kept while the pool has users:
+    pool.release()
+    assert pool.connection() is con
+    assert con.execute("SELECT 1").fetchone() == (1,)
+
+    pool.release()
+    assert pool.users == 0
+    assert pool.connection() is not con
+    pool.close()
+
+
+def test_connection_per_thread():
+    pool = SQLiteConnectionPool(DB_FILE)
+
+    # The same thread always gets the same connection:
+    con = pool.connection()
+    assert pool.connection() is con
+
+    # Another thread gets it's own connection:
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not con
+
+    pool.close()
+
+
+def test_pragmas_applied(tmp_path):
+    with SQLiteConnectionPool(str(tmp_path / "test.db")) as pool:
+        con = pool.connection()
+        assert con.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_reopen_after_close(tmp_path):
+    pool = SQLiteConnectionPool(str(tmp_path / "test.db"))
+    con = pool.connection()
+    pool.close()
+
+    # Closed connection is replaced by a new one:
+    assert pool.connection() is not con
+    assert pool.connection().execute("SELECT 1").fetchone() == (1,)
+    pool.close()
+
+
+def test_performance_profile(tmp_path):
+    profile = PerformanceProfile(cache_size=-1024)
+    with SQLiteConnectionPool(str(tmp_path / "test.db"), profile) as pool:
+        con = pool.connection()
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert con.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert con.execute("PRAGMA cache_size").fetchone()[0] == -1024
+        assert con.execute("PRAGMA temp_store").fetchone()[0] == 2
+        assert con.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        PerformanceProfile(journal_mode="WAL; DROP TABLE expense")
+
+
+def test_shared_pool_per_profile():
+    profile = PerformanceProfile()
+    pool = SQLiteConnectionPool.shared(DB_FILE, profile)
+    assert pool.profile == profile
+    assert SQLiteConnectionPool.shared(DB_FILE, PerformanceProfile()) is pool
+    assert SQLiteConnectionPool.shared(DB_FILE) is not pool
+    SQLiteConnectionPool.shared(DB_FILE).release()
+    pool.release()
+    pool.release()
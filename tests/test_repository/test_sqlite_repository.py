@@ -1,9 +1,15 @@
 import pytest
 import sqlite3
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime
 
-from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.models.category                import Category
+from bookkeeper.models.expense                 import Expense
+from bookkeeper.repository.memory_repository   import MemoryRepository
+from bookkeeper.repository.sqlite_repository   import SQLiteRepository
+from bookkeeper.repository.abstract_repository import repository_factory, transaction
+from bookkeeper.repository.sqlite_connection   import PerformanceProfile
+from bookkeeper.repository.query               import gt, ge, lt, between, in_, ne
 
 ##################################
 ## Testing stand initialization ##
@@ -135,3 +141,482 @@ def test_cannot_update_without_pk_property(repo, custom_class):
 def test_cannot_delete_nonexistent(repo):
     with pytest.raises(ValueError):
         repo.delete(-1)
+
+
+def test_repositories_share_connection(repo, custom_class):
+    other = SQLiteRepository(db_file=DB_FILE, cls=custom_class)
+    assert other.pool is repo.pool
+    assert other.pool.connection() is repo.pool.connection()
+
+
+def test_context_manager(custom_initialization, custom_class):
+    with SQLiteRepository(db_file=DB_FILE, cls=custom_class) as repo:
+        pk = repo.add(custom_class())
+
+    # Repository is still usable: connection is reopened on demand
+    assert repo.get(pk) is not None
+
+
+def test_add_many(repo, custom_class):
+    repo.add(custom_class())
+
+    objs = [custom_class(field_int=i) for i in range(5)]
+    pks  = repo.add_many(objs)
+    assert pks == [obj.pk for obj in objs]
+    assert len(set(pks)) == len(objs)
+
+    for obj in objs:
+        assert repo.get(obj.pk) == obj
+
+
+def test_cannot_add_many_with_filled_pk(repo, custom_class):
+    with pytest.raises(ValueError):
+        repo.add_many([custom_class(), custom_class(pk=1)])
+    assert repo.get_all() == []
+
+
+def test_update_many(repo, custom_class):
+    objs = [custom_class(field_int=i) for i in range(5)]
+    repo.add_many(objs)
+
+    for obj in objs:
+        obj.field_int += 10
+    repo.update_many(objs)
+    assert repo.get_all() == objs
+
+
+def test_cannot_update_many_nonexistent(repo, custom_class):
+    obj = custom_class()
+    repo.add(obj)
+
+    # Whole operation is rolled back:
+    with pytest.raises(ValueError):
+        repo.update_many([custom_class(field_int=0, pk=obj.pk),
+                          custom_class(pk=obj.pk + 1)])
+    assert repo.get(obj.pk) == obj
+
+
+def test_delete_many(repo, custom_class):
+    objs = [custom_class(field_int=i) for i in range(5)]
+    pks  = repo.add_many(objs)
+
+    repo.delete_many(pks[1:3])
+    assert repo.get_all() == [objs[0]] + objs[3:]
+
+
+def test_cannot_delete_many_nonexistent(repo, custom_class):
+    obj = custom_class()
+    repo.add(obj)
+
+    # Whole operation is rolled back:
+    with pytest.raises(ValueError):
+        repo.delete_many([obj.pk, -1])
+    assert repo.get(obj.pk) == obj
+
+
+def test_transaction_commit(repo, custom_class):
+    with repo.transaction():
+        pk = repo.add(custom_class())
+        repo.update(custom_class(field_int=1, pk=pk))
+
+    with sqlite3.connect(DB_FILE) as con:
+        rows = con.execute("SELECT field_int FROM custom").fetchall()
+    con.close()
+    assert rows == [(1,)]
+
+
+def test_transaction_rollback(repo, custom_class):
+    obj = custom_class()
+    repo.add(obj)
+
+    # Changes made through another repository share the transaction:
+    other = SQLiteRepository(db_file=DB_FILE, cls=custom_class)
+
+    with pytest.raises(RuntimeError):
+        with transaction(repo, other):
+            repo.add(custom_class())
+            other.update(custom_class(field_int=1, pk=obj.pk))
+            raise RuntimeError
+
+    assert repo.get_all() == [obj]
+
+
+def test_get_all_with_query(repo, custom_class):
+    objs = [custom_class(field_int  = i % 3,
+                         field_date = datetime(2023, 1, i + 1, 12, 0, 0, 1))
+            for i in range(6)]
+    repo.add_many(objs)
+
+    assert repo.get_all({'field_int': gt(0) & lt(2)}) == [objs[1], objs[4]]
+    assert repo.get_all({'field_int': in_([0, 2])}) == [objs[0], objs[2],
+                                                        objs[3], objs[5]]
+    assert repo.get_all({'field_date': between(datetime(2023, 1, 2),
+                                               datetime(2023, 1, 4))}) == objs[1:3]
+    assert repo.get_all({'pk': ge(objs[4].pk)}) == objs[4:]
+
+    assert repo.get_all(order_by=['-field_int', 'field_date'], limit=3) == [
+        objs[2], objs[5], objs[1]]
+    assert repo.get_all(order_by='-pk', offset=4) == [objs[1], objs[0]]
+
+
+def test_iter_all(repo, custom_class):
+    objs = [custom_class(field_int=i % 3) for i in range(7)]
+    repo.add_many(objs)
+
+    iterator = repo.iter_all(batch_size=2)
+    assert next(iterator) == objs[0]
+    assert list(iterator) == objs[1:]
+
+    assert list(repo.iter_all({'field_int': gt(0)}, order_by='-pk', batch_size=3)) == [
+        objs[5], objs[4], objs[2], objs[1]]
+    assert list(repo.iter_all({'field_int': 3})) == []
+
+
+def test_get_all_unknown_field(repo):
+    with pytest.raises(ValueError):
+        repo.get_all({'field_int = 0 OR 1': 1})
+
+
+def test_get_all_by_pattern(repo, custom_class):
+    objs = [custom_class(field_str=s) for s in ["abc", "bcd", "a%c"]]
+    repo.add_many(objs)
+
+    assert repo.get_all_by_pattern({'field_str': 'bc'}) == objs[:2]
+    assert repo.get_all_by_pattern({'field_str': '%'}) == [objs[2]]
+
+
+def test_aggregate(repo, custom_class):
+    repo.add_many([custom_class(field_int=i, field_str="ab"[i % 2]) for i in range(5)])
+
+    assert repo.aggregate(sum='field_int', count='*', min='field_int',
+                          max='field_int', avg='field_int') == {
+        'sum': 10, 'count': 5, 'min': 0, 'max': 4, 'avg': 2.0}
+    assert repo.aggregate(where={'field_int': gt(1)}, sum='field_int') == {'sum': 9}
+    assert repo.aggregate(group_by='field_str', sum='field_int', count='*') == {
+        'a': {'sum': 6, 'count': 3}, 'b': {'sum': 4, 'count': 2}}
+
+
+def test_aggregate_empty(repo):
+    assert repo.aggregate(sum='field_int', count='*') == {'sum': 0, 'count': 0}
+    assert repo.aggregate(group_by='field_str', sum='field_int') == {}
+
+
+def test_aggregate_unknown(repo):
+    with pytest.raises(ValueError):
+        repo.aggregate(median='field_int')
+    with pytest.raises(ValueError):
+        repo.aggregate(sum='unknown_field')
+
+
+def test_typed_schema(tmp_path):
+    @dataclass
+    class Typed:
+        INDEXES = ('field_int', ('field_str', 'field_date'))
+
+        field_int  : int | None
+        field_str  : str
+        field_date : datetime
+        field_any  : list
+        pk         : int = 0
+
+    db_file = str(tmp_path / "typed.db")
+    repo    = SQLiteRepository(db_file=db_file, cls=Typed)
+
+    con     = repo.pool.connection()
+    columns = [row[1:3] for row in con.execute("PRAGMA table_info(typed)")]
+    assert columns == [('pk', 'INTEGER'), ('field_int', 'INTEGER'), ('field_str', 'TEXT'),
+                       ('field_date', 'TEXT'), ('field_any', '')]
+
+    indexes = {row[1] for row in con.execute("PRAGMA index_list(typed)")}
+    assert indexes == {"typed_field_int_idx", "typed_field_str_field_date_idx"}
+
+    plan = con.execute("EXPLAIN QUERY PLAN "
+                       "SELECT * FROM typed WHERE field_int = ?", [1]).fetchall()
+    assert "typed_field_int_idx" in plan[0][-1]
+
+    # The pk column is an alias for ROWID:
+    obj = Typed(1, "str", datetime.now(), None)
+    repo.add(obj)
+    assert con.execute("SELECT pk FROM typed").fetchall() == [(obj.pk,)]
+    repo.close()
+
+
+def test_unknown_index_field(tmp_path):
+    @dataclass
+    class Wrong:
+        INDEXES = ('unknown',)
+
+        field : int
+        pk    : int = 0
+
+    with pytest.raises(ValueError):
+        SQLiteRepository(db_file=str(tmp_path / "wrong.db"), cls=Wrong)
+
+
+def test_datetime_roundtrip(repo, custom_class):
+    # Dates without microseconds are stored in the same fixed-width format:
+    objs = [custom_class(field_date=datetime(2023, 1, 1, 10, 0)),
+            custom_class(field_date=datetime(2023, 1, 1, 10, 0, 0, 500))]
+    repo.add_many(objs)
+
+    assert repo.get_all(order_by='field_date') == objs
+    assert repo.get_all({'field_date': datetime(2023, 1, 1, 10, 0)}) == objs[:1]
+
+    with sqlite3.connect(DB_FILE) as con:
+        rows = con.execute("SELECT field_date FROM custom").fetchall()
+    con.close()
+    assert rows == [("2023-01-01 10:00:00.000000",), ("2023-01-01 10:00:00.000500",)]
+
+
+def test_legacy_datetime_formats(repo, custom_class):
+    with sqlite3.connect(DB_FILE) as con:
+        con.executemany("INSERT INTO custom VALUES (?, ?, ?)",
+                        [(1, "a", "2023-01-01\t10:00"), (2, "b", "2023-01-01 10:00:00")])
+    con.close()
+
+    assert [obj.field_date for obj in repo.get_all()] == [datetime(2023, 1, 1, 10, 0)] * 2
+
+
+def test_keyword_only_constructor(tmp_path):
+    @dataclass(kw_only=True)
+    class KwOnly:
+        field_date : datetime
+        pk         : int = 0
+
+    repo = SQLiteRepository(db_file=str(tmp_path / "kw.db"), cls=KwOnly)
+    obj  = KwOnly(field_date=datetime(2023, 1, 1))
+    repo.add(obj)
+
+    assert repo.get(obj.pk) == obj
+    repo.close()
+
+
+@pytest.fixture
+def category_repo(tmp_path):
+    repo = SQLiteRepository(db_file=str(tmp_path / "tree.db"), cls=Category)
+    # 1 ─┬─ 2 ─── 4
+    #    └─ 3
+    # 5
+    Category.create_from_tree([('1', None), ('2', '1'), ('3', '1'), ('4', '2'),
+                               ('5', None)], repo)
+    yield repo
+    repo.close()
+
+
+def closure_rows(repo):
+    con = repo.pool.connection()
+    return set(con.execute("SELECT ancestor, descendant, depth FROM category_closure"))
+
+
+def pks(objs):
+    return [obj.pk for obj in objs]
+
+
+def test_hierarchy_queries(category_repo):
+    assert pks(category_repo.get_descendants(1)) == [2, 3, 4]
+    assert pks(category_repo.get_descendants(4)) == []
+    assert pks(category_repo.get_ancestors(4)) == [2, 1]
+    assert pks(category_repo.get_ancestors(5)) == []
+    assert pks(category_repo.get_all({'pk': category_repo.subtree(2)})) == [2, 4]
+
+
+def test_hierarchy_reparent_and_delete(category_repo):
+    cat = category_repo.get(2)
+    cat.parent = 5
+    category_repo.update(cat)
+    assert pks(category_repo.get_ancestors(4)) == [2, 5]
+    assert pks(category_repo.get_descendants(1)) == [3]
+
+    # A record can not be moved into it's own subtree:
+    cat = category_repo.get(5)
+    cat.parent = 4
+    with pytest.raises(sqlite3.IntegrityError):
+        category_repo.update(cat)
+
+    # Deletion with re-parenting of the children, as in the application:
+    child = category_repo.get(2)
+    child.parent = None
+    with category_repo.transaction():
+        category_repo.delete(5)
+        category_repo.update(child)
+    assert pks(category_repo.get_ancestors(4)) == [2]
+    assert closure_rows(category_repo) == {(1, 1, 0), (1, 3, 1), (3, 3, 0), (2, 2, 0),
+                                           (2, 4, 1), (4, 4, 0)}
+
+
+def test_hierarchy_rollback(category_repo):
+    rows = closure_rows(category_repo)
+    cat = category_repo.get(2)
+    cat.parent = 5
+    with pytest.raises(RuntimeError):
+        with category_repo.transaction():
+            category_repo.update(cat)
+            category_repo.add(Category('6', 4))
+            raise RuntimeError
+    assert closure_rows(category_repo) == rows
+
+
+def test_hierarchy_filled_for_existing_records(category_repo):
+    rows = closure_rows(category_repo)
+    con = category_repo.pool.connection()
+    with con:
+        con.execute("DROP TABLE category_closure")
+    repo = SQLiteRepository(db_file=category_repo.db_file, cls=Category)
+    assert closure_rows(repo) == rows
+
+
+def test_subtree_of_other_table(category_repo):
+    expense_repo = SQLiteRepository(db_file=category_repo.db_file, cls=Expense)
+    expenses = [Expense(amount=i, category=i) for i in range(1, 6)]
+    expense_repo.add_many(expenses)
+
+    assert expense_repo.get_all({'category': category_repo.subtree(2)}) == [
+        expenses[1], expenses[3]]
+    assert expense_repo.aggregate({'category': category_repo.subtree(1)},
+                                  sum='amount') == {'sum': 10}
+
+
+def test_no_hierarchy(repo):
+    with pytest.raises(ValueError):
+        repo.get_descendants(1)
+
+
+def test_get_page(repo, custom_class):
+    objs = [custom_class(field_int=i % 4) for i in range(10)]
+    repo.add_many(objs)
+    ordered = sorted(objs, key=lambda obj: (obj.field_int, obj.pk), reverse=True)
+
+    page = repo.get_page('field_int', 4, descending=True)
+    assert page == ordered[:4]
+    page = repo.get_page('field_int', 4, (page[-1].field_int, page[-1].pk),
+                         descending=True)
+    assert page == ordered[4:8]
+
+    assert repo.get_page('field_int', 3, (1, objs[5].pk)) == [objs[9], objs[2], objs[6]]
+    assert repo.get_page('field_int', 5, (1, 0), where={'field_int': lt(3)}) == [
+        objs[1], objs[5], objs[9], objs[2], objs[6]]
+
+
+def test_get_page_uses_index(tmp_path):
+    repo = SQLiteRepository(db_file=str(tmp_path / "page.db"), cls=Expense)
+    repo.add_many([Expense(i, 1, expense_date=datetime(2023, 1, 1 + i % 3))
+                   for i in range(9)])
+    page = repo.get_page('expense_date', 4, (datetime(2023, 1, 2), 5), descending=True)
+    assert [exp.pk for exp in page] == [2, 7, 4, 1]
+
+    plan = repo.pool.connection().execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM expense WHERE expense_date <= ? "
+        "AND (expense_date < ? OR ROWID < ?) ORDER BY expense_date DESC, ROWID DESC",
+        ("", "", 0)).fetchall()
+    assert "expense_expense_date_idx" in plan[0][-1]
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)
+
+
+def test_performance_profile(tmp_path):
+    repo_gen = repository_factory(SQLiteRepository, db_file=str(tmp_path / "wal.db"),
+                                  profile=PerformanceProfile())
+    expense_repo  = repo_gen(Expense)
+    category_repo = repo_gen(Category)
+    assert expense_repo.pool is category_repo.pool
+    assert expense_repo.pool.profile == PerformanceProfile()
+
+    pk = expense_repo.add(Expense(100, 1))
+    assert expense_repo.get(pk).amount == 100
+    assert (tmp_path / "wal.db-wal").exists()
+    expense_repo.pool.close()
+
+
+def test_close_inside_transaction(tmp_path):
+    db_file       = str(tmp_path / "close.db")
+    expense_repo  = SQLiteRepository(db_file=db_file, cls=Expense)
+    category_repo = SQLiteRepository(db_file=db_file, cls=Category)
+
+    # Closing a repository leaves the transaction of the others intact:
+    with pytest.raises(RuntimeError):
+        with expense_repo.transaction():
+            expense_repo.add(Expense(100, 1))
+            with SQLiteRepository(db_file=db_file, cls=Category) as repo:
+                repo.add(Category("food"))
+            expense_repo.add(Expense(200, 1))
+            raise RuntimeError
+
+    assert expense_repo.get_all() == []
+    assert category_repo.get_all() == []
+
+    # A given pool is left to it's owner:
+    repo = SQLiteRepository(db_file=db_file, cls=Expense, pool=expense_repo.pool)
+    con  = expense_repo.pool.connection()
+    repo.close()
+    assert expense_repo.pool.connection() is con
+
+    expense_repo.close()
+    category_repo.close()
+
+
+def test_query_templates_reused(repo, custom_class):
+    for value in range(3):
+        repo.add(custom_class(field_int=value))
+    for value in range(3):
+        assert [obj.field_int for obj in repo.get_all({'field_int': value})] == [value]
+    assert repo.templates.hits == 2
+    assert repo.templates.misses == 1
+
+
+@dataclass
+class Nullable:
+    value : int | None = None
+    pk    : int        = 0
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def nullable_repo(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryRepository(cls=Nullable)
+        return
+    repo = SQLiteRepository(db_file=str(tmp_path / "nullable.db"), cls=Nullable)
+    yield repo
+    repo.close()
+
+
+def test_none_comparison_parity(nullable_repo):
+    nullable_repo.add_many([Nullable(1), Nullable(None), Nullable(3)])
+
+    # Both backends select the same rows by (in)equality with None:
+    assert [obj.value for obj in nullable_repo.get_all({'value': None})] == [None]
+    assert [obj.value for obj in nullable_repo.get_all({'value': ne(None)})] == [1, 3]
+    assert [obj.value for obj in nullable_repo.get_all({'value': gt(1)})] == [3]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def expense_repo(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryRepository(cls=Expense)
+        return
+    repo = SQLiteRepository(db_file=str(tmp_path / "dates.db"), cls=Expense)
+    yield repo
+    repo.close()
+
+
+def test_date_bounds_parity(expense_repo):
+    expense_repo.add_many([Expense(i, 1, expense_date=datetime(2023, 1, i, 12))
+                           for i in range(1, 5)])
+
+    # A date bound is the start of the day on both backends:
+    for cond, amounts in [(ge(date(2023, 1, 2)) & lt(date(2023, 1, 4)), [2, 3]),
+                          (between(date(2023, 1, 1), date(2023, 1, 3)), [1, 2]),
+                          (gt(date(2023, 1, 4)), [4]),
+                          (in_([date(2023, 1, 1)]), [])]:
+        exps = expense_repo.get_all({'expense_date': cond}, order_by='amount')
+        assert [exp.amount for exp in exps] == amounts
+
+
+def test_date_aggregate_parity(expense_repo):
+    days = [datetime(2023, 1, 1), datetime(2023, 1, 3), datetime(2023, 1, 3)]
+    expense_repo.add_many([Expense(i, 1, expense_date=day)
+                           for i, day in enumerate(days, 1)])
+
+    # Date extremes and date groups are datetimes on both backends:
+    assert expense_repo.aggregate(min='expense_date', max='expense_date') \
+        == {'min': days[0], 'max': days[-1]}
+    assert expense_repo.aggregate(group_by='expense_date', sum='amount') \
+        == {days[0]: {'sum': 1}, days[1]: {'sum': 5}}
@@ -0,0 +1,94 @@
+"""
+Тесты для исполнителя фоновых задач
+"""
+
+import threading
+
+import pytest
+
+from bookkeeper.view.background import BackgroundRunner
+
+
+@pytest.fixture
+def runner(qtbot):
+    return BackgroundRunner()
+
+
+def test_done_in_main_thread(runner):
+    threads = []
+
+    def task(_):
+        threads.append(threading.current_thread())
+        return 42
+
+    results = []
+    runner.run(task,
+               lambda res: results.append((res, threading.current_thread())),
+               lambda exc: None)
+    assert runner.busy() is True
+    runner.wait()
+
+    # The task is run in the background, it's result is handled in the main thread:
+    assert runner.busy() is False
+    assert threads[0] is not threading.main_thread()
+    assert results == [(42, threading.main_thread())]
+
+
+def test_error(runner):
+    def task(_):
+        raise ValueError("test")
+
+    errors = []
+    runner.run(task, lambda res: None, errors.append)
+    runner.wait()
+
+    assert len(errors) == 1
+    assert isinstance(errors[0], ValueError)
+    assert runner.workers == {}
+
+
+def test_progress(runner):
+    def task(progress):
+        for done in range(1, 4):
+            progress(done, 3)
+
+    reports = []
+    runner.run(task, lambda res: None, lambda exc: None,
+               lambda done, total: reports.append((done, total)))
+    runner.wait()
+
+    assert reports == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_order(runner):
+    results = []
+    for i in range(10):
+        runner.run(lambda _, i=i: i, results.append, lambda exc: None)
+    runner.wait()
+
+    assert results == list(range(10))
+
+
+def test_wait_for_chained(runner):
+    results = []
+
+    # A task started by a handler is waited for as well:
+    runner.run(lambda _: 1,
+               lambda res: runner.run(lambda _: res + 1, results.append,
+                                      lambda exc: None),
+               lambda exc: None)
+    runner.wait()
+
+    assert results == [2]
+
+
+def test_single_thread(runner):
+    threads = set()
+    for _ in range(3):
+        runner.run(lambda _: threads.add(threading.current_thread()),
+                   lambda res: None, lambda exc: None)
+        runner.wait()
+
+    # Tasks reuse the thread and so it's database connection:
+    assert runner.pool.expiryTimeout() < 0
+    assert len(threads) == 1
@@ -3,67 +3,175 @@
 """
 
 from pytestqt.qt_compat import qt_api
+from PySide6.QtCore import Qt
 
-from bookkeeper.view.expense_table import ExpenseTableWidget, LabeledExpenseTable
+from bookkeeper.view.expense_table import ExpenseTableModel, LabeledExpenseTable
 
 from bookkeeper.models.expense import Expense
 
-test_data = [["1_1", "1_2", "1_3", "1_4", 1],
-             ["2_1", "2_2", "2_3", "2_4", 2],]
-
 # Define dummy handlers:
 expense_modify_handler = lambda pk, attr, new_val: None
 category_pk_to_name    = lambda pk: "1_3"
 exp_delete_handler     = lambda exp_pks: None
 
 
-def test_create_widget(qtbot):
-    # Create widget:
-    widget = ExpenseTableWidget(expense_modify_handler)
-    qtbot.addWidget(widget)
+def test_create_model():
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
 
     # Check it's constructor:
-    assert widget.expense_modify_handler == expense_modify_handler
-
+    assert model.expense_modify_handler == expense_modify_handler
+    assert model.rowCount() == 0
+    assert model.columnCount() == 4
+    assert model.canFetchMore() is False
 
-def test_add_data(qtbot):
-    # Create widget with data:
-    widget = ExpenseTableWidget(expense_modify_handler)
-    qtbot.addWidget(widget)
-    widget.add_data(test_data)
 
-    # Check it's intrnal representation:
-    assert widget.data == test_data
+def test_model_data():
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_expenses([Expense(100, 1, expense_date="12.12.2012 15:30",
+                                comment="test", pk=1)])
 
-    # Check visualization:
-    for i, row in enumerate(test_data):
-        for j, x in enumerate(row[:-1]):
-            assert widget.item(i, j).text() == test_data[i][j]
+    # Display role is capitalized, edit role is raw:
+    assert model.data(model.index(0, 0)) == "12.12.2012 15:30"
+    assert model.data(model.index(0, 1)) == "100"
+    assert model.data(model.index(0, 2)) == "1_3"
+    assert model.data(model.index(0, 3)) == "Test"
+    assert model.data(model.index(0, 3), Qt.EditRole) == "test"
+    assert model.headerData(0, Qt.Horizontal) == "Дата"
+    assert model.flags(model.index(0, 0)) & Qt.ItemIsEditable
 
 
-def test_cell_changed(qtbot):
+def test_model_set_data():
     # Define a modify handler to be called on cell edit:
     def expense_modify_handler(pk, attr, new_val):
-        expense_modify_handler.was_called = True
+        expense_modify_handler.args = (pk, attr, new_val)
 
-        assert pk      == test_data[0][4]
-        assert new_val == test_data[0][0]
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_expenses([Expense(100, 1, pk=7)])
 
-    expense_modify_handler.was_called = False
+    assert model.setData(model.index(0, 1), 150) is True
+    assert expense_modify_handler.args == (7, "amount", "150")
 
-    # Create widget and fill it with data:
-    widget = ExpenseTableWidget(expense_modify_handler)
-    qtbot.addWidget(widget)
-    widget.add_data(test_data)
+    # The row is left for the presenter to update:
+    assert model.expenses[0].amount == 100
+
+
+def test_fetch_more():
+    exps = [Expense(i, 1, pk=i) for i in range(250, 0, -1)]
+    calls = []
+
+    def fetcher(after, count):
+        calls.append(None if after is None else after.pk)
+        start = 0 if after is None else 251 - after.pk
+        return exps[start:start + count]
+
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_source(fetcher)
+    assert model.rowCount() == 0
+
+    # Pages are fetched after the last loaded expense:
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.expenses == exps
+    assert calls == [None, 151, 51]
+    assert model.rows[1] == 249
+
+
+def test_fetch_after_fetched_copy():
+    exps = [Expense(i, 1, pk=i) for i in range(1, 201)]
+    calls = []
+
+    def fetcher(after, count):
+        calls.append(after)
+        return exps[:count] if after is None else []
+
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_source(fetcher)
+    model.fetchMore()
+
+    # The next page continues from the expense as it was fetched:
+    model.update_expense(Expense(5, 1, pk=100))
+    model.fetchMore()
+    assert calls[1] == exps[99]
+    assert calls[1] is not exps[99]
+    assert model.canFetchMore() is False
+
+
+def test_add_goes_first():
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_source(lambda after, count: [Expense(i, 1, pk=i) for i in range(count)])
+    model.fetchMore()
+
+    # The new expense is the most recent one:
+    model.add_expense(Expense(1, 1, pk=1000))
+    assert model.rowCount() == model.PAGE_SIZE + 1
+    assert model.expenses[0].pk == 1000
+    assert model.rows[1000] == 0
+    assert model.rows[0] == 1
+    assert model.canFetchMore() is True
+
+
+def test_add_before_first_page():
+    exps = [Expense(1, 1, pk=1)]
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_source(lambda after, count: [] if after else exps)
+
+    # The expense is left for the first page:
+    model.add_expense(exps[0])
+    assert model.rowCount() == 0
+    model.fetchMore()
+    assert model.expenses == exps
 
-    # Check the edit without selection:
-    widget.cellChanged.emit(0, 0)
-    assert expense_modify_handler.was_called is False
 
-    # Check the edit after selection:
-    widget.cellDoubleClicked.emit(0, 0)
-    widget.cellChanged.emit(0, 0)
-    assert expense_modify_handler.was_called is True
+def test_fetch_with_loader():
+    exps = [Expense(1, 1, pk=1)]
+    loads = []
+
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_loader(lambda *args: loads.append(args))
+    model.set_source(lambda after, count: [] if after else exps)
+
+    # No page is requested twice while loading:
+    model.fetchMore()
+    assert model.canFetchMore() is False
+    model.fetchMore()
+    assert len(loads) == 1
+
+    load, on_done, _ = loads[0]
+    on_done(load())
+    assert model.expenses == exps
+    assert model.canFetchMore() is False
+
+
+def test_stale_page_dropped():
+    loads = []
+
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_loader(lambda *args: loads.append(args))
+    model.set_source(lambda after, count: [Expense(1, 1, pk=1)])
+    model.fetchMore()
+
+    # The page of the replaced source is not shown:
+    model.set_source(lambda after, count: [])
+    load, on_done, _ = loads[0]
+    on_done(load())
+    assert model.rowCount() == 0
+    assert model.canFetchMore() is True
+
+
+def test_failed_fetch():
+    loads = []
+
+    model = ExpenseTableModel(category_pk_to_name, expense_modify_handler)
+    model.set_loader(lambda *args: loads.append(args))
+    model.set_source(lambda after, count: [Expense(1, 1, pk=1)])
+    model.fetchMore()
+
+    # No pages are requested after a failure until the source is set again:
+    _, _, on_error = loads[0]
+    on_error(RuntimeError("test"))
+    assert model.canFetchMore() is False
+    model.set_source(lambda after, count: [])
+    assert model.canFetchMore() is True
 
 
 def test_create_group(qtbot):
@@ -93,12 +201,41 @@ def test_set_expenses(qtbot):
     # Assert that internal data is the same as input:
     assert widget.expenses == exps
 
-    for exp, w_data in zip(exps, widget.data):
-        assert str(exp.expense_date)             == w_data[0]
-        assert str(exp.amount)                   == w_data[1]
-        assert category_pk_to_name(exp.category) == w_data[2]
-        assert str(exp.comment)                  == w_data[3]
-        assert str(exp.pk)                       == w_data[4]
+    model = widget.model
+    for row, exp in enumerate(exps):
+        assert str(exp.expense_date)             == model.data(model.index(row, 0))
+        assert str(exp.amount)                   == model.data(model.index(row, 1))
+        assert category_pk_to_name(exp.category) == model.data(model.index(row, 2))
+        assert exp.comment.capitalize()          == model.data(model.index(row, 3))
+
+
+def test_incremental_updates(qtbot):
+    widget = LabeledExpenseTable(category_pk_to_name,
+                                 expense_modify_handler,
+                                 exp_delete_handler)
+    qtbot.addWidget(widget)
+
+    exps = [Expense(100 * i, i, pk=i) for i in range(1, 4)]
+    widget.set_expenses(list(exps))
+
+    # Add an expense before the first one:
+    new_exp = Expense(400, 4, comment="new", pk=4)
+    widget.add_expense(new_exp)
+    assert widget.expenses[0] is new_exp
+    assert widget.model.data(widget.model.index(0, 3)) == "New"
+
+    # Update a single row:
+    upd_exp = Expense(250, 2, pk=2)
+    widget.update_expense(upd_exp)
+    assert widget.expenses[2] is upd_exp
+    assert widget.model.data(widget.model.index(2, 1)) == "250"
+
+    # Remove rows, the rest are shifted up:
+    widget.remove_expenses({1, 3})
+    assert [exp.pk for exp in widget.expenses] == [4, 2]
+    assert widget.model.rows == {4: 0, 2: 1}
+    assert widget.model.data(widget.model.index(1, 1)) == "250"
+    assert widget.model.rowCount() == 2
 
 
 def test_delete_expenses(qtbot):
@@ -120,11 +257,11 @@ def test_delete_expenses(qtbot):
             Expense(300, 3, pk=3), Expense(400, 4, pk=4),]
     widget.set_expenses(exps)
 
-    # Select the initial selection:
-    widget.table.setRangeSelected(
-        qt_api.QtWidgets.QTableWidgetSelectionRange(1, 1, 2, 2), True)
-    widget.table.setRangeSelected(
-        qt_api.QtWidgets.QTableWidgetSelectionRange(1, 3, 3, 4), True)
+    # Select the cells of the second and the third rows:
+    selection = widget.table.selectionModel()
+    model     = widget.model
+    selection.select(model.index(1, 1), qt_api.QtCore.QItemSelectionModel.Select)
+    selection.select(model.index(2, 3), qt_api.QtCore.QItemSelectionModel.Select)
 
     # Perform the mouse-click:
     qtbot.mouseClick(
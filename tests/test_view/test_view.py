@@ -5,7 +5,7 @@
 from pytestqt.qt_compat import qt_api
 
 from bookkeeper.view.view       import View, try_for_widget
-from bookkeeper.models.category import Category
+from bookkeeper.models.category import Category, CategoryIndex
 from bookkeeper.models.expense  import Expense
 from bookkeeper.models.budget   import Budget
 
@@ -43,6 +43,19 @@ def test_category_pk_to_name():
     assert view.category_pk_to_name(3) == ""
 
 
+def test_shared_category_index():
+    view = View()
+
+    # The index of the presenter is used without rebuilding:
+    cats  = [Category("cat1", pk=1)]
+    index = CategoryIndex(cats)
+    view.set_categories(cats, index)
+    assert view.category_index is index
+
+    index.add(Category("cat2", pk=2))
+    assert view.category_pk_to_name(2) == "cat2"
+
+
 def test_set_expenses():
     # Create view with expenses set:
     view = View()
@@ -56,6 +69,99 @@ def test_set_expenses():
     assert view.expense_table.expenses == exps
 
 
+def test_expense_notifications():
+    view = View()
+
+    exps = [Expense(100, 1, pk=1), Expense(200, 2, pk=2)]
+    view.set_expenses(exps)
+
+    new_exp = Expense(300, 1, pk=3)
+    view.expense_added(new_exp)
+    upd_exp = Expense(150, 1, pk=1)
+    view.expense_updated(upd_exp)
+    view.expenses_removed({2})
+
+    assert view.expenses == [new_exp, upd_exp]
+    assert view.expense_table.expenses == [new_exp, upd_exp]
+
+    # The list passed to set_expenses is not changed:
+    assert len(exps) == 2
+
+
+def test_set_expense_source():
+    view = View()
+
+    exps = [Expense(100, 1, pk=1), Expense(200, 2, pk=2)]
+    view.set_expense_source(lambda after, count: [] if after else exps)
+    view.expense_table.model.fetchMore()
+    view.wait_background()
+
+    assert view.expenses == exps
+    assert view.expense_table.model.canFetchMore() is False
+
+
+def test_failed_expense_fetch(monkeypatch):
+    view = View()
+
+    messages = []
+    monkeypatch.setattr(qt_api.QtWidgets.QMessageBox, "critical",
+                        lambda *args: messages.append(args[2]))
+
+    def fetch(after, count):
+        raise ValueError("Ошибка")
+
+    # The error is shown once, the failing query is not repeated:
+    view.set_expense_source(fetch)
+    view.expense_table.model.fetchMore()
+    view.wait_background()
+
+    assert messages == ["Ошибка"]
+    assert view.expense_table.model.canFetchMore() is False
+
+
+def test_run_in_background():
+    view = View()
+
+    results = []
+    view.run_in_background(lambda progress: 1 + 1, results.append)
+    view.wait_background()
+
+    assert results == [2]
+
+
+def test_run_in_background_with_progress():
+    view = View()
+
+    def task(progress):
+        for done in range(3):
+            progress(done + 1, 3)
+        return 'done'
+
+    results = []
+    view.run_in_background(task, results.append, title="Задача")
+    view.wait_background()
+
+    assert results == ['done']
+
+
+def test_run_in_background_error(monkeypatch):
+    view = View()
+
+    messages = []
+    monkeypatch.setattr(qt_api.QtWidgets.QMessageBox, "critical",
+                        lambda *args: messages.append(args[2]))
+
+    def task(_):
+        raise ValueError("Ошибка")
+
+    results = []
+    view.run_in_background(task, results.append)
+    view.wait_background()
+
+    assert results  == []
+    assert messages == ["Ошибка"]
+
+
 def test_set_budgets():
     # Create view with budget set:
     view = View()